@@ -20,7 +20,8 @@ a = Analysis(
     hiddenimports=[],
     hookspath=[],
     runtime_hooks=[],
-    excludes=[],
+    # openpyxl is only imported to rebuild the effect cache, pandas isn't needed
+    excludes=['pandas', 'numpy'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
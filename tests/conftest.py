@@ -0,0 +1,39 @@
+import logging
+import os
+import random
+import sys
+
+import pytest
+
+# Run from anywhere: the tool package lives at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture(scope="session")
+def catalog():
+    from tool.obsm_calculator import sources
+    from tool.obsm_catalog import shared_catalog
+    return shared_catalog(sources)
+
+
+@pytest.fixture(autouse=True)
+def quiet_logs(caplog):
+    # Costing partial spells without skills warns on every call
+    caplog.set_level(logging.ERROR)
+
+
+@pytest.fixture(scope="session")
+def random_spells(catalog):
+    """
+    A fixed mix of spells with 1-4 effects over the whole catalog
+    """
+    from tool.obsm_calculator import Effect, Spell
+    rng = random.Random(7)
+    recs = list(catalog)
+    spells = []
+    for _ in range(300):
+        spells.append(Spell(*[Effect(data=rng.choice(recs), mag=rng.randint(1, 100), dur=rng.randint(0, 120),
+                                     area=rng.choice([0, 0, 5, 20, 50]),
+                                     range=rng.choice(["Self", "Touch", "Target"]))
+                              for _ in range(rng.randint(1, 4))]))
+    return spells
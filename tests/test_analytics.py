@@ -0,0 +1,65 @@
+import statistics
+import pytest
+from tool.obsm_analytics import SpellTable
+from tool.obsm_calculator import calc_casting_cost, skill_reqs
+
+skills = {"Alteration": 30, "Conjuration": 45, "Destruction": 50, "Illusion": 20,
+          "Mysticism": 75, "Restoration": 100}
+
+
+@pytest.fixture(scope="module")
+def table(catalog, random_spells):
+    return SpellTable.from_spells(random_spells, catalog, names=[f"s{i}" for i in range(len(random_spells))])
+
+
+def test_columns_match_spell(table, random_spells):
+    assert len(table) == len(random_spells)
+    assert table.total_cost.tolist() == [s.total_cost for s in random_spells]
+    assert table.gold_cost.tolist() == [s.gold_cost for s in random_spells]
+    assert table.spell_schools().tolist() == [s.dominant_school for s in random_spells]
+    assert table.casting_cost(skills).tolist() == [calc_casting_cost(s.school_cents, skills)
+                                                   for s in random_spells]
+
+
+def test_to_spells_round_trip(table, random_spells):
+    for a, b in zip(random_spells, table.to_spells()):
+        assert b.total_cents == a.total_cents
+        assert [(e.name, e.mag, e.dur, e.area, e.range) for e in b.effects] == \
+               [(e.name, e.mag, e.dur, e.area, e.range) for e in a.effects]
+
+
+def test_where_matches_filter(table, random_spells):
+    sub = table.where(school="Destruction", max_cost=1000, effect_school="Restoration")
+    expected = [f"s{i}" for i, s in enumerate(random_spells)
+                if s.dominant_school == "Destruction" and s.total_cost <= 1000
+                and any(e.school == "Restoration" for e in s.effects)]
+    assert expected and sub.names.tolist() == expected
+    assert sub.total_cost.tolist() == [random_spells[int(n[1:])].total_cost for n in expected]
+
+
+def test_group_by_school(table, random_spells):
+    groups = table.group_by("school")
+    for school, stats in groups.items():
+        costs = [s.total_cost for s in random_spells if s.dominant_school == school]
+        assert stats["count"] == len(costs)
+        assert stats["total"] == pytest.approx(sum(costs))
+        assert stats["median"] == pytest.approx(statistics.median(costs))
+        assert (stats["min"], stats["max"]) == (min(costs), max(costs))
+    assert sum(stats["count"] for stats in groups.values()) == len(random_spells)
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_top_matches_full_sort(table, descending):
+    for k in (0, 1, 10, len(table) + 5):
+        assert table.top(k, descending=descending).tolist() == \
+               table.order(descending=descending)[:k].tolist()
+
+
+def test_critical_effects(table, random_spells):
+    level = 50
+    limit = skill_reqs[level]
+    rows = table.critical_effects(level).tolist()
+    expected = [s.total_cost >= limit and s.total_cost - e.eff_cost < limit
+                for s in random_spells for e in s.effects]
+    assert rows == expected
+    assert any(rows)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from tool.obsm_batch import price_batch, price_spells
+from tool.obsm_calculator import calc_casting_cost
+
+skills = {"Alteration": 30, "Conjuration": 45, "Destruction": 50, "Illusion": 20,
+          "Mysticism": 75, "Restoration": 100}
+
+
+def test_price_spells_matches_spell(catalog, random_spells):
+    prices = price_spells(catalog, random_spells, skills)
+    assert prices.total_cost.tolist() == [s.total_cost for s in random_spells]
+    assert prices.gold_cost.tolist() == [s.gold_cost for s in random_spells]
+    assert prices.school.tolist() == [s.dominant_school for s in random_spells]
+    assert prices.skill_required.tolist() == [-1 if s.skill_required is None else s.skill_required
+                                              for s in random_spells]
+    assert prices.casting_cost.tolist() == [calc_casting_cost(s.school_cents, skills) for s in random_spells]
+    effs = [eff for s in random_spells for eff in s.effects]
+    assert prices.eff_cost.tolist() == [eff.eff_cost for eff in effs]
+
+
+def test_missing_skill_gives_no_casting_cost(catalog, random_spells):
+    prices = price_spells(catalog, random_spells, {"Destruction": 50})
+    for spell, cost in zip(random_spells, prices.casting_cost.tolist()):
+        if set(spell.school_cents) <= {"Destruction"}:
+            assert cost == calc_casting_cost(spell.school_cents, {"Destruction": 50})
+        else:
+            assert cost == 0
+
+
+def test_unknown_effect_costs_nothing(catalog):
+    prices = price_batch(catalog, ["Fire Damage", "Nope"], [10, 10], [1, 1], [0, 0], ["Self", "Self"],
+                         offsets=[0])
+    alone = price_batch(catalog, ["Fire Damage"], [10], [1], [0], ["Self"])
+    assert prices.total_cost.tolist() == alone.total_cost.tolist()
+    assert prices.eff_cost[1] == 0
+
+
+def test_bad_offsets(catalog):
+    with pytest.raises(ValueError):
+        price_batch(catalog, ["Fire Damage"] * 2, [1, 1], [1, 1], [0, 0], ["Self"] * 2, offsets=[1])
+
+
+def test_per_spell_skill_levels(catalog, random_spells):
+    levels = np.linspace(0, 100, len(random_spells))
+    prices = price_spells(catalog, random_spells, {school: levels for school in skills})
+    assert prices.casting_cost.tolist() == [calc_casting_cost(s.school_cents, dict.fromkeys(skills, level))
+                                            for s, level in zip(random_spells, levels.tolist())]
@@ -0,0 +1,26 @@
+import random
+import pytest
+from tool.obsm_calculator import SpellMaker, group_effects
+
+
+def _by_lookup(spell_maker, labels, mode):
+    # Grouping one label at a time, as the effect list did before the catalog kept groupings
+    lookup = spell_maker.get_effect_school if mode == "By School" else spell_maker.get_effect_function
+    grouped = {}
+    for label in labels:
+        grouped.setdefault(lookup(label) or "Unknown", []).append(label)
+    return {key: sorted(members) for key, members in sorted(grouped.items())}
+
+
+@pytest.mark.parametrize("mode", ["By School", "By Function"])
+def test_group_effects_matches_lookup(mode):
+    sm = SpellMaker()
+    names = sm.catalog.names
+    subset = random.Random(3).sample(names, 40)
+    for labels in (names, subset, subset + ["Not An Effect"], []):
+        assert group_effects(sm, labels, mode) == _by_lookup(sm, labels, mode)
+
+
+def test_group_effects_alphabetical():
+    sm = SpellMaker()
+    assert group_effects(sm, ["b", "a"], "Alphabetical") == {"A–Z": ["a", "b"]}
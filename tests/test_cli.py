@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+
+from tool import obsm_profile
+from tool.obsm_calculator import Effect, Spell, calc_casting_cost
+from tool.obsm_cli import (BadLine, group_spells, main, output_fields, price_chunk, price_stream, read_rows,
+                           write_results)
+
+
+def test_bad_row_keeps_its_spell_id(catalog):
+    rows = [{"spell": "s1", "effect": "Nope"},
+            {"spell": "s2", "effect": "Fire Damage", "mag": 10, "dur": 1, "range": "Target"}]
+    bad, good = price_chunk(list(group_spells(rows)), catalog=catalog)
+    assert bad["spell"] == "s1"
+    assert bad["error"] == "unknown effect 'Nope'"
+    assert bad["total_cost"] is None
+    assert list(bad) == output_fields
+    assert good["spell"] == "s2" and good["error"] is None
+
+
+def test_prices_match_spell(catalog):
+    lines = ["spell,effect,details,mag,dur,area,range,Destruction,Restoration",
+             "a,Fire Damage,,30,2,10,Target,50,40",
+             "a,Fortify Skill,Blade,5,60,0,Self,50,40",
+             "b,Restore Health,,20,5,0,Touch,,"]
+    results = price_chunk(list(group_spells(read_rows(lines, "csv"))), catalog=catalog)
+    a = Spell(Effect(data=catalog.get("Fire Damage"), mag=30, dur=2, area=10, range="Target"),
+              Effect(data=catalog.get("Fortify Skill"), details="Blade", mag=5, dur=60, area=0, range="Self"))
+    assert results[0]["total_cost"] == a.total_cost
+    assert results[0]["school"] == a.dominant_school
+    assert results[0]["casting_cost"] == calc_casting_cost(a.school_cents, {"Destruction": 50, "Restoration": 40})
+    # No skills given for b
+    assert results[1]["spell"] == "b" and results[1]["casting_cost"] is None
+
+
+def test_write_results_counts_errors(catalog):
+    results = price_chunk([("x", [{"effect": "Nope"}], {})], catalog=catalog)
+    out = io.StringIO()
+    assert write_results(results, out, "jsonl") == 1
+    assert json.loads(out.getvalue())["spell"] == "x"
+
+
+def test_profile_flag_does_not_take_the_input(tmp_path, monkeypatch):
+    enabled = []
+    monkeypatch.setattr(obsm_profile, "enable", enabled.append)
+    src = tmp_path / "spells.jsonl"
+    src.write_text('{"spell": "a", "effect": "Fire Damage", "mag": 10, "dur": 1}\n')
+    out = tmp_path / "out.jsonl"
+    assert main(["--profile", str(src), "-o", str(out)]) == 0
+    assert json.loads(out.read_text())["spell"] == "a"
+    assert main([str(src), "--profile=report.json", "-o", str(out)]) == 0
+    assert enabled == [None, "report.json"]
+
+
+def test_bad_lines_become_error_rows(catalog):
+    lines = ['{"spell": "a", "effect": "Fire Damage", "mag": 10, "dur": 1}\n',
+             '{"spell": "a", "effect": "Fire\n',
+             '\n',
+             '[1, 2]\n',
+             '{"spell": "b", "effect": "Frost Damage", "mag": 10, "dur": 1}\n']
+    results = list(price_chunk(list(group_spells(read_rows(lines, "jsonl"))), catalog=catalog))
+    assert [r["spell"] for r in results] == ["a", None, None, "b"]
+    assert [r.get("line") for r in results] == [None, 2, 4, None]
+    assert results[1]["error"].startswith("line 2: invalid JSON")
+    assert results[2]["error"] == "line 4: expected a JSON object, got list"
+    assert results[0]["error"] is None and results[3]["error"] is None
+    out = io.StringIO()
+    assert write_results(results, out, "csv") == 2
+    assert out.getvalue().splitlines()[0].split(",") == output_fields
+
+
+def test_bad_line_fails_a_spellbook_import(catalog):
+    from tool.obsm_spellbook import Spellbook
+    with Spellbook() as book:
+        with pytest.raises(ValueError, match="line 2"):
+            book.import_rows(read_rows(['{"spell": "a", "effect": "Fire Damage"}\n', "oops\n"], "jsonl"),
+                             catalog)
+        assert len(book) == 0
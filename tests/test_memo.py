@@ -0,0 +1,34 @@
+import pytest
+from tool import obsm_profile
+from tool.obsm_calculator import calc_eff_cost
+from tool.obsm_memo import Memo, memoize
+
+
+def test_memo_keeps_function_metadata():
+    assert calc_eff_cost.__name__ == "calc_eff_cost"
+    assert "Magnitude" in calc_eff_cost.__doc__
+    assert calc_eff_cost.__module__ == "tool.obsm_calculator"
+    assert calc_eff_cost.__wrapped__(10, 5, 1, 0, False) == calc_eff_cost(10, 5, 1, 0, False)
+
+
+def test_memo_evicts_least_recent():
+    @memoize(maxsize=2)
+    def square(x):
+        """Square a number"""
+        return x * x
+    assert square.__doc__ == "Square a number"
+    for x in (1, 2, 1, 3, 1):
+        assert square(x) == x * x
+    info = square.info()
+    assert (info.hits, info.misses, info.evictions, info.currsize) == (2, 3, 1, 2)
+
+
+def test_memo_rejects_empty_size():
+    with pytest.raises(ValueError):
+        Memo(abs, maxsize=0)
+
+
+def test_profile_report_lists_memos():
+    calc_eff_cost(10, 5, 1, 0, False)
+    line = next(line for line in obsm_profile.report().splitlines() if line.startswith("calc_eff_cost "))
+    assert line.split()[-1].endswith("/8192")
@@ -0,0 +1,81 @@
+from itertools import product
+import time
+
+import pytest
+
+from tool.obsm_calculator import Effect, Spell, calc_casting_cost, skill_reqs
+from tool.obsm_optimizer import optimize_spell
+
+schools = ["Alteration", "Conjuration", "Destruction", "Illusion", "Mysticism", "Restoration"]
+# Small sliders keep the brute force over every setting quick
+small_ranges = {"mag": (3, 10, 1), "dur": (1, 5, 1), "area": (0, 5, 5)}
+tiny_ranges = {"mag": (3, 6, 1), "dur": (1, 3, 1), "area": (0, 5, 5)}
+
+
+def _fits(spell, max_cost=None, max_gold=None, skill=None, skills=None, max_casting_cost=None):
+    if max_cost is not None and spell.total_cost > max_cost:
+        return False
+    if max_gold is not None and spell.gold_cost > max_gold:
+        return False
+    if skill is not None and not spell.total_cost < skill_reqs[skill]:
+        return False
+    if max_casting_cost is not None and calc_casting_cost(spell.school_cents, skills) > max_casting_cost:
+        return False
+    return True
+
+
+def _brute_force(catalog, names, weights, limits, ranges):
+    """
+    Best (score, -cost) over every slider setting of every effect, through Spell
+    """
+    options = []
+    for name in names:
+        rec = catalog.get(name)
+        settings = []
+        for mag, dur, area in product(*(range(lo, hi + 1, step) for lo, hi, step in ranges.values())):
+            eff = Effect(data=rec, mag=mag, dur=dur, area=area, range="Self")
+            score = weights.get("mag", 0) * eff.mag + weights.get("dur", 0) * dur + weights.get("area", 0) * area
+            settings.append((eff, score))
+        options.append(settings)
+    best = None
+    for combo in product(*options):
+        spell = Spell(*[eff for eff, _ in combo])
+        if _fits(spell, **limits):
+            key = (sum(score for _, score in combo), -spell.total_cost)
+            best = key if best is None or key > best else best
+    return best
+
+
+def _score(spell, weights):
+    return sum(weights.get("mag", 0) * eff.mag + weights.get("dur", 0) * eff.dur + weights.get("area", 0) * eff.area
+               for eff in spell.effects)
+
+
+@pytest.mark.parametrize("names, weights, limits, ranges", [
+    (["Fire Damage", "Shield"], {"mag": 1}, {"max_cost": 8}, small_ranges),
+    (["Fire Damage", "Shield"], {"mag": 1, "dur": 0.5}, {"skill": 25}, small_ranges),
+    (["Frost Damage", "Restore Health"], {"mag": 1, "dur": 1, "area": 0.2},
+     {"skills": dict.fromkeys(schools, 40), "max_casting_cost": 30}, small_ranges),
+    (["Fire Damage", "Drain Health", "Shield"], {"mag": 1, "dur": 0.3, "area": 0.1}, {"max_gold": 60}, tiny_ranges),
+])
+def test_optimize_matches_brute_force(catalog, names, weights, limits, ranges):
+    spell = optimize_spell(catalog, names, weights, ranges=ranges, **limits)
+    best = _brute_force(catalog, names, weights, limits, ranges)
+    assert spell is not None and best is not None
+    assert _fits(spell, **limits)
+    assert _score(spell, weights) == pytest.approx(best[0])
+    assert spell.total_cost == -best[1]
+
+
+def test_optimize_nothing_fits(catalog):
+    assert optimize_spell(catalog, ["Fire Damage", "Shield"], "mag", max_cost=0.5) is None
+
+
+def test_optimize_six_effects_is_interactive(catalog):
+    names = ["Fire Damage", "Frost Damage", "Shock Damage", "Drain Health", "Damage Health", "Absorb Health"]
+    start = time.perf_counter()
+    spell = optimize_spell(catalog, names, "mag", skill=50)
+    elapsed = time.perf_counter() - start
+    assert spell is not None and spell.skill_required <= 50
+    # Was several seconds with a per-effect bound
+    assert elapsed < 1.5
@@ -0,0 +1,78 @@
+import random
+import pytest
+from tool.obsm_catalog import EffectCatalog, EffectRecord
+from tool.obsm_search import SearchIndex, SearchSession, fuzzy_below
+
+
+@pytest.fixture(scope="module")
+def small():
+    rows = [("Shield", "Alteration", "Protection"),
+            ("Shield Wall", "Alteration", "Protection"),
+            ("Shield Of Ages", "Alteration", "Protection"),
+            ("Shield Bash", "Alteration", "Protection"),
+            ("Fire Shield", "Alteration", "Protection"),
+            ("Windshield", "Alteration", "Protection"),
+            ("Burden", "Alteration", "Shieldbreak"),
+            ("Frost Damage", "Destruction", "Damage"),
+            ("Paralyze", "Illusion", "Control")]
+    return SearchIndex(EffectCatalog([EffectRecord(name, school, 1.0, 1.0, function)
+                                      for name, school, function in rows]))
+
+
+@pytest.fixture(scope="module")
+def index(catalog):
+    return SearchIndex(catalog)
+
+
+def test_tiers_in_order(small):
+    # Whole name, name prefix, word prefix, substring, then school/function
+    exact = small.matches("shield")
+    names = small.names
+    assert {names[i]: tier for i, tier in exact.items()} == \
+           {"Shield": 0, "Shield Wall": 1, "Shield Of Ages": 1, "Shield Bash": 1, "Fire Shield": 2,
+            "Windshield": 3, "Burden": 4}
+    assert small.search("shield")[0] == "Shield"
+    assert small.search("shield")[-3:] == ["Fire Shield", "Windshield", "Burden"]
+
+
+def test_ties_go_to_shorter_then_alphabetical(small):
+    assert small.search("shield ")[1:4] == ["Shield Bash", "Shield Wall", "Shield Of Ages"]
+    assert small.rank(dict.fromkeys(range(len(small)), 3)) == \
+           sorted(small.names, key=lambda n: (len(n), n.lower()))
+
+
+def test_typos_match_fuzzily(small, index):
+    assert small.search("paralize") == ["Paralyze"]
+    assert small.search("sheild wal")[0] == "Shield Wall"
+    found = index.search("fortfy skil")
+    assert found and found[0].startswith("Fortify Skill")
+
+
+def test_empty_query_matches_nothing(index):
+    assert index.search("") == []
+    assert index.search("  ", limit=5) == []
+    assert SearchSession(index).update("") == []
+
+
+def test_limit_keeps_the_best(index):
+    for query in ("fort", "damage", "re", "shld"):
+        assert index.search(query, limit=5) == index.search(query)[:5]
+
+
+@pytest.mark.parametrize("limit", [None, 5])
+def test_session_matches_fresh_search(index, limit):
+    queries = ["fortify skill", "restore fatigue", "shield", "fire dmg", "paralyze"]
+    queries += random.Random(5).sample(index.names, 10)
+    for query in queries:
+        session = SearchSession(index)
+        for n in range(len(query) + 1):
+            typed = query[:n]
+            assert session.update(typed, limit) == index.search(typed, limit), typed
+        # Deleting back to a shorter query starts over rather than narrowing
+        assert session.update(query[:2], limit) == index.search(query[:2], limit)
+
+
+def test_fuzzy_only_when_few_exact(index):
+    exact = index.matches("a")
+    assert len(exact) >= fuzzy_below
+    assert index.search("a") == index.rank(exact)
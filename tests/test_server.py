@@ -0,0 +1,77 @@
+import asyncio
+import json
+import time
+import pytest
+from tool import obsm_server
+from tool.obsm_calculator import Effect, Spell
+from tool.obsm_server import PricingServer
+
+
+async def _exchange(server, raw):
+    """Send raw request bytes and return (status, payload) of the response"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    writer.write(raw)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        key, _, value = line.decode().partition(":")
+        headers[key.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+    writer.close()
+    return status, payload
+
+
+def _post(path, data):
+    body = json.dumps(data).encode()
+    return (f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n").encode() + body
+
+
+def _run(catalog, *requests):
+    async def main():
+        server = PricingServer(catalog)
+        await server.start(port=0)
+        try:
+            return [await _exchange(server, raw) for raw in requests]
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1.5"])
+def test_bad_content_length_is_400(catalog, length):
+    raw = f"POST /price HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode()
+    [(status, payload)] = _run(catalog, raw)
+    assert status == 400
+    assert "Content-Length" in payload["error"]
+
+
+def test_price_matches_spell(catalog):
+    effects = [{"name": "Fire Damage", "mag": 20, "dur": 5, "area": 10, "range": "Target"}]
+    [(status, payload)] = _run(catalog, _post("/price", {"effects": effects}))
+    spell = Spell(Effect(data=catalog.get("Fire Damage"), mag=20, dur=5, area=10, range="Target"))
+    assert status == 200
+    assert payload["result"]["total_cost"] == spell.total_cost
+
+
+def test_fit_runs_off_the_loop(catalog):
+    [(status, payload)] = _run(catalog, _post("/fit", {"effects": ["Fire Damage"], "max_cost": 50}))
+    assert status == 200
+    assert 0 < payload["result"]["total_cost"] <= 50
+
+
+def test_fit_too_many_effects(catalog):
+    effects = ["Fire Damage"] * (obsm_server.max_fit_effects + 1)
+    [(status, _)] = _run(catalog, _post("/fit", {"effects": effects}))
+    assert status == 400
+
+
+def test_fit_timeout(catalog, monkeypatch):
+    def slow(*args, **kwargs):
+        time.sleep(0.5)
+    monkeypatch.setattr(obsm_server, "optimize_spell", slow)
+    monkeypatch.setattr(obsm_server, "fit_timeout", 0.05)
+    [(status, payload)] = _run(catalog, _post("/fit", {"effects": ["Fire Damage"]}))
+    assert status == 503
+    assert "longer than" in payload["error"]
@@ -0,0 +1,70 @@
+import pytest
+from tool.obsm_calculator import Effect, Spell, calc_casting_cost
+from tool.obsm_spellbook import Spellbook
+
+
+def _spells(catalog):
+    def eff(name, mag=0, dur=0, area=0, range="Self", details="None"):
+        return Effect(data=catalog.get(name), details=details, mag=mag, dur=dur, area=area, range=range)
+    return {
+        "fireball": Spell(eff("Fire Damage", 30, 1, 10, "Target")),
+        "spark": Spell(eff("Shock Damage", 5, 1, 0, "Touch")),
+        "heal": Spell(eff("Restore Health", 20, 5)),
+        "battlemage": Spell(eff("Fire Damage", 15, 3, 0, "Target"), eff("Shield", 20, 30),
+                            eff("Fortify Skill", 5, 60, details="Blade")),
+        "axe": Spell(eff("Bound Axe", dur=60)),
+    }
+
+
+@pytest.fixture
+def book(catalog):
+    with Spellbook() as book:
+        book.import_spells(_spells(catalog).items())
+        yield book
+
+
+def _same(a, b):
+    assert b.total_cents == a.total_cents
+    assert dict(b.school_cents) == dict(a.school_cents)
+    assert [(e.name, e.details, e.mag, e.dur, e.area, e.range) for e in b.effects] == \
+           [(e.name, e.details, e.mag, e.dur, e.area, e.range) for e in a.effects]
+
+
+def test_save_load_round_trip(catalog, book):
+    for name, spell in _spells(catalog).items():
+        _same(spell, book.load(name, catalog))
+    assert book.load("missing", catalog) is None
+    assert len(book) == 5 and "heal" in book
+
+
+def test_export_import_round_trip(catalog, book):
+    with Spellbook() as other:
+        assert other.import_rows(book.export_rows(), catalog) == len(book)
+        for name, spell in _spells(catalog).items():
+            _same(spell, other.load(name, catalog))
+        assert other.query() == book.query()
+
+
+def test_query_matches_spells(catalog, book):
+    spells = _spells(catalog)
+    found = book.query(max_cost=200, order_by="total_cost")
+    expected = sorted((s.total_cost, n) for n, s in spells.items() if s.total_cost <= 200)
+    assert len(expected) == 3
+    assert [(f["total_cost"], f["name"]) for f in found] == expected
+    assert {f["name"] for f in book.query(effect="fire damage")} == {"fireball", "battlemage"}
+
+
+def test_castable_matches_spells(catalog, book):
+    skills = {"Destruction": 50, "Alteration": 40, "Restoration": 25, "Conjuration": 60}
+    expected = []
+    for name, spell in _spells(catalog).items():
+        if spell.dominant_school not in skills or skills[spell.dominant_school] < spell.skill_required:
+            continue
+        if any(school not in skills for school in spell.school_cents):
+            continue
+        casting = calc_casting_cost(spell.school_cents, skills)
+        if casting <= 200:
+            expected.append((casting, name))
+    found = book.castable(skills, max_casting=200)
+    assert len(expected) >= 2
+    assert [(f["casting_cost"], f["name"]) for f in found] == sorted(expected)
@@ -0,0 +1,32 @@
+import pytest
+from tool.obsm_calculator import no_mag_default
+from tool.obsm_optimizer import optimize_spell
+from tool.obsm_sweep import SweepSpace, eval_chunk, run_sweep
+
+ranges = {"mag": (1, 4, 1), "dur": (1, 3, 1), "area": (0, 5, 5)}
+
+
+@pytest.mark.parametrize("mag", [[10, 20, 30], 25])
+def test_no_mag_effect_ignores_given_mag(catalog, mag):
+    space = SweepSpace(catalog, [{"name": "Bound Axe", "mag": mag}, "Fire Damage"], ranges=ranges)
+    assert space.grids[0][0].tolist() == [no_mag_default]
+    for index in range(space.size):
+        spell = space.spell(index)
+        assert eval_chunk(space, index, index + 1).max_cost == spell.total_cost
+
+
+def test_sweep_matches_spell(catalog):
+    space = SweepSpace(catalog, [{"name": "Fire Damage", "range": "Target"}, "Shield"],
+                       skills={"Destruction": 50, "Alteration": 30}, ranges=ranges)
+    spells = [space.spell(i) for i in range(space.size)]
+    stats = run_sweep(space, chunk_size=7)
+    assert stats.count == space.size
+    assert stats.min_cost == min(s.total_cost for s in spells)
+    assert stats.max_cost == max(s.total_cost for s in spells)
+    assert stats.cheapest(space)[0].total_cost == stats.min_cost
+
+
+def test_optimizer_ignores_given_mag(catalog):
+    spell = optimize_spell(catalog, [{"name": "Bound Axe", "mag": 50}], objective="dur", max_cost=100)
+    assert spell.effects[0].mag == no_mag_default
+    assert spell.total_cost <= 100
@@ -0,0 +1,440 @@
+"""
+Columnar analytics over many spells.
+
+A SpellTable holds spells as numpy columns with one row per effect, and a
+spell index: spell i is made of rows starts[i] to starts[i] + counts[i].
+Effect settings and names are stored as codes, costs in whole cents as Spell
+keeps them, so filters, group-bys and sorts are array operations and never
+touch Effect or Spell objects. Pricing is obsm_batch's, which matches
+Spell exactly.
+
+    table = SpellTable.from_spells(spells)
+    table.where(school="Destruction", max_skill=50).group_by("function")
+    table.critical_effects(75)   # effects lifting their spell past skill 75
+"""
+from logging import getLogger
+import numpy as np
+from tool.obsm_batch import casting_costs, catalog_arrays, dominant_school, effect_ids, price_batch
+from tool.obsm_calculator import Effect, Spell, def_string, no_mag_default, skill_reqs, sources
+from tool.obsm_catalog import shared_catalog
+from tool.obsm_profile import instrument
+logger = getLogger(__name__)
+
+# Group-by keys: spell level keys summarize spell costs, effect level keys effect costs
+spell_keys = ("school", "skill_required")
+effect_keys = ("effect", "effect_school", "function", "range")
+sort_keys = ("total_cost", "gold_cost", "skill_required", "effects")
+
+_skill_levels = np.array(list(skill_reqs), dtype=np.int64)
+
+
+def _encode(values):
+    """
+    Codes into a tuple of the distinct values, in sorted order
+    """
+    values = np.asarray(values, dtype=object)
+    if not len(values):
+        return np.zeros(0, dtype=np.int64), ()
+    labels, codes = np.unique(values.astype(str), return_inverse=True)
+    return codes.reshape(-1).astype(np.int64), tuple(labels.tolist())
+
+
+def _stats(codes, cents, labels):
+    """
+    Cost statistics of the rows in each group, groups without rows left out
+
+    :param codes: group code of each row
+    :param cents: cost of each row, in cents
+    :param labels: group name of each code
+    :return: group: {"count", "total", "mean", "min", "median", "max"}, costs in magicka
+    """
+    if not len(codes):
+        return {}
+    order = np.lexsort((cents, codes))
+    codes, cents = codes[order], cents[order]
+    groups, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+    totals = np.add.reduceat(cents, starts)
+    lows = cents[starts + (counts - 1) // 2]
+    highs = cents[starts + counts // 2]
+    out = {}
+    for group, n, total, lo, hi, first, last in zip(groups.tolist(), counts.tolist(), totals.tolist(),
+                                                    lows.tolist(), highs.tolist(),
+                                                    cents[starts].tolist(), cents[starts + counts - 1].tolist()):
+        out[labels[group]] = {"count": n,
+                              "total": total / 100,
+                              "mean": total / n / 100,
+                              "min": first / 100,
+                              "median": (lo + hi) / 200,
+                              "max": last / 100}
+    return out
+
+
+def _smallest(key, k):
+    """
+    Indices of the k smallest keys in order, ties in index order. Only the
+    keys up to the k-th smallest are sorted.
+    """
+    if k >= len(key):
+        return np.argsort(key, kind="stable")
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth = np.partition(key, k - 1)[k - 1]
+    candidates = np.flatnonzero(key <= kth)
+    return candidates[np.argsort(key[candidates], kind="stable")][:k]
+
+
+class SpellTable:
+    """
+    Many spells as columns, see the module docstring.
+
+    Effect rows: effect (catalog id), details, mag, dur, area, range (codes into
+    detail_names and range_names), cents, school and function (codes into the
+    catalog_arrays schools and functions) and spell (the spell each row is in).
+
+    Spells: starts, counts, total_cents, gold_cost, school, skill_required
+    (-1 where Spell gives None) and names.
+    """
+    _row_columns = ("effect", "details", "mag", "dur", "area", "range", "cents", "school_of", "function", "spell")
+
+    def __init__(self, catalog, effects, mag, dur, area, rng, offsets=None, details=None, names=None):
+        """
+        :param catalog: EffectCatalog the effects are in
+        :param effects: effect names or catalog ids, one per effect row
+        :param mag: magnitudes, ignored for effects without magnitude
+        :param dur: durations
+        :param area: areas
+        :param rng: range names
+        :param offsets: index of each spell's first effect row, default one effect per spell
+        :param details: details of each row, default "None"
+        :param names: a name for each spell, default its number
+        """
+        ids = effect_ids(catalog, effects)
+        if (ids < 0).any():
+            unknown = np.asarray(effects)[ids < 0].tolist()[0]
+            raise ValueError(f"unknown effect {unknown!r}")
+        n = len(ids)
+        offsets = np.arange(n) if offsets is None else np.asarray(offsets, dtype=np.int64)
+        prices = price_batch(catalog, ids, mag, dur, area, rng, offsets=offsets)
+        arrays = catalog_arrays(catalog)
+        self.catalog = catalog
+        self.effect = ids
+        self.details, self.detail_names = _encode([def_string] * n if details is None else details)
+        self.mag = np.where(arrays.has_mag[ids], np.asarray(mag, dtype=np.int64), no_mag_default)
+        self.dur = np.asarray(dur, dtype=np.int64).reshape(-1)
+        self.area = np.asarray(area, dtype=np.int64).reshape(-1)
+        self.range, self.range_names = _encode(rng)
+        self.cents = np.rint(prices.eff_cost * 100).astype(np.int64)
+        self.school_of = arrays.school[ids]
+        self.function = arrays.function[ids]
+        self.starts = offsets
+        self.counts = np.diff(np.append(offsets, n))
+        self.spell = np.repeat(np.arange(len(offsets)), self.counts)
+        self.total_cents = np.bincount(self.spell, weights=self.cents, minlength=len(offsets)).astype(np.int64)
+        self.gold_cost = prices.gold_cost
+        pos = np.arange(n) - offsets[self.spell] if n else np.zeros(0, dtype=np.int64)
+        self.school = dominant_school(self.cents, self.school_of, self.spell, pos, len(offsets))
+        self.skill_required = prices.skill_required
+        self.names = (np.arange(len(offsets)).astype(object) if names is None
+                      else np.asarray(names, dtype=object).reshape(-1))
+        if len(self.names) != len(offsets):
+            raise ValueError(f"{len(self.names)} names for {len(offsets)} spells")
+
+    @classmethod
+    @instrument()
+    def from_spells(cls, spells, catalog=None, names=None):
+        """
+        :param spells: Spell objects
+        :param catalog: EffectCatalog the effects come from, default the shared one
+        """
+        catalog = catalog if catalog is not None else shared_catalog(sources)
+        effs = [eff for spell in spells for eff in spell.effects]
+        offsets = np.cumsum([0] + [len(spell.effects) for spell in spells])[:-1]
+        return cls(catalog,
+                   [eff.name for eff in effs],
+                   [eff.mag for eff in effs],
+                   [eff.dur for eff in effs],
+                   [eff.area for eff in effs],
+                   [eff.range for eff in effs],
+                   offsets=offsets,
+                   details=[eff.details for eff in effs],
+                   names=names)
+
+    @classmethod
+    @instrument()
+    def from_rows(cls, rows, catalog=None):
+        """
+        :param rows: whole-spell obsm_cli rows, {"spell", "effects": [{"effect", ...}]},
+            e.g. from Spellbook.export_rows
+        """
+        catalog = catalog if catalog is not None else shared_catalog(sources)
+        names, offsets, effs = [], [], []
+        for row in rows:
+            names.append(row.get("spell", len(names)))
+            offsets.append(len(effs))
+            effs.extend(row["effects"])
+        return cls(catalog,
+                   [eff["effect"] for eff in effs],
+                   [eff.get("mag") or 0 for eff in effs],
+                   [eff.get("dur") or 0 for eff in effs],
+                   [eff.get("area") or 0 for eff in effs],
+                   [eff.get("range") or def_string for eff in effs],
+                   offsets=np.array(offsets, dtype=np.int64),
+                   details=[eff.get("details") or def_string for eff in effs],
+                   names=names)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def n_effects(self):
+        return len(self.effect)
+
+    @property
+    def total_cost(self):
+        return self.total_cents / 100
+
+    @property
+    def schools(self):
+        """
+        School name of each school code
+        """
+        return catalog_arrays(self.catalog).schools
+
+    @property
+    def functions(self):
+        return catalog_arrays(self.catalog).functions
+
+    def spell_schools(self):
+        """
+        School name of each spell
+        """
+        return np.array(self.schools, dtype=object)[self.school]
+
+    @instrument()
+    def casting_cost(self, skills):
+        """
+        Skill-modified casting cost of each spell, 0 for spells using a school
+        missing from skills, see SpellMaker._calc_cost
+
+        :param skills: dict of school: skill level, either a number or one level per spell
+        """
+        return casting_costs(catalog_arrays(self.catalog), skills, self.cents, self.school_of, self.spell, len(self))
+
+    # Selection
+
+    @instrument()
+    def take(self, index):
+        """
+        A table of the spells at index, in that order
+
+        :param index: spell numbers, or a mask with one entry per spell
+        """
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        index = index.astype(np.int64)
+        counts = self.counts[index]
+        new_starts = np.cumsum(counts) - counts
+        # Row r of the result is row starts[spell] + (r - new_starts[spell]) of this table
+        rows = np.repeat(self.starts[index] - new_starts, counts) + np.arange(counts.sum(), dtype=np.int64)
+        table = SpellTable.__new__(SpellTable)
+        table.catalog = self.catalog
+        table.detail_names = self.detail_names
+        table.range_names = self.range_names
+        for column in self._row_columns:
+            setattr(table, column, getattr(self, column)[rows])
+        table.spell = np.repeat(np.arange(len(index)), counts)
+        table.starts = new_starts
+        table.counts = counts
+        for column in ("total_cents", "gold_cost", "school", "skill_required", "names"):
+            setattr(table, column, getattr(self, column)[index])
+        return table
+
+    def effect_mask(self, effect=None, school=None, function=None, range=None):
+        """
+        Effect rows matching every condition given
+
+        :param effect: effect name or list of names
+        :param school: the effect's school
+        :param function: the effect's function
+        :param range: range name
+        """
+        mask = np.ones(self.n_effects, dtype=bool)
+        if effect is not None:
+            names = [effect] if isinstance(effect, str) else list(effect)
+            mask &= np.isin(self.effect, effect_ids(self.catalog, names))
+        if school is not None:
+            mask &= self.school_of == self._code(self.schools, school)
+        if function is not None:
+            mask &= self.function == self._code(self.functions, function)
+        if range is not None:
+            mask &= self.range == self._code(self.range_names, range)
+        return mask
+
+    @staticmethod
+    def _code(labels, value):
+        return labels.index(value) if value in labels else -1
+
+    def spell_mask(self, school=None, min_cost=None, max_cost=None, max_gold=None, max_skill=None,
+                   **effect_conditions):
+        """
+        Spells matching every condition given
+
+        :param school: the spell's school
+        :param min_cost: least total (unmodified) magicka cost
+        :param max_cost: greatest total magicka cost
+        :param max_gold: greatest gold cost
+        :param max_skill: greatest skill requirement
+        :param effect_conditions: effect, effect_school, function and range: the spell
+            has an effect matching all of them, see effect_mask
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if school is not None:
+            mask &= self.school == self._code(self.schools, school)
+        if min_cost is not None:
+            mask &= self.total_cents >= round(min_cost * 100)
+        if max_cost is not None:
+            mask &= self.total_cents <= round(max_cost * 100)
+        if max_gold is not None:
+            mask &= self.gold_cost <= max_gold
+        if max_skill is not None:
+            mask &= (self.skill_required >= 0) & (self.skill_required <= max_skill)
+        if effect_conditions:
+            unknown = set(effect_conditions) - {"effect", "effect_school", "function", "range"}
+            if unknown:
+                raise ValueError(f"unknown conditions {', '.join(sorted(unknown))}")
+            if "effect_school" in effect_conditions:
+                effect_conditions["school"] = effect_conditions.pop("effect_school")
+            rows = self.effect_mask(**effect_conditions)
+            mask &= np.bincount(self.spell[rows], minlength=len(self)) > 0
+        return mask
+
+    def where(self, **conditions):
+        """
+        A table of the spells matching every condition, see spell_mask
+        """
+        return self.take(self.spell_mask(**conditions))
+
+    # Aggregation
+
+    @instrument()
+    def group_by(self, key):
+        """
+        Cost statistics per group, see _stats
+
+        :param key: a spell level key (school, skill_required) to summarize spells'
+            total costs, or an effect level key (effect, effect_school, function,
+            range) to summarize effect costs
+        """
+        if key == "school":
+            return _stats(self.school, self.total_cents, self.schools)
+        if key == "skill_required":
+            # Tier codes 0..len(skill_reqs), the last is for spells with no tier
+            tiers = np.searchsorted(_skill_levels, self.skill_required)
+            tiers[self.skill_required < 0] = len(_skill_levels)
+            return _stats(tiers, self.total_cents, list(skill_reqs) + [None])
+        if key == "effect":
+            return _stats(self.effect, self.cents, self.catalog.names)
+        if key == "effect_school":
+            return _stats(self.school_of, self.cents, self.schools)
+        if key == "function":
+            return _stats(self.function, self.cents, self.functions)
+        if key == "range":
+            return _stats(self.range, self.cents, self.range_names)
+        raise ValueError(f"cannot group by {key!r}, expected one of {', '.join(spell_keys + effect_keys)}")
+
+    @instrument()
+    def critical_effects(self, level):
+        """
+        Effect rows that lift their spell's skill requirement above level:
+        without that one effect, the spell could be made at level
+
+        :param level: a skill level in skill_reqs
+        """
+        if level not in skill_reqs:
+            raise ValueError(f"no skill tier {level!r}, expected one of {', '.join(map(str, skill_reqs))}")
+        limit = skill_reqs[level] * 100
+        spell_cents = self.total_cents[self.spell]
+        return (spell_cents >= limit) & (spell_cents - self.cents < limit)
+
+    def count_effects(self, rows=None):
+        """
+        :param rows: effect row mask, default every row
+        :return: effect name: number of rows, most common first
+        """
+        effect = self.effect if rows is None else self.effect[rows]
+        ids, counts = np.unique(effect, return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        names = self.catalog.names
+        return {names[i]: n for i, n in zip(ids[order].tolist(), counts[order].tolist())}
+
+    # Ordering
+
+    def _sort_column(self, by):
+        if by == "total_cost":
+            return self.total_cents
+        if by == "gold_cost":
+            return self.gold_cost
+        if by == "skill_required":
+            # No tier sorts above every tier
+            return np.where(self.skill_required < 0, np.iinfo(np.int64).max, self.skill_required)
+        if by == "effects":
+            return self.counts
+        raise ValueError(f"cannot sort by {by!r}, expected one of {', '.join(sort_keys)}")
+
+    @instrument()
+    def order(self, by="total_cost", descending=False):
+        """
+        Spell numbers sorted by a column, ties in table order
+        """
+        column = self._sort_column(by)
+        return np.argsort(-column if descending else column, kind="stable")
+
+    @instrument()
+    def top(self, k, by="total_cost", descending=True):
+        """
+        The k spell numbers with the greatest (or least) values of a column, in order.
+        Only those k are sorted.
+        """
+        column = self._sort_column(by)
+        return _smallest(-column if descending else column, k)
+
+    @instrument()
+    def top_effects(self, k, descending=True):
+        """
+        The k effect rows costing the most (or least), in order
+        """
+        return _smallest(-self.cents if descending else self.cents, k)
+
+    # Back to objects
+
+    def spell_at(self, i):
+        """
+        Build spell i as a Spell
+        """
+        catalog = self.catalog
+        details, ranges = self.detail_names, self.range_names
+        start, stop = self.starts[i], self.starts[i] + self.counts[i]
+        effs = [Effect(data=catalog[eff], details=details[det], mag=mag, dur=dur, area=area, range=ranges[rng])
+                for eff, det, mag, dur, area, rng in zip(*(getattr(self, column)[start:stop].tolist()
+                                                           for column in self._row_columns[:6]))]
+        return Spell(*effs)
+
+    @instrument()
+    def to_spells(self):
+        return [self.spell_at(i) for i in range(len(self))]
+
+    def summary(self, index=None):
+        """
+        :param index: spell numbers, default all of them
+        :return: list of {"name", "school", "total_cost", "gold_cost", "skill_required", "effects"}
+            as Spellbook.query gives
+        """
+        index = np.arange(len(self)) if index is None else np.asarray(index, dtype=np.int64)
+        schools = self.schools
+        return [{"name": name, "school": schools[school], "total_cost": cents / 100, "gold_cost": gold,
+                 "skill_required": None if skill < 0 else skill, "effects": count}
+                for name, school, cents, gold, skill, count in zip(
+                    self.names[index].tolist(), self.school[index].tolist(), self.total_cents[index].tolist(),
+                    self.gold_cost[index].tolist(), self.skill_required[index].tolist(),
+                    self.counts[index].tolist())]
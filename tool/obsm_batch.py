@@ -0,0 +1,221 @@
+from collections import namedtuple
+import numpy as np
+from tool.obsm_calculator import def_string, no_mag_default, skill_reqs
+
+# Per-effect fields are one entry per effect row, the rest one entry per spell
+BatchPrices = namedtuple("BatchPrices", ["base", "target_mult", "eff_cost",
+                                         "total_cost", "gold_cost", "school",
+                                         "skill_required", "casting_cost"])
+
+CatalogArrays = namedtuple("CatalogArrays", ["base", "has_mag", "school", "schools", "function", "functions"])
+
+_skill_levels = np.array(list(skill_reqs.keys()), dtype=np.int64)
+_skill_thresholds = np.array(list(skill_reqs.values()), dtype=np.float64)
+_last_arrays = (None, None)
+
+
+def catalog_arrays(catalog):
+    """
+    Columns of the catalog needed for pricing, indexed by effect id.
+    School and function are stored as codes into the schools and functions
+    tuples, code 0 is "None".
+    """
+    global _last_arrays
+    if _last_arrays[0] is catalog:
+        return _last_arrays[1]
+    school, schools = _codes(catalog, "School")
+    function, functions = _codes(catalog, "Function")
+    arrays = CatalogArrays(base=np.array([rec.get("Base Cost", 0) for rec in catalog], dtype=np.float64),
+                           has_mag=np.array([rec.has_mag for rec in catalog], dtype=bool),
+                           school=school,
+                           schools=schools,
+                           function=function,
+                           functions=functions)
+    _last_arrays = (catalog, arrays)
+    return arrays
+
+
+def _codes(catalog, column):
+    names = [def_string]
+    codes = {def_string: 0}
+    out = []
+    for rec in catalog:
+        name = rec.get(column, def_string)
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        out.append(codes[name])
+    return np.array(out, dtype=np.int64), tuple(names)
+
+
+def round2(x):
+    """
+    Vectorized round(x, 2) that gives the same floats as Python's round.
+
+    np.round scales by 100 and rounds, which can land on the other side of
+    a half-cent tie than Python's correctly rounded round() does. Away from
+    ties both give the double nearest to k / 100, so only the near-ties are
+    handed to round() one by one.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    scaled = x * 100.0
+    out = np.rint(scaled) / 100.0
+    near_tie = ~(np.abs(scaled - np.floor(scaled) - 0.5) >= 1e-6) | ~(np.abs(scaled) < 1e9)
+    if near_tie.any():
+        out[near_tie] = [round(v, 2) for v in x[near_tie].tolist()]
+    return out
+
+
+def mag_factor(mag):
+    """
+    Vectorized max(pow(mag, 1.28), 1.0).
+
+    pow is evaluated by Python once per distinct magnitude so results match
+    the scalar path exactly, whatever libm numpy was built against.
+    """
+    uniq, inv = np.unique(np.asarray(mag), return_inverse=True)
+    factors = np.array([max(pow(m, 1.28), 1.0) for m in uniq.tolist()], dtype=np.float64)
+    return factors[inv.reshape(-1)]
+
+
+def effect_ids(catalog, effects):
+    """
+    Convert effect names to ids, unknown names get -1. Ints are passed through.
+    """
+    effects = np.asarray(effects)
+    if effects.dtype.kind in "iu":
+        return effects.astype(np.int64)
+    ids = {}
+    for name in np.unique(effects).tolist():
+        try:
+            ids[name] = catalog.index(name)
+        except KeyError:
+            ids[name] = -1
+    return np.array([ids[name] for name in effects.tolist()], dtype=np.int64)
+
+
+def price_batch(catalog, effects, mag, dur, area, rng, offsets=None, skills=None):
+    """
+    Price many spells in one vectorized pass, matching Effect/Spell/SpellMaker
+    exactly.
+
+    Effects are given as flat arrays with one entry per effect, spells are
+    consecutive runs of effects starting at offsets.
+
+    :param catalog: EffectCatalog the effect ids refer to
+    :param effects: effect ids (catalog.index) or effect names
+    :param mag: magnitudes, ignored for effects without magnitude
+    :param dur: durations
+    :param area: areas
+    :param rng: range names, "Target" applies the 1.5 multiplier
+    :param offsets: index of each spell's first effect, default one effect per spell
+    :param skills: dict of school: skill level, either a number or one level per spell
+    :return: BatchPrices, skill_required is -1 where Spell would give None
+    """
+    ids = effect_ids(catalog, effects)
+    n = len(ids)
+    offsets = np.arange(n) if offsets is None else np.asarray(offsets, dtype=np.int64)
+    if len(offsets) and (offsets[0] != 0 or np.any(np.diff(offsets) < 0) or offsets[-1] > n):
+        raise ValueError("offsets must start at 0 and be non-decreasing")
+    n_spells = len(offsets)
+    spell = np.repeat(np.arange(n_spells), np.diff(np.append(offsets, n)))
+    pos = np.arange(n) - offsets[spell] if n else np.zeros(0, dtype=np.int64)
+
+    arrays = catalog_arrays(catalog)
+    known = ids >= 0
+    safe = np.where(known, ids, 0)
+    base = np.where(known, arrays.base[safe], 0.0)
+    school = np.where(known, arrays.school[safe], 0)
+    mag = np.where(known & ~arrays.has_mag[safe], no_mag_default, np.asarray(mag))
+    target_mult = np.where(np.asarray(rng) == "Target", 1.5, 1.0)
+
+    # Same operations in the same order as calc_eff_cost
+    eff_cost = (base / 10.0 *
+                mag_factor(mag) *
+                np.maximum(np.asarray(dur), 1) *
+                np.maximum(np.asarray(area) * 0.15, 1) *
+                target_mult)
+    eff_cost = np.where(known, round2(eff_cost), 0.0)
+
+    # Spell keeps its totals in whole cents, so the sums are exact
+    eff_cents = np.rint(eff_cost * 100)
+    total_cost = np.bincount(spell, weights=eff_cents, minlength=n_spells) / 100
+
+    best_school = dominant_school(eff_cents, school, spell, pos, n_spells)
+
+    tier = np.searchsorted(_skill_thresholds, total_cost, side="right")
+    skill_required = np.where(tier < len(_skill_levels),
+                              _skill_levels[np.minimum(tier, len(_skill_levels) - 1)], -1)
+
+    return BatchPrices(base=base,
+                       target_mult=target_mult,
+                       eff_cost=eff_cost,
+                       total_cost=total_cost,
+                       gold_cost=(total_cost * 3).astype(np.int64),
+                       school=np.array(arrays.schools, dtype=object)[best_school],
+                       skill_required=skill_required,
+                       casting_cost=casting_costs(arrays, skills or {}, eff_cents, school,
+                                                  spell, n_spells))
+
+
+def dominant_school(eff_cents, school, spell, pos, n_spells):
+    """
+    Vectorized Spell._determine_school: the school code of each spell's most
+    expensive effect, the first one on ties, 0 for spells costing nothing
+
+    :param eff_cents: effect costs in cents, one per effect row
+    :param school: school codes, one per effect row
+    :param spell: spell number of each effect row
+    :param pos: position of each effect row in its spell
+    """
+    best_school = np.zeros(n_spells, dtype=np.int64)
+    if len(spell):
+        first = np.lexsort((pos, -eff_cents, spell))
+        with_effs, idx = np.unique(spell[first], return_index=True)
+        top = first[idx]
+        best_school[with_effs] = np.where(eff_cents[top] > 0, school[top], 0)
+    return best_school
+
+
+def casting_costs(arrays, skills, eff_cents, school, spell, n_spells):
+    """
+    Vectorized SpellMaker._calc_cost, 0 for spells using a school with no skill set
+
+    :param arrays: catalog_arrays of the catalog the school codes refer to
+    :param skills: dict of school: skill level, either a number or one level per spell
+    """
+    n_codes = len(arrays.schools)
+    key = spell * n_codes + school
+    cents = np.bincount(key, weights=eff_cents, minlength=n_spells * n_codes).reshape(n_spells, n_codes)
+    used = np.bincount(key, minlength=n_spells * n_codes).reshape(n_spells, n_codes) > 0
+    casting_cost = np.zeros(n_spells)
+    missing = np.zeros(n_spells, dtype=bool)
+    # Schools are added up in name order, as in calc_casting_cost
+    for code in sorted(range(n_codes), key=lambda c: arrays.schools[c]):
+        name = arrays.schools[code]
+        rows = used[:, code]
+        if not rows.any():
+            continue
+        if name not in skills:
+            missing |= rows
+            continue
+        level = np.broadcast_to(np.asarray(skills[name], dtype=np.float64), (n_spells,))
+        # casting cost multiplier = 1.4 - 0.012 × Skill
+        mult = 1.4 - 0.012 * np.minimum(level, 100)
+        casting_cost = np.where(rows, casting_cost + cents[:, code] / 100 * mult, casting_cost)
+    return np.where(missing, 0.0, round2(casting_cost))
+
+
+def price_spells(catalog, spells, skills=None):
+    """
+    Price a list of Spell objects with price_batch
+    """
+    effs = [eff for sp in spells for eff in sp.effects]
+    offsets = np.cumsum([0] + [len(sp.effects) for sp in spells[:-1]]) if spells else []
+    return price_batch(catalog,
+                       [eff.name for eff in effs],
+                       [eff.mag for eff in effs],
+                       [eff.dur for eff in effs],
+                       [eff.area for eff in effs],
+                       [eff.range for eff in effs],
+                       offsets=offsets, skills=skills)
@@ -0,0 +1,310 @@
+"""
+Benchmarks for the calculator and catalog hot paths.
+
+    python -m tool.obsm_bench                   run, save bench/latest.json, compare to bench/baseline.json
+    python -m tool.obsm_bench --save-baseline   run and store the results as the new baseline
+    python -m tool.obsm_bench --threshold 0.5 --filter update_spell
+
+Exits with 1 if any benchmark got slower than the baseline by more than the
+threshold (a fraction, 0.25 = 25% slower).
+"""
+from statistics import median
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from tool.obsm_calculator import SpellMaker, fp, group_effects, has_details, sort_modes
+from tool.obsm_catalog import EffectCatalog
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+bench_dir = os.path.join(root, "bench")
+default_baseline = os.path.join(bench_dir, "baseline.json")
+default_output = os.path.join(bench_dir, "latest.json")
+skills = {s: 50 for s in ["Alteration", "Conjuration", "Destruction", "Illusion", "Mysticism", "Restoration"]}
+spell_sizes = (1, 8, 64)
+
+benchmarks = {}
+# name: result key compared with the baseline, the median unless the bench says otherwise
+compare_keys = {}
+
+
+def bench(name, compare_on="median_s"):
+    """
+    Register a benchmark
+
+    :param compare_on: "median_s", or "min_s" for runs whose noise only ever adds time
+    """
+    def wrap(func):
+        benchmarks[name] = func
+        compare_keys[name] = compare_on
+        return func
+    return wrap
+
+
+def measure(func, repeat=7, min_time=0.05):
+    """
+    Seconds per call of func: the loop count is raised until one run takes
+    min_time, then the run is repeated and the per-call times kept
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times, number
+
+
+def _effect_keys(catalog, n):
+    """
+    (name, details) of the first n + 1 effects in the catalog
+    """
+    if len(catalog) < n + 1:
+        raise ValueError(f"catalog too small for a {n}-effect spell")
+    return [(name, "Blade" if has_details(name) else None) for name in catalog.names[:n + 1]]
+
+
+def _settings(i, details):
+    kwargs = {"mag": 3 + i % 90, "dur": 1 + i % 60, "area": 5 * (i % 5), "range": ("Self", "Touch", "Target")[i % 3]}
+    if details:
+        kwargs["details"] = details
+    return kwargs
+
+
+def _session(n):
+    sm = SpellMaker(skills=skills)
+    keys = _effect_keys(sm.catalog, n)
+    for i, (name, det) in enumerate(keys[:n]):
+        sm.update_spell(name, **_settings(i, det))
+    return sm, keys
+
+
+@bench("import_calculator", compare_on="min_s")
+def bench_import():
+    """
+    Cold import of tool.obsm_calculator in a fresh interpreter. Process start
+    up and disk caches make single runs jumpy, so the fastest of many counts.
+    """
+    code = ("import time; t = time.perf_counter(); import tool.obsm_calculator; "
+            "print(time.perf_counter() - t)")
+    times = []
+    for _ in range(21):
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times, 1
+
+
+@bench("catalog_parse")
+def bench_catalog_parse():
+    """
+    Workbook load with no cache: parse the sheet and write the cache
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        def load():
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
+            EffectCatalog.load(fp, cache_dir=tmp)
+        return measure(load, repeat=3, min_time=0)
+
+
+@bench("catalog_load_cached")
+def bench_catalog_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        EffectCatalog.load(fp, cache_dir=tmp)
+        return measure(lambda: EffectCatalog.load(fp, cache_dir=tmp))
+
+
+@bench("spellmaker_init")
+def bench_init():
+    SpellMaker()
+    return measure(lambda: SpellMaker(skills=skills))
+
+
+@bench("lookup_get_eff")
+def bench_get_eff():
+    """
+    _get_eff for every effect in the catalog
+    """
+    sm = SpellMaker(skills=skills)
+    names = sm.catalog.names
+
+    def run():
+        for name in names:
+            sm._get_eff(name, mag=10, dur=10, area=0, range="Self")
+    return measure(run)
+
+
+@bench("lookup_get_effect_school")
+def bench_get_school():
+    sm = SpellMaker(skills=skills)
+    names = sm.catalog.names
+
+    def run():
+        for name in names:
+            sm.get_effect_school(name)
+    return measure(run)
+
+
+def _cycle_bench(n):
+    def run_bench():
+        """
+        One add, update and remove of an effect on an n-effect spell
+        """
+        sm, keys = _session(n)
+        name, det = keys[n]
+
+        def cycle():
+            sm.update_spell(name, **_settings(1, det))
+            sm.update_spell(name, **_settings(2, det))
+            sm.current_spell.remove_effect(name, det or "None")
+            sm.casting_cost = sm._calc_cost()
+        return measure(cycle)
+    return run_bench
+
+
+for _n in spell_sizes:
+    bench(f"update_spell_cycle_{_n}")(_cycle_bench(_n))
+
+
+def _str_bench(n):
+    def run_bench():
+        """
+        Rendering an n-effect spell after one of its effects changed
+        """
+        sm, keys = _session(n)
+        name, det = keys[0]
+        state = {"i": 0}
+
+        def render():
+            state["i"] += 1
+            sm.update_spell(name, **_settings(state["i"] % 2, det))
+            str(sm.current_spell)
+        return measure(render)
+    return run_bench
+
+
+for _n in spell_sizes:
+    bench(f"spell_str_{_n}")(_str_bench(_n))
+
+
+def _sort_bench(mode):
+    def run_bench():
+        sm = SpellMaker(skills=skills)
+        names = sm.catalog.names
+        return measure(lambda: group_effects(sm, names, mode))
+    return run_bench
+
+
+for _mode in sort_modes:
+    bench("sort_effects_" + _mode.lower().replace(" ", "_"))(_sort_bench(_mode))
+
+
+def run(names=None):
+    """
+    Run benchmarks, all of them by default
+
+    :return: name: {"median_s", "min_s", "number", "repeat"}
+    """
+    results = {}
+    for name, func in benchmarks.items():
+        if names is not None and name not in names:
+            continue
+        times, number = func()
+        results[name] = {"median_s": median(times), "min_s": min(times), "number": number, "repeat": len(times)}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: list of (name, baseline time, current time, ratio, regressed), times
+        being medians or, for benchmarks compared on it, minimums
+    """
+    rows = []
+    for name, res in results.items():
+        key = compare_keys.get(name, "median_s")
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, None, res[key], None, False))
+            continue
+        ratio = res[key] / base[key] if base[key] else None
+        rows.append((name, base[key], res[key], ratio,
+                     ratio is not None and ratio > 1 + threshold))
+    return rows
+
+
+def _fmt(seconds):
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tool.obsm_bench", description="Hot path benchmarks")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=default_baseline)
+    parser.add_argument("--output", default=default_output, help="where to write this run's results")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown vs the baseline as a fraction, default 0.25")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args(argv)
+
+    names = [n for n in benchmarks if args.filter in n] if args.filter else None
+    results = run(names)
+    report = {"meta": _meta(), "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    rows = compare(results, baseline, args.threshold)
+    print(f"{'benchmark':32} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, base, cur, ratio, regressed in rows:
+        print(f"{name:32} {_fmt(base):>10} {_fmt(cur):>10} "
+              f"{(f'{ratio:.2f}x' if ratio is not None else '-'):>7}{'  REGRESSION' if regressed else ''}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} benchmarks slower than baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
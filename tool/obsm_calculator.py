@@ -1,16 +1,14 @@
-import pandas as pd
 from logging import getLogger
+from types import MappingProxyType
+import heapq
 import os
 import sys
+from tool.obsm_catalog import (EffectRecord, shared_catalog, columns, has_details, has_dur_only,
+                               has_mag, has_touch_only, sslc)
+from tool.obsm_memo import memoize
+from tool.obsm_profile import instrument
 logger = getLogger(__name__)
 
-
-def sslc(data: [str, pd.Series]):
-    if isinstance(data, str):
-        return data.strip().lower()
-    else:
-        return data.str.strip().str.lower()
-
 if getattr(sys, 'frozen', False):
     # If frozen by PyInstaller
     base_path = sys._MEIPASS
@@ -18,6 +16,9 @@ else:
     base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 fp = os.path.join(base_path, 'data', 'obsm_effs.xlsx')
+# Effect tables merged into the catalog, lowest precedence first: the bundled
+# sheet, then any mod tables listed in OBSM_MODS (separated like PATH)
+sources = [fp] + [p for p in os.environ.get("OBSM_MODS", "").split(os.pathsep) if p]
 
 # skill level: max magicka cost craftable
 skill_reqs = {0: 26,  # Magicka < 26: no skill level requirement
@@ -29,22 +30,71 @@ def_string = "None"
 def_int = 0
 no_mag_default = 5
 
-def has_details(eff_name):
-    return True if "Skill" in eff_name or "Attribute" in eff_name else False
 
-def has_mag(eff_name):
-    no_mag_keys = ["Water", "Bound", "Summon", "Paralyze", "Silence", "Invisibility",
-                   "Soul Trap", "Cure", "Night-Eye"]
-    return False if True in [key in eff_name for key in no_mag_keys] else True
 
+@memoize(maxsize=8192)
+def calc_eff_cost(base, mag, dur, area, is_target):
+    """
+    B = Base Cost / 10
+    M = Magnitude ^ 1.28
+    D = Duration
+    A = Area × 0.15
+    Total cost = B × M × D × A
+
+    If M, D, or A is less than 1, a value of 1 should be used.
+    The magicka cost is further multiplied by 1.5 if the spell is a Targeted spell.
+    """
+    eff_cost = (base / 10.0 *
+                max(pow(mag, 1.28), 1.0) *
+                max(dur, 1) *
+                max(area * 0.15, 1) *
+                (1.5 if is_target else 1))
+    return round(eff_cost, 2)
+
+
+def casting_multiplier(skill):
+    """
+    casting cost multiplier = 1.4 - 0.012 × Skill
+    """
+    return 1.4 - 0.012 * min(skill, 100)  # max discount 100
 
-class Effect:
+
+def calc_casting_cost(school_costs, skills):
+    """
+    The casting cost is each school's share of the spell cost, reduced by
+    the caster's skill in that school
+
+    :param school_costs: dict of school: cost in cents
+    :param skills: dict of school: skill level, must cover every school
+    """
+    return _casting_cost(tuple((school, school_costs[school], skills[school])
+                               for school in sorted(school_costs)))
+
+
+@memoize(maxsize=1024)
+def _casting_cost(school_terms):
+    """
+    :param school_terms: (school, cost in cents, skill level) sorted by school
     """
+    casting_cost = 0
+    for school, cents, skill in school_terms:
+        casting_cost += cents / 100 * casting_multiplier(skill)
+    return round(casting_cost, 2)
+
 
+class Effect:
+    """
+    One effect on a spell: the catalog record it was made from, which is
+    shared between all effects of that kind, and this instance's settings
     """
+    __slots__ = ("record", "details", "mag", "dur", "area", "range",
+                 "is_target", "eff_cost", "_summary")
+    # Settings set_param can change
+    params = ("details", "mag", "dur", "area", "range")
+
     def __init__(self, **kwargs):
         """
-        :param data: pd.Series,
+        :param data: EffectRecord or dict keyed by Excel column name
         :param details: str, default "None"
         :param mag: int, default 0,
         :param dur: int, default 0
@@ -53,53 +103,64 @@ class Effect:
         """
         # Base effect data
         data = kwargs.get("data", {})
-        self.name = data.get("Effect Name", def_string)
-        self.school = data.get("School", def_string)
-        self.base = data.get("Base Cost", def_int)
-        self.function = data.get("Function", def_string)
+        if not isinstance(data, EffectRecord):
+            data = EffectRecord(**{columns[k]: v for k, v in data.items() if k in columns})
+        self.record = data
         # Instance data
         self.details = kwargs.get("details", def_string)
-        self.mag = kwargs.get("mag", def_int) if has_mag(self.name) else no_mag_default
+        self.mag = kwargs.get("mag", def_int) if data.has_mag else no_mag_default
         self.dur = kwargs.get("dur", def_int)
         self.area = kwargs.get("area", def_int)
         self.range = kwargs.get("range", def_string)
         # Derived values
         self.is_target = True if self.range == "Target" else False
         self.eff_cost = self._calc_eff_cost()
+        self._summary = None
+
+    @property
+    def name(self):
+        value = self.record.name
+        return def_string if value is None else value
+
+    @property
+    def school(self):
+        value = self.record.school
+        return def_string if value is None else value
 
+    @property
+    def base(self):
+        value = self.record.base
+        return def_int if value is None else value
+
+    @property
+    def function(self):
+        value = self.record.function
+        return def_string if value is None else value
 
     def __str__(self):
-        summary = ''
-        eff_name_txt =  self.name + (f": {self.details}" if has_details(self.name) else "")
-        summary += (eff_name_txt + " ")
-        summary += f"{self.mag} points " if has_mag(self.name) else ""
-        summary += f"in {self.area} feet " if self.area > 0 else ""
-        summary += f"for {self.dur} seconds "
-        summary += f"on {self.range}"
-        return summary
+        if self._summary is None:
+            rec = self.record
+            summary = ''
+            eff_name_txt = self.name + (f": {self.details}" if rec.has_details else "")
+            summary += (eff_name_txt + " ")
+            summary += f"{self.mag} points " if rec.has_mag else ""
+            summary += f"in {self.area} feet " if self.area > 0 else ""
+            summary += f"for {self.dur} seconds "
+            summary += f"on {self.range}"
+            self._summary = summary
+        return self._summary
 
     def _calc_eff_cost(self):
         """
-        B = Base Cost / 10
-        M = Magnitude ^ 1.28
-        D = Duration
-        A = Area × 0.15
-        Total cost = B × M × D × A
-
-        If M, D, or A is less than 1, a value of 1 should be used.
-        The magicka cost is further multiplied by 1.5 if the spell is a Targeted spell.
+        See calc_eff_cost
         """
         # Check if effect is initialized or not
         if self.name == def_string:
             return def_int
         # Effect has been set up with some non-default data
-        eff_cost = (self.base / 10.0 *
-                    max(pow(self.mag, 1.28), 1.0) *
-                    max(self.dur, 1) *
-                    max(self.area * 0.15, 1) *
-                    (1.5 if self.is_target else 1))
-        return round(eff_cost, 2)
+        return calc_eff_cost(self.base, self.mag, self.dur, self.area, self.is_target)
 
+    @instrument()
     def set_param(self, **kwargs):
         """
         Updates mag, dur, etc... with provided values.
@@ -108,59 +169,226 @@ class Effect:
         """
         for key, value in kwargs.items():
             # Update effect params with provided data
-            if hasattr(self, key):
-                if not has_mag(self.name) and key == "mag":
+            if key in self.params:
+                if not self.record.has_mag and key == "mag":
                     # Do not allow mag update if effect doesn't have magnitude
                     pass
                 setattr(self, key, value)
         # Recalculate new effect cost
         self.is_target = True if self.range == "Target" else False
         self.eff_cost = self._calc_eff_cost()
+        self._summary = None
 
     def update(self, eff):
-        for attr, value in vars(eff).items():
-            setattr(self, attr, value)
+        for attr in self.__slots__:
+            setattr(self, attr, getattr(eff, attr))
+
+    def copy(self):
+        eff = Effect.__new__(Effect)
+        eff.update(self)
+        return eff
+
+
+class _EffText:
+    """
+    Effect label for log messages, only put together if the message is emitted
+    """
+    __slots__ = ("name", "details")
+
+    def __init__(self, name, details):
+        self.name = name
+        self.details = details
+
+    def __str__(self):
+        return self.name + (f": {self.details}" if has_details(self.name) else "")
 
 
 class Spell:
     """
     Class that stores a list of effects and generates info about the entire spell
+
+    Costs are kept as running totals in whole cents (effect costs are rounded
+    to 2 decimals), so each mutation only adjusts the totals for the effects
+    it touched instead of rescanning the spell.
     """
     def __init__(self, *effs):
         self.effects = []
-        self.effects.extend(effs)
+        # Running totals, in cents
+        self._total_cents = 0
+        self._school_cents = {}
+        self._school_counts = {}
+        # Insertion number of each entry in effects, keeps ties in list order
+        self._seqs = []
+        self._next_seq = 0
+        # seq: (cents, school) of each effect on the spell
+        self._tracked = {}
+        # (-cents, seq) entries, stale ones are skipped when read
+        self._heap = []
+        # (name, details): seq, and seq: position in effects
+        self._index = {}
+        self._pos = {}
+        # name: number of effects with that name
+        self._name_counts = {}
+        self._summary = None
+        for eff in effs:
+            self._append(eff)
         self._calc_derived_fields()
 
+    @instrument()
     def __str__(self):
-        summary = (f"School: {self.dominant_school}\n"
-                   f"Required Skill Level: {self.skill_required}\n"
-                   f"Unmodified Magicka Cost: {self.total_cost}\n"
-                   f"Gold Cost: {self.gold_cost}\n")
-        effects = ("Effects:\n" +
-                   "".join([" - " + str(eff) + "\n" for eff in self.effects]))
-        return summary + effects
+        if self._summary is None:
+            summary = (f"School: {self.dominant_school}\n"
+                       f"Required Skill Level: {self.skill_required}\n"
+                       f"Unmodified Magicka Cost: {self.total_cost}\n"
+                       f"Gold Cost: {self.gold_cost}\n")
+            effects = ("Effects:\n" +
+                       "".join([" - " + str(eff) + "\n" for eff in self.effects]))
+            self._summary = summary + effects
+        return self._summary
+
+    @property
+    def school_cents(self):
+        """
+        School: summed cost of the spell's effects of that school, in cents
+        """
+        return MappingProxyType(self._school_cents)
+
+    @property
+    def total_cents(self):
+        """
+        Summed cost of the spell's effects, in cents
+        """
+        return self._total_cents
 
+    def _new_seq(self):
+        self._next_seq += 1
+        return self._next_seq
+
+    @staticmethod
+    def _key(eff_name, eff_det):
+        # Only skill/attribute effects are told apart by their details
+        return eff_name, (eff_det if has_details(eff_name) else def_string)
+
+    def _append(self, eff):
+        """
+        Add an effect to the end of the spell, its totals and its index
+        """
+        seq = self._new_seq()
+        self.effects.append(eff)
+        self._seqs.append(seq)
+        self._pos[seq] = len(self.effects) - 1
+        # The first of any duplicates is the one found, as with a linear scan
+        self._index.setdefault(self._key(eff.name, eff.details), seq)
+        self._name_counts[eff.name] = self._name_counts.get(eff.name, 0) + 1
+        self._track(len(self.effects) - 1)
+
+    def _pop(self, idx):
+        """
+        Take the effect at idx out of the spell, its totals and its index
+        """
+        self._untrack(idx)
+        eff = self.effects.pop(idx)
+        seq = self._seqs.pop(idx)
+        del self._pos[seq]
+        for i in range(idx, len(self._seqs)):
+            self._pos[self._seqs[i]] = i
+        key = self._key(eff.name, eff.details)
+        if self._index.get(key) == seq:
+            del self._index[key]
+            # Fall back on a duplicate if the spell was built with one
+            for i, ee in enumerate(self.effects):
+                if self._key(ee.name, ee.details) == key:
+                    self._index[key] = self._seqs[i]
+                    break
+        self._name_counts[eff.name] -= 1
+        if not self._name_counts[eff.name]:
+            del self._name_counts[eff.name]
+        return eff
+
+    def _reindex(self, idx, old_key):
+        """
+        Move the effect at idx in the index if a change gave it a new key
+        """
+        seq = self._seqs[idx]
+        eff = self.effects[idx]
+        new_key = self._key(eff.name, eff.details)
+        if new_key != old_key and self._index.get(old_key) == seq:
+            del self._index[old_key]
+            self._index.setdefault(new_key, seq)
+
+    @instrument()
+    def move_effect(self, idx, new_idx):
+        """
+        Move the effect at idx to new_idx, shifting the ones in between
+        """
+        self.effects.insert(new_idx, self.effects.pop(idx))
+        # Renumber in the new order so ties between effects still go to the first
+        old_seqs = self._seqs
+        self._seqs = [self._new_seq() for _ in self.effects]
+        old_seqs.insert(new_idx, old_seqs.pop(idx))
+        renumber = dict(zip(old_seqs, self._seqs))
+        self._pos = {seq: i for i, seq in enumerate(self._seqs)}
+        self._index = {key: renumber[seq] for key, seq in self._index.items()}
+        self._tracked = {renumber[seq]: tracked for seq, tracked in self._tracked.items()}
+        self._heap = [(-c, seq) for seq, (c, _) in self._tracked.items()]
+        heapq.heapify(self._heap)
+        self._calc_derived_fields()
+
+    def _track(self, idx):
+        """
+        Add the effect at idx to the running totals
+        """
+        eff, seq = self.effects[idx], self._seqs[idx]
+        cents = round(eff.eff_cost * 100)
+        self._tracked[seq] = (cents, eff.school)
+        self._total_cents += cents
+        self._school_cents[eff.school] = self._school_cents.get(eff.school, 0) + cents
+        self._school_counts[eff.school] = self._school_counts.get(eff.school, 0) + 1
+        heapq.heappush(self._heap, (-cents, seq))
+        if len(self._heap) > 2 * len(self._tracked) + 8:
+            # Drop stale entries left behind by updates and removals
+            self._heap = [(-c, sq) for sq, (c, _) in self._tracked.items()]
+            heapq.heapify(self._heap)
+
+    def _untrack(self, idx):
+        """
+        Take the effect at idx out of the running totals
+        """
+        cents, school = self._tracked.pop(self._seqs[idx])
+        self._total_cents -= cents
+        self._school_cents[school] -= cents
+        self._school_counts[school] -= 1
+        if not self._school_counts[school]:
+            del self._school_counts[school]
+            del self._school_cents[school]
+
+    @instrument()
     def _calc_derived_fields(self):
         self.dominant_school = self._determine_school()
         self.total_cost = self._calc_cost()
         self.gold_cost = int(self.total_cost * 3)
         self.skill_required = self._determine_skill_req()
+        self._summary = None
 
     def _determine_school(self):
         """
         The spell's school is the school of its highest magnitude effect
         """
-        greatest = [def_string, def_int]
-        for eff in self.effects:
-            if eff.eff_cost > greatest[1]:
-                greatest = [eff.school, eff.eff_cost]
-        return greatest[0]
+        heap = self._heap
+        while heap:
+            neg_cents, seq = heap[0]
+            tracked = self._tracked.get(seq)
+            if tracked is not None and tracked[0] == -neg_cents:
+                # The first effect to reach the greatest cost wins ties
+                return tracked[1] if neg_cents < 0 else def_string
+            heapq.heappop(heap)
+        return def_string
 
     def _calc_cost(self):
         """
         The spell's cost is the sum of its effects' costs
         """
-        return def_int + sum([eff.eff_cost for eff in self.effects])
+        return self._total_cents / 100 if self._tracked else def_int
 
     def _determine_skill_req(self):
         """
@@ -191,109 +419,167 @@ class Spell:
         # Extract info from effect param
         eff_name = eff if isinstance(eff, str) else eff.name
         eff_det = str_detail if isinstance(eff, str) else eff.details
-        # Check if effect is already on spell
-        for idx, ee in enumerate(self.effects):
-            # In the case of skill/attribute effects
-            if eff_name == ee.name and has_details(eff_name):
-                # Input validation
-                if eff_det == def_string:
-                    raise AttributeError(f"Details not provided for {eff_name}")
-                # Check the effect details
-                if eff_det == ee.details:
-                    return idx
-            # In the case of other effects without sub-effects
-            elif eff_name == ee.name:
-                return idx
-        # If not found, return none
-        return None
-
+        # In the case of skill/attribute effects already on the spell
+        if eff_det == def_string and has_details(eff_name) and eff_name in self._name_counts:
+            # Input validation
+            raise AttributeError(f"Details not provided for {eff_name}")
+        # Check if effect is already on spell, if not found return none
+        seq = self._index.get(self._key(eff_name, eff_det))
+        return None if seq is None else self._pos[seq]
+
+    @instrument()
     def add_effect(self, eff: Effect):
         # Effect text for logging
-        eff_text = eff.name + (f": {eff.details}" if has_details(eff.name) else "")
+        eff_text = _EffText(eff.name, eff.details)
         # Check if effect is already on spell
         exst_eff_idx = self._match_eff(eff)
         if exst_eff_idx is not None:
             # Update existing effect
+            self._untrack(exst_eff_idx)
             self.effects[exst_eff_idx].update(eff)
-            logger.info(f"Updated {eff_text}")
+            self._track(exst_eff_idx)
+            logger.info("Updated %s", eff_text)
         else:
             # Effect didn't already exist
-            self.effects.append(eff)
-            logger.info(f"Added {eff_text}")
+            self._append(eff)
+            logger.info("Added %s", eff_text)
         # Recalculate derived fields
         self._calc_derived_fields()
         return True
 
+    @instrument()
     def update_effect_from_str(self, eff_name: str, **kwargs):
         # Get details if exist
         str_detail = kwargs.get("details", def_string)
         # Effect text for logging
-        eff_text = eff_name + (f": {str_detail}" if has_details(eff_name) else "")
+        eff_text = _EffText(eff_name, str_detail)
         # Check if effect is already on spell
         exst_eff_idx = self._match_eff(eff_name, str_detail)
         if exst_eff_idx is None:
-            logger.warning(f"Effect [{eff_text}] not present in spell.")
+            logger.warning("Effect [%s] not present in spell.", eff_text)
             return False
         # Effect exists in spell
         # Update existing effect with new params
+        self._untrack(exst_eff_idx)
         self.effects[exst_eff_idx].set_param(**kwargs)
+        self._track(exst_eff_idx)
+        self._reindex(exst_eff_idx, self._key(eff_name, str_detail))
         # Recalculate derived fields
         self._calc_derived_fields()
         return True
 
+    @instrument()
+    def update_effects(self, changes: dict):
+        """
+        Update effects on the spell by handle instead of by name, then
+        recalculate the derived fields once for all of them
+
+        :param changes: {Effect on this spell: set_param kwargs}
+        :return: number of effects updated, effects not on the spell are skipped
+        """
+        positions = {id(eff): i for i, eff in enumerate(self.effects)}
+        updated = 0
+        for eff, kwargs in changes.items():
+            idx = positions.get(id(eff))
+            if idx is None:
+                logger.warning("Effect [%s] not present in spell.", _EffText(eff.name, eff.details))
+                continue
+            old_key = self._key(eff.name, eff.details)
+            self._untrack(idx)
+            eff.set_param(**kwargs)
+            self._track(idx)
+            self._reindex(idx, old_key)
+            updated += 1
+        if updated:
+            self._calc_derived_fields()
+        return updated
+
+    @instrument()
+    def update_records(self, records: dict):
+        """
+        Point effects on the spell at new catalog records, e.g. after the effect
+        table was edited, then recalculate the derived fields once
+
+        :param records: {sslc(effect name): new EffectRecord}
+        :return: number of effects updated
+        """
+        updated = 0
+        for idx, eff in enumerate(self.effects):
+            rec = records.get(sslc(eff.name))
+            if rec is None or rec is eff.record:
+                continue
+            old_name, old_key = eff.name, self._key(eff.name, eff.details)
+            self._untrack(idx)
+            eff.record = rec
+            # Recalculate the effect's cost from the new base cost
+            eff.set_param()
+            self._track(idx)
+            self._reindex(idx, old_key)
+            if eff.name != old_name:
+                # Same effect with its name spelled differently
+                self._name_counts[old_name] -= 1
+                if not self._name_counts[old_name]:
+                    del self._name_counts[old_name]
+                self._name_counts[eff.name] = self._name_counts.get(eff.name, 0) + 1
+            updated += 1
+        if updated:
+            self._calc_derived_fields()
+        return updated
+
+    @instrument()
     def remove_effect(self, eff_name: str, str_detail=def_string):
         # Effect text for logging
-        eff_text = eff_name + (f": {str_detail}" if has_details(eff_name) else "")
+        eff_text = _EffText(eff_name, str_detail)
         # Check if effect is already on spell
         exst_eff_idx = self._match_eff(eff_name, str_detail)
         if exst_eff_idx is None:
-            logger.warning(f"Effect [{eff_text}] not present in spell.")
+            logger.warning("Effect [%s] not present in spell.", eff_text)
             return False
 
         # Effect exists in spell
-        self.effects.pop(exst_eff_idx)
+        self._pop(exst_eff_idx)
         self._calc_derived_fields()
-        logger.info(f"Removed {eff_text}")
+        logger.info("Removed %s", eff_text)
         return True
 
 
 class SpellMaker:
     """
-    This class
+    One spell making session: the spell being worked on and the caster's
+    skills. The effect catalog is shared by every session in the process,
+    so sessions are cheap to create and independent of each other.
     """
+    __slots__ = ("catalog", "current_spell", "skills", "casting_cost")
 
-    def __init__(self, skills: dict = {}):
-        # The DataFrame object containing the Excel sheet data
-        self.df = pd.read_excel(fp)
+    def __init__(self, skills: dict = None, catalog=None):
+        """
+        :param skills: dict of school: skill level, copied into the session
+        :param catalog: EffectCatalog to use, defaults to the shared one for sources
+        """
+        # Lookup index over the Excel sheet data, loaded once per process
+        self.catalog = catalog if catalog is not None else shared_catalog(sources)
         # The working custom spell object
         self.current_spell = None
         # Info for determining spell casting cost
-        self.skills = skills
+        self.skills = dict(skills) if skills else {}
         self.casting_cost = self._calc_cost()
 
+    @instrument()
     def _calc_cost(self):
         """
-        The spell's casting cost is the sum of its effects' costs
+        The spell's casting cost is the sum of its effects' costs, see calc_casting_cost
         """
         if not self.current_spell:
             return 0
-        # Get school and cost for each component effect
-        print(self.current_spell)
-        spell_components = [{eff.school:eff.eff_cost} for eff in self.current_spell.effects]
+        # Spell keeps its cost per school up to date
+        school_cents = self.current_spell.school_cents
         # Verify all needed casting skills are known
-        used_schools = set([list(sc.keys())[0] for sc in spell_components])
-        skill_not_found = True if True in [s not in self.skills.keys() for s in used_schools] else False
+        skill_not_found = True if True in [s not in self.skills.keys() for s in school_cents] else False
         if skill_not_found:
             logger.warning("Cannot calculate casting cost, please add magic skills")
             return 0
         # Calculate skill-modified effect costs
-        casting_cost = 0
-        for eff in spell_components:
-            for k, v in eff.items():
-                # casting cost multiplier = 1.4 - 0.012 × Skill
-                v *= 1.4 - 0.012 * min(self.skills.get(k), 100)  # max discount 100
-                casting_cost += v
-        return round(casting_cost, 2)
+        return calc_casting_cost(school_cents, self.skills)
 
     def update_skills(self, skill_dict: dict):
         """
@@ -309,28 +595,52 @@ class SpellMaker:
         # Update the valid skills
         self.skills.update(new_skills)
 
+    @instrument()
+    def swap_catalog(self, catalog, diff):
+        """
+        Switch to a reloaded catalog, updating the effects on the current spell
+        whose rows changed. Effects removed from the catalog stay on the spell
+        as they were.
+
+        :param catalog: the new EffectCatalog
+        :param diff: CatalogDiff from the old catalog to the new one
+        """
+        self.catalog = catalog
+        if self.current_spell and diff.removed:
+            removed = {sslc(rec.name) for rec in diff.removed}
+            for eff in self.current_spell.effects:
+                if sslc(eff.name) in removed:
+                    logger.warning("Effect [%s] on the spell was removed from the catalog", eff.name)
+        if self.current_spell and diff.changed:
+            self.current_spell.update_records({sslc(new.name): new for _, new in diff.changed})
+            self.casting_cost = self._calc_cost()
+
+    @instrument()
     def _get_eff(self, name: str, **kwargs):
         """
         Get the info from the data table for a specified effect
         """
-        eff_data = self.df[sslc(self.df["Effect Name"]) == sslc(name)].squeeze()
+        eff_data = self.catalog.get(name, {})
         effect = Effect(data=eff_data, **kwargs)
         return effect
 
+    @instrument()
     def get_effect_school(self, name):
         """
         Get the school of a named effect
         """
-        eff_data = self.df[sslc(self.df["Effect Name"]) == sslc(name)].squeeze()
+        eff_data = self.catalog.get(name, {})
         return eff_data.get("School", def_string)
 
+    @instrument()
     def get_effect_function(self, name):
         """
         Get the function of a named effect
         """
-        eff_data = self.df[sslc(self.df["Effect Name"]) == sslc(name)].squeeze()
+        eff_data = self.catalog.get(name, {})
         return eff_data.get("Function", def_string)
 
+    @instrument()
     def update_spell(self, eff: [str, Effect], **kwargs):
         if not self.current_spell:
             # No existing spell
@@ -354,3 +664,49 @@ class SpellMaker:
             else:
                 self.current_spell.add_effect(eff)
         self.casting_cost = self._calc_cost()
+
+
+sort_modes = ("Alphabetical", "By School", "By Function")
+
+
+def _group_from_index(index, labels, lookup):
+    """
+    Split labels along one of the catalog's precomputed groupings, whose
+    names are already sorted. Labels the catalog doesn't name exactly are
+    placed with lookup.
+    """
+    wanted = set(labels)
+    grouped = {}
+    placed = 0
+    for key, names in index.items():
+        members = [name for name in names if name in wanted]
+        if members:
+            grouped.setdefault(key or "Unknown", []).extend(members)
+            placed += len(members)
+    if placed < len(wanted):
+        found = {name for members in grouped.values() for name in members}
+        for label in wanted - found:
+            grouped.setdefault(lookup(label) or "Unknown", []).append(label)
+    for members in grouped.values():
+        members.sort()
+    return grouped
+
+
+@instrument()
+def group_effects(spell_maker, labels, mode):
+    """
+    Group effect names for the effect list, sorted within and across groups
+
+    :param spell_maker: SpellMaker used to look up schools and functions
+    :param labels: effect names
+    :param mode: one of sort_modes, anything else puts every label in one group
+    """
+    if mode == "Alphabetical":
+        grouped = {"A–Z": sorted(labels)}
+    elif mode == "By School":
+        grouped = _group_from_index(spell_maker.catalog.by_school, labels, spell_maker.get_effect_school)
+    elif mode == "By Function":
+        grouped = _group_from_index(spell_maker.catalog.by_function, labels, spell_maker.get_effect_function)
+    else:
+        grouped = {"All": labels}
+    return dict(sorted(grouped.items()))  # Sort groups alphabetically or numerically
@@ -0,0 +1,640 @@
+from collections import namedtuple
+from logging import getLogger
+from types import MappingProxyType
+import csv
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+from tool.obsm_profile import instrument
+logger = getLogger(__name__)
+
+# Bump when the cached layout changes so stale caches get rebuilt
+cache_version = 1
+
+
+def sslc(data: str):
+    return data.strip().lower()
+
+
+# Excel column name: record field name
+columns = {"Effect Name": "name",
+           "School": "school",
+           "Base Cost": "base",
+           "Barter Factor": "barter",
+           "Function": "function",
+           "Description": "description"}
+
+
+def has_details(eff_name):
+    return True if "Skill" in eff_name or "Attribute" in eff_name else False
+
+def has_dur_only(eff_name):
+    # Bound/Summon/Night-Eye effects only have a duration
+    return any(word in eff_name for word in ["Bound", "Summon", "Night"])
+
+def has_touch_only(eff_name):
+    # Absorb effects can only be cast on touch
+    return "Absorb" in eff_name
+
+def has_mag(eff_name):
+    no_mag_keys = ["Water", "Bound", "Summon", "Paralyze", "Silence", "Invisibility",
+                   "Soul Trap", "Cure", "Night-Eye"]
+    return False if True in [key in eff_name for key in no_mag_keys] else True
+
+
+# Worked out from the effect name when a record is created
+flags = ["has_mag", "has_details", "dur_only", "touch_only"]
+
+
+class EffectRecord(namedtuple("EffectRecord", list(columns.values()) + flags)):
+    """
+    One row of the effect table, with the effect's flags worked out once
+    so every Effect of that kind can share them
+    """
+    __slots__ = ()
+
+    def __new__(cls, name=None, school=None, base=None, barter=None, function=None,
+                description=None, *_):
+        label = name or ""
+        return super().__new__(cls, name, school, base, barter, function, description,
+                               has_mag(label), has_details(label),
+                               has_dur_only(label), has_touch_only(label))
+
+    def get(self, column, default=None):
+        """
+        Look up a value by its Excel column name, like a row of the sheet would
+        """
+        value = getattr(self, columns.get(column, ""), None)
+        return default if value is None else value
+
+
+def _clean(value):
+    # Empty cells come out of pandas as NaN
+    return None if value is None or value != value else value
+
+
+def _make_record(values):
+    # Numeric columns may come back as int or float depending on the cell
+    for field in ("base", "barter"):
+        if values[field] is not None:
+            values[field] = float(values[field])
+    return EffectRecord(**values)
+
+
+def _group(records, field):
+    grouped = {}
+    for rec in records:
+        grouped.setdefault(getattr(rec, field), []).append(rec.name)
+    return MappingProxyType({k: tuple(sorted(v)) for k, v in grouped.items()})
+
+
+class EffectCatalog:
+    """
+    Read-only index over the effect table.
+
+    Effects are keyed on their normalized (sslc) name so lookups are a single
+    dict hit, and the school/function groupings are built once up front.
+    """
+    __slots__ = ("_records", "_by_key", "_index", "_by_school", "_by_function")
+
+    def __init__(self, records):
+        by_key = {}
+        for rec in records:
+            if not rec.name:
+                continue
+            key = sslc(rec.name)
+            if key in by_key:
+                logger.warning(f"Duplicate effect [{rec.name}] ignored")
+                continue
+            by_key[key] = rec
+        records = tuple(by_key.values())
+        # Frozen once built, so one catalog can be read from any thread without locking
+        setattr_ = object.__setattr__
+        setattr_(self, "_records", records)
+        setattr_(self, "_by_key", MappingProxyType(by_key))
+        setattr_(self, "_index", MappingProxyType({key: i for i, key in enumerate(by_key)}))
+        setattr_(self, "_by_school", _group(records, "school"))
+        setattr_(self, "_by_function", _group(records, "function"))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __reduce__(self):
+        return type(self), (self._records,)
+
+    @classmethod
+    @instrument()
+    def load(cls, path, cache_dir=None):
+        """
+        Build a catalog from one effect table, using the preparsed cache when
+        the table hasn't changed since it was written
+
+        :param path: path to the Excel sheet, CSV or JSON file
+        :param cache_dir: where to keep the cache, defaults to cache_dir_for(path)
+        """
+        return cls._from_columns(load_source(path, cache_dir)["columns"])
+
+    @classmethod
+    @instrument()
+    def load_sources(cls, paths, cache_dir=None, mode="patch"):
+        """
+        Build a catalog by merging effect tables, e.g. the bundled sheet then
+        mod tables. Each table is cached on its own, so changing one only
+        re-parses that one. See merge_sources for the precedence rules.
+
+        :param paths: effect tables, lowest precedence first
+        :param cache_dir: see load
+        :param mode: "patch" or "replace", see merge_sources
+        """
+        return cls(merge_sources([load_source(path, cache_dir) for path in paths], mode))
+
+    @classmethod
+    @instrument()
+    def from_excel(cls, path):
+        """
+        Build a catalog by parsing the first sheet of an Excel workbook
+        """
+        return cls._from_columns(parse_source(path)["columns"])
+
+    @classmethod
+    def from_rows(cls, header, rows):
+        """
+        Build a catalog from a header of Excel column names and rows of values
+        """
+        idx = [(columns[c], i) for i, c in enumerate(header) if c in columns]
+        records = []
+        for row in rows:
+            values = dict.fromkeys(columns.values())
+            values.update((field, _clean(row[i])) for field, i in idx if i < len(row))
+            records.append(_make_record(values))
+        return cls(records)
+
+    @classmethod
+    def _from_columns(cls, cols):
+        return cls(EffectRecord(*row) for row in zip(*(cols[f] for f in columns.values())))
+
+    def _to_columns(self):
+        return {f: [getattr(rec, f) for rec in self._records] for f in columns.values()}
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Build a catalog from the DataFrame read out of the Excel sheet
+        """
+        return cls.from_rows(list(df.columns), df.itertuples(index=False, name=None))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and sslc(name) in self._by_key
+
+    @instrument()
+    def get(self, name, default=None):
+        """
+        Get the record for a named effect, ignoring case and surrounding whitespace
+        """
+        return self._by_key.get(sslc(name), default)
+
+    def index(self, name):
+        """
+        Position of a named effect in the catalog, used as its effect id
+
+        :raises KeyError: if the effect isn't in the catalog
+        """
+        return self._index[sslc(name)]
+
+    def __getitem__(self, idx):
+        return self._records[idx]
+
+    @property
+    def names(self):
+        """
+        Effect names in sheet order
+        """
+        return [rec.name for rec in self._records]
+
+    @property
+    def by_school(self):
+        """
+        School: sorted effect names
+        """
+        return self._by_school
+
+    @property
+    def by_function(self):
+        """
+        Function: sorted effect names
+        """
+        return self._by_function
+
+
+# Marks a row of a mod table as removing the effect instead of defining it
+remove_column = "Remove"
+# Lower-cased header: record field, tables may use the Excel column names or the field names
+_header_fields = {**{sslc(c): f for c, f in columns.items()}, **{f: f for f in columns.values()},
+                  sslc(remove_column): "remove"}
+merge_modes = ("patch", "replace")
+
+
+def _excel_rows(path):
+    # Only needed on a cache miss, keep it off the import path
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        wb.close()
+
+
+def _csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            # Empty cells are missing values, as in a sheet
+            yield {k: (v if v != "" else None) for k, v in row.items()}
+
+
+def _json_rows(path, chunk_size=1 << 16):
+    """
+    Objects of a JSON array, decoded one at a time from chunks of the file so
+    it is never held whole, or of JSON Lines
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith("["):
+            f.seek(0)
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+        pos, eof = 1, False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The object runs on into the next chunk
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield obj
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+# File extension: reader yielding one {header: value} dict per row
+readers = {".xlsx": _excel_rows,
+           ".xlsm": _excel_rows,
+           ".csv": _csv_rows,
+           ".json": _json_rows,
+           ".jsonl": _json_rows}
+
+
+def _is_set(value):
+    if isinstance(value, str):
+        return sslc(value) in ("1", "true", "yes", "y", "x")
+    return bool(value) and value == value
+
+
+@instrument()
+def parse_source(path):
+    """
+    Parse one effect table, streaming its rows
+
+    :return: {"columns": field: values of the effects it defines, in table order,
+              "removed": names of the effects it removes}
+    """
+    reader = readers.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f"Unsupported effect table {path}, expected one of {', '.join(readers)}")
+    cols = {f: [] for f in columns.values()}
+    removed = []
+    seen = set()
+    for n, row in enumerate(reader(path), start=2):
+        values = dict.fromkeys(columns.values())
+        remove = False
+        for header, value in row.items():
+            field = _header_fields.get(sslc(header)) if isinstance(header, str) else None
+            if field == "remove":
+                remove = _is_set(value)
+            elif field:
+                values[field] = _clean(value)
+        name = values["name"]
+        if not name:
+            continue
+        if remove:
+            removed.append(name)
+            continue
+        key = sslc(name)
+        if key in seen:
+            logger.warning(f"Duplicate effect [{name}] in {path} ignored")
+            continue
+        try:
+            rec = _make_record(values)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Skipping effect [{name}] on row {n} of {path}: {e}")
+            continue
+        seen.add(key)
+        for field, value in zip(cols, rec):
+            cols[field].append(value)
+    return {"columns": cols, "removed": removed}
+
+
+@instrument()
+def load_source(path, cache_dir=None):
+    """
+    parse_source, through the table's own cache
+
+    :param path: path to the Excel sheet, CSV or JSON file
+    :param cache_dir: where to keep the cache, defaults to cache_dir_for(path)
+    """
+    cache_fp = cache_path(path, cache_dir)
+    stat = os.stat(path)
+    cached = _read_cache(cache_fp)
+    if cached and (cached["mtime"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+        return {"columns": cached["columns"], "removed": cached.get("removed", [])}
+    # Table may have only been touched, fall back on its contents
+    digest = file_hash(path)
+    if cached and cached["sha256"] == digest:
+        logger.info(f"Effect cache for {path} still valid, updating mtime")
+        source = {"columns": cached["columns"], "removed": cached.get("removed", [])}
+        _write_cache(cache_fp, stat, digest, source["columns"], source["removed"])
+        return source
+    logger.info(f"Parsing {path}")
+    source = parse_source(path)
+    _write_cache(cache_fp, stat, digest, source["columns"], source["removed"])
+    return source
+
+
+@instrument()
+def merge_sources(sources, mode="patch"):
+    """
+    Merge parsed effect tables into one list of records, keyed on the
+    normalized (sslc) effect name. Later tables take precedence:
+
+    - an effect a later table defines again is overridden in place. In
+      "patch" mode only the cells the later table fills in are taken from
+      it (the name keeps its first spelling), in "replace" mode its row
+      replaces the earlier one whole
+    - effects new to a later table are added after the earlier ones
+    - effects a later table marks in its Remove column are dropped
+
+    :param sources: parse_source/load_source results, lowest precedence first
+    :param mode: one of merge_modes
+    """
+    if mode not in merge_modes:
+        raise ValueError(f"Merge mode must be one of {', '.join(merge_modes)}, got {mode!r}")
+    merged = {}
+    for source in sources:
+        for name in source["removed"]:
+            merged.pop(sslc(name), None)
+        cols = source["columns"]
+        for row in zip(*(cols[f] for f in columns.values())):
+            key = sslc(row[0])
+            old = merged.get(key)
+            if old is not None and mode == "patch":
+                # The name is only the key here, the effect keeps the spelling it was defined with
+                row = old[:1] + tuple(old_value if value is None else value
+                                      for value, old_value in zip(row[1:], old[1:]))
+            merged[key] = row
+    return [EffectRecord(*row) for row in merged.values()]
+
+
+class CatalogDiff(namedtuple("CatalogDiff", ["added", "removed", "changed"])):
+    """
+    Records added to and removed from a catalog, and (old, new) record pairs
+    for effects whose row changed, see diff_catalogs
+    """
+    __slots__ = ()
+
+
+@instrument()
+def diff_catalogs(old, new):
+    """
+    What changed between two catalogs, matching effects on their normalized name
+    """
+    old_keys = old._by_key
+    new_keys = new._by_key
+    added = tuple(rec for key, rec in new_keys.items() if key not in old_keys)
+    removed = tuple(rec for key, rec in old_keys.items() if key not in new_keys)
+    changed = tuple((rec, new_keys[key]) for key, rec in old_keys.items()
+                    if key in new_keys and new_keys[key] != rec)
+    return CatalogDiff(added, removed, changed)
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CatalogWatcher:
+    """
+    Watches effect tables for changes by polling their modification time and
+    size on a background thread. A changed table is reloaded (only it is
+    re-parsed, see EffectCatalog.load_sources) and compared with the last
+    catalog, and on_change(catalog, diff) is called from the watcher thread.
+
+    A table that can't be read, e.g. while it is still being saved, is
+    retried on the next poll.
+    """
+    def __init__(self, paths, on_change, catalog=None, interval=1.0, cache_dir=None, mode="patch"):
+        """
+        :param paths: effect tables, lowest precedence first
+        :param on_change: called with the new catalog and its CatalogDiff
+        :param catalog: catalog the tables were last loaded into, loaded now if not given
+        :param interval: seconds between polls
+        :param cache_dir: see EffectCatalog.load_sources
+        :param mode: see merge_sources
+        """
+        self.paths = list(paths)
+        self.on_change = on_change
+        self.interval = interval
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self._stats = [_stat_key(p) for p in self.paths]
+        self.catalog = catalog if catalog is not None else EffectCatalog.load_sources(self.paths, cache_dir, mode)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """
+        Poll once, reloading and reporting the changes if a table changed
+
+        :return: the CatalogDiff, or None if nothing changed
+        """
+        stats = [_stat_key(p) for p in self.paths]
+        if stats == self._stats:
+            return None
+        try:
+            catalog = EffectCatalog.load_sources(self.paths, self.cache_dir, self.mode)
+        except Exception as e:
+            logger.warning(f"Could not reload effect tables, will retry: {e}")
+            return None
+        self._stats = stats
+        diff = diff_catalogs(self.catalog, catalog)
+        self.catalog = catalog
+        if any(diff):
+            logger.info(f"Effect tables changed: {len(diff.added)} added, "
+                        f"{len(diff.removed)} removed, {len(diff.changed)} changed")
+            self.on_change(catalog, diff)
+        return diff
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Effect table watcher failed")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+@instrument()
+def shared_catalog(path, cache_dir=None):
+    """
+    The process-wide catalog for a table, or for a merge of tables, loaded on
+    first use and then handed out to every caller. Lookups after the first
+    load take no lock.
+
+    :param path: path to an effect table, or a list of them for load_sources
+    :param cache_dir: see EffectCatalog.load
+    """
+    # Looked up as given first, so repeat callers skip normalizing the paths
+    alias = path if isinstance(path, (str, os.PathLike)) else tuple(path)
+    catalog = _shared.get(alias)
+    if catalog is None:
+        paths = [path] if alias is path else list(alias)
+        key = tuple(os.path.abspath(p) for p in paths)
+        with _shared_lock:
+            catalog = _shared.get(key)
+            if catalog is None:
+                catalog = EffectCatalog.load_sources(paths, cache_dir)
+                _shared[key] = catalog
+            # Relative paths depend on the working directory, only alias absolute ones
+            if all(os.path.isabs(p) for p in paths):
+                _shared[alias] = catalog
+    return catalog
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cache_dir_for(path):
+    """
+    The cache lives next to the sheet, except in a PyInstaller build where the
+    sheet is unpacked to a temporary folder on every run
+    """
+    if not getattr(sys, 'frozen', False):
+        return os.path.dirname(os.path.abspath(path))
+    if sys.platform == "win32":
+        root = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        root = os.path.expanduser("~/Library/Caches")
+    else:
+        root = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(root, "obsm")
+
+
+def cache_path(path, cache_dir=None):
+    cache_dir = cache_dir if cache_dir is not None else cache_dir_for(path)
+    name, ext = os.path.splitext(os.path.basename(path))
+    # Sheets keep their original cache name, other tables keep their extension apart
+    if ext.lower() != ".xlsx":
+        name += ext
+    return os.path.join(cache_dir, f".{name}.cache")
+
+
+def _read_cache(cache_fp):
+    try:
+        with open(cache_fp, "rb") as f:
+            cached = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable effect cache {cache_fp}: {e}")
+        return None
+    if not isinstance(cached, dict) or cached.get("version") != cache_version:
+        return None
+    return cached
+
+
+def _write_cache(cache_fp, stat, digest, cols, removed=()):
+    cached = {"version": cache_version,
+              "mtime": stat.st_mtime_ns,
+              "size": stat.st_size,
+              "sha256": digest,
+              "columns": cols,
+              "removed": list(removed)}
+    tmp_fp = f"{cache_fp}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_fp), exist_ok=True)
+        with open(tmp_fp, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fp, cache_fp)
+    except OSError as e:
+        logger.warning(f"Could not write effect cache {cache_fp}: {e}")
+        if os.path.exists(tmp_fp):
+            os.remove(tmp_fp)
+
+
+if __name__ == "__main__":
+    # Cold vs warm startup comparison: python -m tool.obsm_catalog [sheet.xlsx]
+    import tempfile
+    import time
+    sheet = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "data", "obsm_effs.xlsx")
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        cold = EffectCatalog.load(sheet, cache_dir=tmp)
+        cold_s = time.perf_counter() - start
+        runs = 20
+        start = time.perf_counter()
+        for _ in range(runs):
+            warm = EffectCatalog.load(sheet, cache_dir=tmp)
+        warm_s = (time.perf_counter() - start) / runs
+    assert list(cold) == list(warm)
+    print(f"{len(cold)} effects from {sheet}")
+    print(f"cold (parse + write cache): {cold_s * 1000:8.2f} ms")
+    print(f"warm (cache hit):           {warm_s * 1000:8.2f} ms")
+    print(f"speedup:                    {cold_s / warm_s:8.1f}x")
@@ -0,0 +1,324 @@
+"""
+Price spells from the command line, without the GUI.
+
+Reads effect rows from CSV or JSONL (a file or stdin) and streams one result
+row per spell to stdout. Consecutive rows with the same "spell" value make up
+one spell, rows without one are each their own spell. A JSONL line may also
+hold a whole spell as {"spell": ..., "effects": [...], "skills": {...}}.
+
+    python -m tool.obsm_cli spells.csv --skill Destruction=50 > priced.csv
+    cat spells.jsonl | python -m tool.obsm_cli --workers 4 > priced.jsonl
+"""
+from collections import deque, namedtuple
+from itertools import chain, islice
+from logging import getLogger
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from tool import obsm_profile
+# --profile has to be seen before the instrumented modules are imported
+obsm_profile.enable_from_argv()
+from tool.obsm_calculator import Effect, Spell, calc_casting_cost, def_int, def_string, fp, sources
+from tool.obsm_catalog import shared_catalog
+logger = getLogger(__name__)
+
+schools = ["Alteration", "Conjuration", "Destruction", "Illusion", "Mysticism", "Restoration"]
+# Input field: accepted column names
+input_fields = {"effect": ("effect", "name", "Effect Name"),
+                "details": ("details",),
+                "mag": ("mag", "magnitude"),
+                "dur": ("dur", "duration"),
+                "area": ("area",),
+                "range": ("range",)}
+output_fields = ["spell", "total_cost", "gold_cost", "school", "skill_required", "casting_cost", "error"]
+
+# An input line that isn't a row, priced as an error row so the stream carries on
+BadLine = namedtuple("BadLine", ["line", "error"])
+
+_catalog = None
+
+
+def _init_worker(sheet):
+    global _catalog
+    _catalog = shared_catalog(sheet)
+
+
+def _field(row, name):
+    for column in input_fields[name]:
+        value = row.get(column)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _int(row, name):
+    value = _field(row, name)
+    return def_int if value is None else int(float(value))
+
+
+def _skills(row):
+    skills = {}
+    # Skills come either as one column per school or as a "skills" mapping
+    for school in schools:
+        if row.get(school) not in (None, ""):
+            skills[school] = float(row[school])
+    nested = row.get("skills")
+    if isinstance(nested, str) and nested:
+        nested = json.loads(nested)
+    if isinstance(nested, dict):
+        skills.update((k, float(v)) for k, v in nested.items() if k in schools)
+    return skills
+
+
+def read_rows(lines, fmt):
+    """
+    Yield input rows as dicts, and a BadLine for each JSONL line that isn't a JSON object
+
+    :param lines: iterable of text lines
+    :param fmt: "csv" or "jsonl"
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield BadLine(number, f"invalid JSON: {e}")
+            continue
+        if isinstance(row, dict):
+            yield row
+        else:
+            yield BadLine(number, f"expected a JSON object, got {type(row).__name__}")
+
+
+def group_spells(rows):
+    """
+    Yield (spell id, effect rows, skills) for each spell, one spell in memory at a time.
+    A BadLine ends the spell before it and is passed through as it is.
+    """
+    current, effects, skills = None, [], {}
+    count = 0
+    for row in rows:
+        if isinstance(row, BadLine):
+            if effects:
+                yield current, effects, skills
+                current, effects, skills = None, [], {}
+            yield row
+            continue
+        if "effects" in row:
+            # A whole spell on one line
+            if effects:
+                yield current, effects, skills
+                current, effects, skills = None, [], {}
+            count += 1
+            yield row.get("spell", count), row["effects"], _skills(row)
+            continue
+        spell_id = row.get("spell")
+        if spell_id in (None, ""):
+            spell_id = None
+        if effects and (spell_id is None or spell_id != current):
+            yield current, effects, skills
+            effects, skills = [], {}
+        if not effects:
+            count += 1
+            current = count if spell_id is None else spell_id
+        effects.append(row)
+        skills.update(_skills(row))
+    if effects:
+        yield current, effects, skills
+
+
+def spell_from_rows(catalog, effect_rows):
+    """
+    Build a Spell from effect rows, raising ValueError on an unknown effect
+    """
+    effs = []
+    for row in effect_rows:
+        name = _field(row, "effect")
+        rec = catalog.get(name) if name else None
+        if rec is None:
+            raise ValueError(f"unknown effect {name!r}")
+        effs.append(Effect(data=rec,
+                           details=_field(row, "details") or def_string,
+                           mag=_int(row, "mag"),
+                           dur=_int(row, "dur"),
+                           area=_int(row, "area"),
+                           range=_field(row, "range") or def_string))
+    return Spell(*effs)
+
+
+def price_spell(catalog, effect_rows, skills):
+    """
+    Price one spell built from effect rows
+
+    :return: dict of output fields, casting_cost is None unless skills cover every school used
+    """
+    spell = spell_from_rows(catalog, effect_rows)
+    school_cents = spell.school_cents
+    casting_cost = None
+    if all(school in skills for school in school_cents):
+        casting_cost = calc_casting_cost(school_cents, skills)
+    return {"total_cost": spell.total_cost,
+            "gold_cost": spell.gold_cost,
+            "school": spell.dominant_school,
+            "skill_required": spell.skill_required,
+            "casting_cost": casting_cost,
+            "error": None}
+
+
+def price_chunk(chunk, default_skills=None, catalog=None):
+    """
+    Price a list of (spell id, effect rows, skills), bad spells get an error instead of costs
+    and a BadLine gets an error row with its line number
+    """
+    catalog = catalog or _catalog
+    out = []
+    for item in chunk:
+        if isinstance(item, BadLine):
+            out.append({**dict.fromkeys(output_fields), "error": f"line {item.line}: {item.error}",
+                        "line": item.line})
+            continue
+        spell_id, effect_rows, skills = item
+        merged = dict(default_skills or {})
+        merged.update(skills)
+        try:
+            result = price_spell(catalog, effect_rows, merged)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            # Every output field but the spell id, which must not be blanked
+            result = dict.fromkeys(field for field in output_fields if field != "spell")
+            result["error"] = str(e)
+        out.append({"spell": spell_id, **result})
+    return out
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def price_stream(spells, sheet=sources, default_skills=None, workers=0, chunk_size=1000):
+    """
+    Yield a result dict per spell, in input order
+
+    :param sheet: effect table, or list of tables to merge (see EffectCatalog.load_sources)
+
+    With workers, chunks are priced in worker processes. Only a few chunks per
+    worker are in flight at once so memory stays bounded on any input size.
+    """
+    if workers <= 0:
+        catalog = shared_catalog(sheet)
+        for chunk in _chunks(spells, chunk_size):
+            yield from price_chunk(chunk, default_skills, catalog)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    # Load the sheet (and write its cache) once before the workers read it
+    shared_catalog(sheet)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(sheet,)) as pool:
+        pending = deque()
+        for chunk in _chunks(spells, chunk_size):
+            pending.append(pool.submit(price_chunk, chunk, default_skills))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_results(results, out, fmt):
+    """
+    Write result dicts to out as CSV or JSONL, returns the number of spells with errors
+    """
+    errors = 0
+    if fmt == "csv":
+        # The error column names the line of a bad input line, so its "line" key is left out
+        writer = csv.DictWriter(out, output_fields, lineterminator="\n", extrasaction="ignore")
+        writer.writeheader()
+        for result in results:
+            errors += result["error"] is not None
+            writer.writerow(result)
+    else:
+        for result in results:
+            errors += result["error"] is not None
+            out.write(json.dumps(result) + "\n")
+    return errors
+
+
+def _parse_skill(text):
+    school, _, level = text.partition("=")
+    if school not in schools or not level:
+        raise argparse.ArgumentTypeError(f"expected School=level with a school from {', '.join(schools)}")
+    return school, float(level)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tool.obsm_cli",
+                                     description="Price spells from CSV or JSONL effect rows")
+    parser.add_argument("input", nargs="?", default="-", help="input file, - or omitted for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file, - or omitted for stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="input format, guessed from the file extension or first line")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="defaults to the input format")
+    parser.add_argument("--skill", action="append", type=_parse_skill, default=[], metavar="SCHOOL=LEVEL",
+                        help="skill level used when a row doesn't give one, can be repeated")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 prices in this process")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="spells sent to a worker at a time")
+    parser.add_argument("--sheet", default=fp, help="effect table to price against")
+    parser.add_argument("--mod", action="append", default=[], metavar="TABLE",
+                        help="mod effect table (xlsx, csv, json) merged over the sheet, can be repeated, "
+                             "later ones take precedence and come after any in OBSM_MODS")
+    parser.add_argument("--profile", action="store_true",
+                        help="report call counts and timings on exit to stderr, --profile=PATH writes "
+                             "the report to PATH instead (.json for JSON)")
+    # Only the --profile=PATH form takes a path, so "--profile spells.csv" still reads spells.csv
+    argv = sys.argv[1:] if argv is None else list(argv)
+    profile_path = None
+    for i, arg in enumerate(argv):
+        if arg.startswith("--profile="):
+            profile_path = arg.partition("=")[2] or None
+            argv[i] = "--profile"
+    args = parser.parse_args(argv)
+    if args.profile:
+        obsm_profile.enable(profile_path)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+
+    src = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        first = src.readline()
+        fmt = args.format
+        if fmt is None:
+            ext = os.path.splitext(args.input)[1].lower()
+            if ext in (".jsonl", ".json", ".ndjson"):
+                fmt = "jsonl"
+            elif ext == ".csv":
+                fmt = "csv"
+            else:
+                fmt = "jsonl" if first.lstrip().startswith("{") else "csv"
+        spells = group_spells(read_rows(chain([first], src), fmt))
+        tables = [args.sheet] + sources[1:] + args.mod
+        results = price_stream(spells, tables, dict(args.skill), args.workers, args.chunk_size)
+        errors = write_results(results, dst, args.output_format or fmt)
+        dst.flush()
+    except BrokenPipeError:
+        # Reader went away (e.g. piped into head), stop quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    if errors:
+        logger.warning(f"{errors} spells could not be priced, see the error column")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,72 +1,216 @@
+import time
+# Taken first so the startup timings cover the imports too
+started = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk
+from bisect import insort
+import queue
+import sqlite3
 import sys
 import os
+import threading
 
 # Add the directory containing obsm_calculator.py to the path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from tool.obsm_calculator import SpellMaker
+from tool import obsm_profile
+# --profile has to be seen before the instrumented modules are imported
+obsm_profile.enable_from_argv()
+from tool.obsm_profile import instrument
+from tool.obsm_calculator import SpellMaker, group_effects, sort_modes, sources
+from tool.obsm_catalog import CatalogWatcher, EffectCatalog, shared_catalog
+from tool.obsm_search import SearchIndex, SearchSession
+from tool.obsm_spellbook import Spellbook, default_path as spellbook_path
 
-spell_maker = SpellMaker(skills={"Alteration": 5, "Conjuration": 5, "Destruction": 5, "Illusion": 5, "Mysticism": 5, "Restoration": 5})
+# The catalog is loaded in the background once the window is up, see _load_catalog
+spell_maker = SpellMaker(skills={"Alteration": 5, "Conjuration": 5, "Destruction": 5, "Illusion": 5, "Mysticism": 5, "Restoration": 5},
+                         catalog=EffectCatalog(()))
 
-def has_details(eff_name):
-    return "Skill" in eff_name or "Attribute" in eff_name
+# Effect list geometry: every group header and effect button is one row
+row_height = 28
 
-def has_dur_only(eff_name):
-    # Check if effect name includes "Bound" or "Summon" exactly or as substring
-    return any(word in eff_name for word in ["Bound", "Summon", "Night"])
 
+@instrument()
 def create_main_buttons(scrollable_frame, right_frame, button_dict, canvas):
-    for group, labels in button_dict.items():
-        # Container for the whole group
-        group_container = ttk.Frame(scrollable_frame)
-        group_container.pack(fill="x", pady=5)
-
-        # Group header
-        header = ttk.Frame(group_container)
-        header.pack(fill="x")
-
-        header_label = ttk.Label(header, text=f"▼ {group}", font=("Segoe UI", 10, "bold"))
-        header_label.pack(side="left", padx=5)
-
-        # Frame that holds the effect buttons
-        inner_frame = ttk.Frame(group_container)
-        inner_frame.pack(fill="x", padx=10)
-
-        # Toggle collapse/expand
-        def toggle(event, header_label=header_label, inner_frame=inner_frame, group=group):
-            if inner_frame.winfo_manager():
-                inner_frame.pack_forget()
-                header_label.config(text=f"▶ {group}")
-            else:
-                inner_frame.pack(fill="x", padx=10)  # no 'after=header'
-                header_label.config(text=f"▼ {group}")
+    """
+    Lay out button_dict ({group: [effect names]}) as a view of the left pane's
+    effect list. The list is virtual: only rows inside the canvas viewport get
+    widgets, taken from a pool shared by every view and recycled on scroll.
+    The list's frame is only as tall as the viewport and scrolling is done by
+    hand, as X11 clips window coordinates past 32767 px, about 1170 rows.
+
+    :return: the view, shown with _show_view
+    """
+    if not hasattr(scrollable_frame, "effect_list"):
+        effect_list = scrollable_frame.effect_list = ttk.Frame(scrollable_frame, height=0)
+        effect_list.pack(fill="x")
+        effect_list.pool = {"header": [], "button": []}
+        effect_list.shown = {}
+        effect_list.views = {}
+        effect_list.view = None
+        effect_list.search_view = None
+        effect_list.on_click = lambda label: add_effect(scrollable_frame, right_frame, label)
+    view = {"groups": button_dict, "collapsed": set(), "rows": [], "top": 0}
+    _flatten_view(view)
+    return view
+
+
+def _flatten_view(view):
+    rows = view["rows"] = []
+    for group, labels in view["groups"].items():
+        rows.append(("header", group))
+        if group not in view["collapsed"]:
+            rows.extend(("button", label) for label in labels)
+
+
+def _show_view(view):
+    scrollable_frame.effect_list.view = view
+    canvas.yview_moveto(0)
+    _scroll_list(view["top"])
+
+
+def _list_shown():
+    effect_list = getattr(scrollable_frame, "effect_list", None)
+    return effect_list is not None and effect_list.view is not None and bool(effect_list.winfo_manager())
+
+
+def _scroll_list(top):
+    """
+    Scroll the shown view so its row pixel top is at the top of the viewport
+    """
+    effect_list = scrollable_frame.effect_list
+    view = effect_list.view
+    viewport = canvas.winfo_height()
+    total = len(view["rows"]) * row_height
+    view["top"] = max(0, min(top, total - viewport))
+    # The canvas itself doesn't scroll while the list is shown
+    effect_list.configure(height=viewport)
+    canvas.configure(scrollregion=(0, 0, canvas.winfo_width(), viewport))
+    _render_rows()
+    if total > viewport:
+        scrollbar.set(view["top"] / total, (view["top"] + viewport) / total)
+    else:
+        scrollbar.set(0, 1)
 
-        header_label.bind("<Button-1>", toggle)
 
-        # Create buttons for each effect
-        for label in labels:
-            button = ttk.Button(inner_frame, text=label, command=lambda l=label: add_effect(scrollable_frame, right_frame, l))
-            button.pack(fill="x", pady=1)
+def _yview(*args):
+    """
+    Scrollbar and mouse wheel scrolling: the effect list's own, or the canvas's for an effect form
+    """
+    if not _list_shown():
+        canvas.yview(*args)
+        return
+    view = scrollable_frame.effect_list.view
+    if args[0] == "moveto":
+        top = float(args[1]) * len(view["rows"]) * row_height
+    else:
+        step = row_height if args[2] == "units" else canvas.winfo_height()
+        top = view["top"] + int(args[1]) * step
+    _scroll_list(top)
 
-def refresh_buttons():
-    for widget in scrollable_frame.winfo_children():
-        widget.destroy()
-    grouped = sort_effects_grouped(button_labels, sort_mode.get())
-    create_main_buttons(scrollable_frame, right_frame, grouped, canvas)
 
+def _hide_effect_list():
+    scrollable_frame.effect_list.pack_forget()
+
+
+def _toggle_group(group):
+    view = scrollable_frame.effect_list.view
+    view["collapsed"] ^= {group}
+    _flatten_view(view)
+    _show_view(view)
+
+
+def _row_widget(effect_list, kind):
+    pool = effect_list.pool[kind]
+    if pool:
+        return pool.pop()
+    if kind == "header":
+        widget = ttk.Label(effect_list, font=("Segoe UI", 10, "bold"))
+        widget.bind("<Button-1>", lambda e, w=widget: _toggle_group(w.group))
+    else:
+        widget = ttk.Button(effect_list)
+        widget.configure(command=lambda w=widget: effect_list.on_click(w.effect))
+    widget.kind = kind
+    return widget
+
+
+@instrument()
+def _render_rows():
+    """
+    Give widgets to the rows in (or near) the viewport and recycle the rest
+    """
+    effect_list = scrollable_frame.effect_list
+    view = effect_list.view
+    if view is None or not effect_list.winfo_manager():
+        return
+    rows = view["rows"]
+    top = view["top"]
+    first = int(top // row_height)
+    last = min(len(rows), int((top + canvas.winfo_height()) // row_height) + 1)
+
+    shown = effect_list.shown
+    for i in list(shown):
+        if not first <= i < last or shown[i].kind != rows[i][0]:
+            widget = shown.pop(i)
+            widget.place_forget()
+            effect_list.pool[widget.kind].append(widget)
+    for i in range(first, last):
+        kind, text = rows[i]
+        widget = shown.get(i)
+        if widget is None:
+            widget = shown[i] = _row_widget(effect_list, kind)
+        # Rows sit relative to the viewport, so they all move on every scroll
+        y = i * row_height - top
+        if kind == "header":
+            widget.place(x=5, y=y, height=row_height)
+            widget.group = text
+            _set_text(widget, ("▶ " if text in view["collapsed"] else "▼ ") + text)
+        else:
+            widget.place(x=10, y=y + 1, relwidth=1, width=-20, height=row_height - 2)
+            widget.effect = text
+            _set_text(widget, text)
+
+
+def _on_list_scroll(first, last):
+    # The effect list keeps the scrollbar itself
+    if not _list_shown():
+        scrollbar.set(first, last)
+
+
+@instrument()
+def refresh_buttons():
+    """
+    Show the effect buttons for the current sort mode. Each mode is grouped
+    once and cached, so switching modes or leaving an effect form is a swap
+    """
+    mode = sort_mode.get()
+    views = scrollable_frame.effect_list.views if hasattr(scrollable_frame, "effect_list") else {}
+    view = views.get(mode)
+    if view is None:
+        view = create_main_buttons(scrollable_frame, right_frame, sort_effects_grouped(button_labels, mode), canvas)
+        scrollable_frame.effect_list.views[mode] = view
+    effect_list = scrollable_frame.effect_list
+    if effect_list.search_view is not None:
+        view = effect_list.search_view
+    if not effect_list.winfo_manager():
+        effect_list.pack(fill="x")
+    _show_view(view)
+
+@instrument()
 def add_effect(left_frame, right_frame, clicked_text):
-    # Clear entire left pane content first:
+    # Hide the effect buttons (kept for when the form closes) and clear anything else
+    _hide_effect_list()
     for widget in left_frame.winfo_children():
-        widget.destroy()
+        if widget is not left_frame.effect_list:
+            widget.destroy()
     # Continue
     widgets = []
     slider_data = []
     dropdown_value = tk.StringVar(value="Choose one..")
     range_value = tk.StringVar(value="Self")
 
-    dur_only = has_dur_only(clicked_text)
+    rec = spell_maker.catalog.get(clicked_text)
+    dur_only = rec.dur_only
 
     slider_ranges = {
         "Magnitude": (3, 100),
@@ -187,7 +331,7 @@ def add_effect(left_frame, right_frame, clicked_text):
     # Save button declared here to work with disable logic
     save_button = ttk.Button(left_frame, text="Save", command=save)
 
-    has_dropdown = has_details(clicked_text)
+    has_dropdown = rec.has_details
     if has_dropdown:
         dropdown_label = ttk.Label(left_frame, text="Select an option:")
         dropdown_label.pack()
@@ -231,7 +375,7 @@ def add_effect(left_frame, right_frame, clicked_text):
         range_dropdown['values'] = ("Self",)
         range_value.set("Self")
         range_dropdown.state(["readonly"])
-    elif "Absorb" in clicked_text:
+    elif rec.touch_only:
         range_dropdown['values'] = ("Touch",)
         range_value.set("Touch")
         range_dropdown.state(["readonly"])
@@ -258,29 +402,71 @@ def add_effect(left_frame, right_frame, clicked_text):
     left_frame.main_buttons = [save_button, cancel_button]
     canvas.yview_moveto(0)
 
-def update_saved_display(right_frame):
-    for widget in skills_frame.winfo_children():
-        widget.destroy()
+# Model changes waiting to be applied: {Effect: params}, {skill: level}, and the flush callbacks
+pending = {"effects": {}, "skills": {}, "jobs": []}
+# Longest a change waits for its recompute when the event queue never goes idle, in ms
+max_recompute_delay = 50
 
-    debounce_timers = {}
 
-    def on_skill_change(skill_name, var):
-        def delayed_update():
-            try:
-                new_val = int(var.get())
-                spell_maker.skills[skill_name] = new_val
-                spell_maker.casting_cost = spell_maker._calc_cost()
-                update_saved_display(right_frame)
-            except ValueError:
-                pass
+def schedule_effect_update(eff, **params):
+    """
+    Queue new settings for an effect on the spell, later ones win
+    """
+    pending["effects"].setdefault(eff, {}).update(params)
+    _schedule_flush()
+
+
+def schedule_skill_update(skill, level):
+    # Entries echo levels set by a flush back through their trace, those are no change
+    if pending["skills"].get(skill, spell_maker.skills.get(skill)) != level:
+        pending["skills"][skill] = level
+        _schedule_flush()
+
 
-        if skill_name in debounce_timers:
-            right_frame.after_cancel(debounce_timers[skill_name])
-        debounce_timers[skill_name] = right_frame.after(500, delayed_update)  # 500 ms delay
+def _schedule_flush():
+    # Flush on the next idle cycle, or after max_recompute_delay if the user keeps the queue busy
+    if not pending["jobs"]:
+        pending["jobs"] = [root.after_idle(_flush_pending), root.after(max_recompute_delay, _flush_pending)]
 
-    if spell_maker.skills:
-        skills = list(spell_maker.skills.items())
-        for i, (skill, value) in enumerate(skills):
+
+@instrument()
+def _flush_pending():
+    """
+    Apply every queued change, recompute the costs once and redraw once
+    """
+    for job in pending["jobs"]:
+        root.after_cancel(job)
+    pending["jobs"] = []
+    effects, skills = pending["effects"], pending["skills"]
+    if not effects and not skills:
+        return
+    pending["effects"], pending["skills"] = {}, {}
+    if effects and spell_maker.current_spell:
+        spell_maker.current_spell.update_effects(effects)
+    spell_maker.skills.update(skills)
+    spell_maker.casting_cost = spell_maker._calc_cost()
+    update_saved_display(right_frame)
+
+
+def _on_skill_change(skill_name, var):
+    try:
+        schedule_skill_update(skill_name, int(var.get()))
+    except ValueError:
+        pass
+
+
+def _update_skill_rows(right_frame):
+    """
+    One entry per skill, rebuilt only when the set of skills changes
+    """
+    rows = getattr(skills_frame, "rows", None)
+    if rows is None or list(rows) != list(spell_maker.skills):
+        for widget in skills_frame.winfo_children():
+            widget.destroy()
+        rows = skills_frame.rows = {}
+        if not spell_maker.skills:
+            ttk.Label(skills_frame, text="No skills set.").pack(anchor='w')
+        for i, (skill, value) in enumerate(spell_maker.skills.items()):
             row = i // 3
             col = i % 3
 
@@ -294,42 +480,111 @@ def update_saved_display(right_frame):
             entry = ttk.Entry(frame, textvariable=var, width=5)
             entry.pack(side='left')
 
-            var.trace_add("write", lambda *_, sk=skill, v=var: on_skill_change(sk, v))
-    else:
-        ttk.Label(skills_frame, text="No skills set.").pack(anchor='w')
-
-    for widget in summary_frame.winfo_children():
-        widget.destroy()
-
+            var.trace_add("write", lambda *_, sk=skill, v=var: _on_skill_change(sk, v))
+            # Entry variable and the skill value it last showed
+            rows[skill] = [var, value]
+        return
+    for skill, row in rows.items():
+        value = spell_maker.skills[skill]
+        # Only overwrite the entry if the skill changed elsewhere, not while it's being typed in
+        if value != row[1]:
+            row[1] = value
+            if row[0].get() != str(value):
+                row[0].set(str(value))
+
+
+def _set_text(label, text):
+    # Only touch the widget if what it shows actually changed
+    if getattr(label, "shown", None) != text:
+        label.configure(text=text)
+        label.shown = text
+
+
+def _update_summary():
+    if not hasattr(summary_frame, "spell_label"):
+        summary_frame.spell_label = ttk.Label(summary_frame, justify='left')
+        summary_frame.spell_label.pack(anchor='w')
+        summary_frame.cost_label = ttk.Label(summary_frame)
+    cost_label = summary_frame.cost_label
     if spell_maker.current_spell:
-        ttk.Label(summary_frame, text=str(spell_maker.current_spell), justify='left').pack(anchor='w')
-
+        _set_text(summary_frame.spell_label, str(spell_maker.current_spell))
         # Add casting cost (modified by skill)
-        cost_label = ttk.Label(summary_frame, text=f"Casting Cost (Skill Modified): {spell_maker.casting_cost:.2f}")
-        cost_label.pack(anchor='w')
+        _set_text(cost_label, f"Casting Cost (Skill Modified): {spell_maker.casting_cost:.2f}")
+        if not cost_label.winfo_manager():
+            cost_label.pack(anchor='w')
     else:
-        ttk.Label(summary_frame, text="No spell created.").pack(anchor='w')
-
-    for widget in right_frame.winfo_children():
-        widget.destroy()
-
-    if not spell_maker.current_spell or not spell_maker.current_spell.effects:
-        ttk.Label(right_frame, text="No effects in spell.").pack()
-        return
+        _set_text(summary_frame.spell_label, "No spell created.")
+        if cost_label.winfo_manager():
+            cost_label.pack_forget()
+
+
+def _effect_index(eff):
+    # Rows outlive index shifts, so look the effect up when its button is pressed
+    return spell_maker.current_spell.effects.index(eff)
+
+
+def _update_effect_rows(right_frame):
+    """
+    One row per effect on the spell. Rows are matched to effects by identity:
+    only rows whose effect text changed are relabelled, and rows are only
+    created, destroyed or repacked when effects are added, removed or moved.
+    """
+    if not hasattr(right_frame, "effect_rows"):
+        right_frame.effect_rows = {}
+        right_frame.row_order = []
+        right_frame.empty_label = ttk.Label(right_frame, text="No effects in spell.")
+    rows = right_frame.effect_rows
+    effects = spell_maker.current_spell.effects if spell_maker.current_spell else []
+
+    order = [id(eff) for eff in effects]
+    live = dict(zip(order, effects))
+    for key in list(rows):
+        if live.get(key) is not rows[key].eff:
+            rows.pop(key).destroy()
+    packed = [key for key in right_frame.row_order if key in rows]
+
+    for key, eff in live.items():
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = ttk.Frame(right_frame)
+            row.eff = eff
+            row.pack(fill='x', pady=2, padx=5)
+            packed.append(key)
+
+            row.label = ttk.Label(row)
+            _set_text(row.label, str(eff))
+            row.label.pack(side='left', expand=True, anchor='w')
+
+            edit_btn = ttk.Button(row, text="Edit",
+                                  command=lambda e=eff: edit_entry(_effect_index(e), right_frame, scrollable_frame))
+            edit_btn.pack(side='right', padx=2)
+
+            delete_btn = ttk.Button(row, text="Delete", command=lambda e=eff: delete_entry(_effect_index(e), right_frame))
+            delete_btn.pack(side='right', padx=2)
+        else:
+            _set_text(row.label, str(eff))
 
-    for idx, eff in enumerate(spell_maker.current_spell.effects):
-        frame = ttk.Frame(right_frame)
-        frame.pack(fill='x', pady=2, padx=5)
+    if packed != order:
+        # An effect moved, put the rows back in spell order
+        for key in order:
+            rows[key].pack_forget()
+        for key in order:
+            rows[key].pack(fill='x', pady=2, padx=5)
+    right_frame.row_order = order
 
-        label = ttk.Label(frame, text=str(eff))
-        label.pack(side='left', expand=True, anchor='w')
+    if effects:
+        right_frame.empty_label.pack_forget()
+    elif not right_frame.empty_label.winfo_manager():
+        right_frame.empty_label.pack()
 
-        edit_btn = ttk.Button(frame, text="Edit", command=lambda i=idx: edit_entry(i, right_frame, scrollable_frame))
-        edit_btn.pack(side='right', padx=2)
 
-        delete_btn = ttk.Button(frame, text="Delete", command=lambda i=idx: delete_entry(i, right_frame))
-        delete_btn.pack(side='right', padx=2)
+@instrument()
+def update_saved_display(right_frame):
+    _update_skill_rows(right_frame)
+    _update_summary()
+    _update_effect_rows(right_frame)
 
+@instrument()
 def edit_entry(index, right_frame, left_frame):
     eff = spell_maker.current_spell.effects[index]
 
@@ -339,14 +594,6 @@ def edit_entry(index, right_frame, left_frame):
     edit_win.transient(main_window)
     edit_win.grab_set()
 
-    update_timer = None
-
-    def debounced_apply_update():
-        nonlocal update_timer
-        if update_timer:
-            edit_win.after_cancel(update_timer)
-        update_timer = edit_win.after(100, apply_live_update)
-
     def center_edit_window():
         right_x = right_frame.winfo_rootx()
         right_y = right_frame.winfo_rooty()
@@ -398,7 +645,7 @@ def edit_entry(index, right_frame, left_frame):
         "Area": (0, 100),
     }
 
-    dur_only = has_dur_only(eff.name)
+    dur_only = eff.record.dur_only
     sliders_to_show = ["Duration"] if dur_only else ["Magnitude", "Duration", "Area"]
     label_to_attr = {"Magnitude": "mag", "Duration": "dur", "Area": "area"}
 
@@ -414,11 +661,10 @@ def edit_entry(index, right_frame, left_frame):
                     "area": round(area_var.get() / 5) * 5
                 }
             params["range"] = range_value.get()
-            if has_details(eff.name):
+            if eff.record.has_details:
                 params["details"] = dropdown_var.get()
 
-            spell_maker.update_spell(eff.name, **params)
-            update_saved_display(right_frame)
+            schedule_effect_update(eff, **params)
         except (ValueError, tk.TclError):
             pass
 
@@ -434,7 +680,7 @@ def edit_entry(index, right_frame, left_frame):
         frame.pack(fill='x', pady=2)
 
         var = tk.IntVar(value=val)
-        var.trace_add("write", lambda *args: debounced_apply_update())
+        var.trace_add("write", lambda *args: apply_live_update())
         var_dict[label] = var
 
         entry = ttk.Entry(frame, width=5, textvariable=var)
@@ -469,7 +715,6 @@ def edit_entry(index, right_frame, left_frame):
         # Connect events
         def on_slider_change(val, var=var):
             var.set(int(float(val)))
-            debounced_apply_update()
 
         s.config(command=on_slider_change)
         minus_btn.config(command=lambda v=var, sc=s, lbl=label: step(-1, label=lbl, var=v, scale=sc))
@@ -480,14 +725,13 @@ def edit_entry(index, right_frame, left_frame):
     area_var = var_dict.get("Area", tk.IntVar(value=0))
 
     range_value = tk.StringVar(value=eff.range)
-    range_value.trace_add("write", lambda *args: debounced_apply_update())
     ttk.Label(content_frame, text="Range:").pack()
     range_dropdown = ttk.Combobox(content_frame, textvariable=range_value)
     if dur_only:
         range_dropdown['values'] = ("Self",)
         range_value.set("Self")
         range_dropdown.state(["readonly"])
-    elif "Absorb" in eff.name:
+    elif eff.record.touch_only:
         range_dropdown['values'] = ("Touch",)
         range_value.set("Touch")
         range_dropdown.state(["readonly"])
@@ -496,8 +740,8 @@ def edit_entry(index, right_frame, left_frame):
     range_dropdown.pack()
 
     dropdown_var = tk.StringVar(value=eff.details)
-    if has_details(eff.name):
-        dropdown_var.trace_add("write", lambda *args: debounced_apply_update())
+    if eff.record.has_details:
+        dropdown_var.trace_add("write", lambda *args: apply_live_update())
         ttk.Label(content_frame, text="Details:").pack()
         ddl = ttk.Combobox(content_frame, textvariable=dropdown_var)
         if "Attribute" in eff.name:
@@ -508,15 +752,238 @@ def edit_entry(index, right_frame, left_frame):
                              "Acrobatics", "Light Armor", "Marksman", "Mercantile", "Security", "Sneak", "Speechcraft")
         ddl.pack()
 
+    # Traced last, once every setting above exists
+    range_value.trace_add("write", lambda *args: apply_live_update())
+
+@instrument()
 def delete_entry(index, right_frame):
     eff = spell_maker.current_spell.effects[index]
     spell_maker.current_spell.remove_effect(eff.name, eff.details)
     update_saved_display(right_frame)
 
+def _spellbook():
+    # Opened on first use, so a missing or locked file doesn't hold up startup
+    book = getattr(book_frame, "book", None)
+    if book is None:
+        book = book_frame.book = Spellbook(spellbook_path)
+        book_names.configure(values=book.names())
+    return book
+
+
+def _list_book_names():
+    # Run as the name list drops down, which is when the book is first opened
+    try:
+        _spellbook()
+    except sqlite3.Error as e:
+        _set_text(book_status, f"Could not open the spellbook: {e}")
+
+
+def save_to_book():
+    name = book_name.get().strip()
+    # Edits still waiting for their recompute go into the saved spell too
+    _flush_pending()
+    if not spell_maker.current_spell or not spell_maker.current_spell.effects:
+        _set_text(book_status, "No spell to save.")
+        return
+    if not name:
+        _set_text(book_status, "Name the spell to save it.")
+        return
+    try:
+        book = _spellbook()
+        book.save(name, spell_maker.current_spell)
+    except sqlite3.Error as e:
+        _set_text(book_status, f"Could not save: {e}")
+        return
+    book_names.configure(values=book.names())
+    _set_text(book_status, f"Saved {name}.")
+
+
+def load_from_book():
+    name = book_name.get().strip()
+    if not len(spell_maker.catalog):
+        _set_text(book_status, "Effects are still loading.")
+        return
+    try:
+        spell = _spellbook().load(name, spell_maker.catalog)
+    except sqlite3.Error as e:
+        _set_text(book_status, f"Could not load: {e}")
+        return
+    if spell is None:
+        _set_text(book_status, f"No spell named {name}.")
+        return
+    _flush_pending()
+    spell_maker.current_spell = spell if spell.effects else None
+    spell_maker.casting_cost = spell_maker._calc_cost()
+    update_saved_display(right_frame)
+    _set_text(book_status, f"Loaded {name}.")
+
+# Catalog loading: effect names added to the list per main loop tick, and how often the loader is polled, in ms
+populate_chunk = 200
+load_poll_ms = 20
+# Most search results shown at once
+search_limit = 2000
+catalog_queue = queue.Queue()
+# --watch (or OBSM_WATCH=1) reloads the effect tables when they change: seconds
+# between checks, and how often reloads are picked up by the main loop, in ms
+watch = "--watch" in sys.argv[1:] or os.environ.get("OBSM_WATCH", "") not in ("", "0")
+watch_interval = 1.0
+reload_poll_ms = 250
+reload_queue = queue.Queue()
+
+
+def _load_catalog():
+    # Worker thread: only touches the queue, Tk is left to the main loop
+    try:
+        catalog = shared_catalog(sources)
+        catalog_queue.put((catalog, SearchIndex(catalog)))
+    except Exception as e:
+        catalog_queue.put(e)
+
+
+def _poll_catalog():
+    try:
+        result = catalog_queue.get_nowait()
+    except queue.Empty:
+        root.after(load_poll_ms, _poll_catalog)
+        return
+    if isinstance(result, Exception):
+        loading_label.configure(text=f"Could not load effects:\n{result}")
+        return
+    obsm_profile.record("gui.catalog_loaded", time.perf_counter() - started)
+    catalog, index = result
+    spell_maker.catalog = catalog
+    search_entry.session = SearchSession(index)
+    if search_var.get().strip():
+        _on_search()
+    _populate_buttons(catalog.names, 0)
+
+
+def _populate_buttons(names, start):
+    """
+    Add the next chunk of names to the effect list, then yield to the main loop
+    """
+    _add_effect_names(names[start:start + populate_chunk])
+    start += populate_chunk
+    if start < len(names):
+        loading_label.configure(text=f"Loading effects… {start}/{len(names)}")
+        root.after(1, _populate_buttons, names, start)
+    else:
+        loading_label.pack_forget()
+        obsm_profile.record("gui.buttons_populated", time.perf_counter() - started)
+        if watch:
+            root.watcher = CatalogWatcher(sources, _on_catalog_change, spell_maker.catalog, watch_interval).start()
+            root.after(reload_poll_ms, _poll_reloads)
+
+
+def _on_catalog_change(catalog, diff):
+    # Watcher thread: build the new search index here too, then hand everything to the main loop
+    reload_queue.put((catalog, diff, SearchIndex(catalog)))
+
+
+def _poll_reloads():
+    # Reloads are applied in order, each diff is against the catalog before it
+    while True:
+        try:
+            catalog, diff, index = reload_queue.get_nowait()
+        except queue.Empty:
+            break
+        _apply_reload(catalog, diff, index)
+    root.after(reload_poll_ms, _poll_reloads)
+
+
+@instrument()
+def _apply_reload(catalog, diff, index):
+    """
+    Switch to a reloaded catalog: reprice the effects on the spell whose rows
+    changed, and move only the buttons of effects that were added, removed,
+    renamed or regrouped
+    """
+    spell_maker.swap_catalog(catalog, diff)
+    search_entry.session = SearchSession(index)
+    moved = [(old, new) for old, new in diff.changed
+             if (old.name, old.school, old.function) != (new.name, new.school, new.function)]
+    _remove_effect_names([rec.name for rec in diff.removed] + [old.name for old, _ in moved])
+    _add_effect_names([rec.name for rec in diff.added] + [new.name for _, new in moved])
+    if search_var.get().strip():
+        _on_search()
+    update_saved_display(right_frame)
+
+
+@instrument()
+def _add_effect_names(names):
+    """
+    Add effect names to every cached view in sorted place, and redraw the one shown
+    """
+    button_labels.extend(names)
+    effect_list = scrollable_frame.effect_list
+    for mode, view in effect_list.views.items():
+        groups = view["groups"]
+        for group, labels in sort_effects_grouped(names, mode).items():
+            if group in groups:
+                for label in labels:
+                    insort(groups[group], label)
+            else:
+                groups[group] = list(labels)
+        view["groups"] = dict(sorted(groups.items()))
+        _flatten_view(view)
+    if effect_list.view is not None and effect_list.winfo_manager():
+        _show_view(effect_list.view)
+
+
+@instrument()
+def _remove_effect_names(names):
+    """
+    Take effect names out of every cached view, the shown one is redrawn by _add_effect_names
+    """
+    gone = set(names)
+    if not gone:
+        return
+    button_labels[:] = [label for label in button_labels if label not in gone]
+    for view in scrollable_frame.effect_list.views.values():
+        groups = view["groups"]
+        for group, labels in list(groups.items()):
+            if gone.isdisjoint(labels):
+                continue
+            labels = [label for label in labels if label not in gone]
+            if labels:
+                groups[group] = labels
+            else:
+                del groups[group]
+        _flatten_view(view)
+
+
+@instrument()
+def _on_search(*_):
+    """
+    Filter the effect list down to the matches for the search box, best first
+    """
+    query = search_var.get().strip()
+    session = getattr(search_entry, "session", None)
+    effect_list = scrollable_frame.effect_list
+    if query and session is not None:
+        names = session.update(query, limit=search_limit)
+        header = f"{len(names)} match" + ("" if len(names) == 1 else "es")
+        if len(names) == search_limit:
+            header = "First " + header
+        effect_list.search_view = create_main_buttons(scrollable_frame, right_frame, {header: names}, canvas)
+    else:
+        effect_list.search_view = None
+    # While an effect form is open the list stays hidden, closing the form shows the results
+    if effect_list.winfo_manager():
+        refresh_buttons()
+
+
+def _on_first_map(event):
+    if event.widget is root and not hasattr(root, "painted"):
+        root.painted = True
+        obsm_profile.record("gui.time_to_first_paint", time.perf_counter() - started)
+
+
 # === GUI Initialization ===
 root = tk.Tk()
 root.title("Spell Maker")
 root.geometry("800x500")
+root.bind("<Map>", _on_first_map)
 style = ttk.Style()
 style.configure("Header.TButton", font=("Segoe UI", 10, "bold"))
 
@@ -525,38 +992,31 @@ paned.pack(fill=tk.BOTH, expand=True)
 
 sort_mode = tk.StringVar(value="Alphabetical")
 
+@instrument()
 def sort_effects_grouped(labels, mode):
-    if mode == "Alphabetical":
-        grouped = {"A–Z": sorted(labels)}
-    elif mode == "By School":
-        grouped = {}
-        for label in labels:
-            school = spell_maker.get_effect_school(label) or "Unknown"
-            grouped.setdefault(school, []).append(label)
-        for k in grouped:
-            grouped[k].sort()
-    elif mode == "By Function":
-        grouped = {}
-        for label in labels:
-            function = spell_maker.get_effect_function(label) or "Unknown"
-            grouped.setdefault(function, []).append(label)
-        for k in grouped:
-            grouped[k].sort()
-    else:
-        grouped = {"All": labels}
-    return dict(sorted(grouped.items()))  # Sort groups alphabetically or numerically
+    return group_effects(spell_maker, labels, mode)
 
 
 left_outer = ttk.Frame(paned, width=170)
 left_outer.pack_propagate(False)
 
 canvas = tk.Canvas(left_outer, borderwidth=0, width=150)
-scrollbar = ttk.Scrollbar(left_outer, orient="vertical", command=canvas.yview)
+scrollbar = ttk.Scrollbar(left_outer, orient="vertical", command=_yview)
 scrollable_frame = ttk.Frame(canvas)
 
 scrollable_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-canvas.configure(yscrollcommand=scrollbar.set)
+list_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
+canvas.configure(yscrollcommand=_on_list_scroll)
+
+
+def _on_canvas_resize(event):
+    # Stretch the pane's content to the canvas, the effect list places its rows by width
+    canvas.itemconfigure(list_window, width=event.width)
+    if _list_shown():
+        _scroll_list(scrollable_frame.effect_list.view["top"])
+
+
+canvas.bind("<Configure>", _on_canvas_resize)
 
 sort_frame = ttk.Frame(left_outer)
 sort_frame.pack(fill='x', pady=5)
@@ -565,21 +1025,35 @@ ttk.Label(sort_frame, text="Sort by:").pack(side='left', padx=(5, 2))
 
 sort_dropdown = ttk.OptionMenu(
     sort_frame, sort_mode, sort_mode.get(),
-    "Alphabetical", "By School", "By Function",
+    *sort_modes,
     command=lambda _: refresh_buttons()
 )
 sort_dropdown.pack(side='left', padx=2)
 
+search_frame = ttk.Frame(left_outer)
+search_frame.pack(fill='x', pady=(0, 5))
+
+ttk.Label(search_frame, text="Search:").pack(side='left', padx=(5, 2))
+
+search_var = tk.StringVar()
+search_entry = ttk.Entry(search_frame, textvariable=search_var)
+search_entry.pack(side='left', fill='x', expand=True, padx=(0, 5))
+search_var.trace_add("write", _on_search)
+search_entry.bind("<Escape>", lambda e: search_var.set(""))
+
+loading_label = ttk.Label(left_outer, text="Loading effects…")
+loading_label.pack(fill='x', padx=5)
+
 
 canvas.pack(side="left", fill="both", expand=True)
 scrollbar.pack(side="right", fill="y")
 
 def _on_mousewheel(event):
-    canvas.yview_scroll(int(-1*(event.delta/120)), "units")
+    _yview("scroll", int(-1*(event.delta/120)), "units")
 
 scrollable_frame.bind_all("<MouseWheel>", _on_mousewheel)
-scrollable_frame.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-scrollable_frame.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
+scrollable_frame.bind_all("<Button-4>", lambda e: _yview("scroll", -1, "units"))
+scrollable_frame.bind_all("<Button-5>", lambda e: _yview("scroll", 1, "units"))
 
 paned.add(left_outer, weight=1)
 
@@ -595,11 +1069,32 @@ right_frame.pack(fill='both', expand=True)
 summary_frame = ttk.Frame(right_container, relief=tk.GROOVE, padding=5)
 summary_frame.pack(fill='x')
 
+book_frame = ttk.Frame(right_container, padding=5)
+book_frame.pack(fill='x')
+
+ttk.Label(book_frame, text="Spellbook:").pack(side='left')
+
+book_name = tk.StringVar()
+# Saved names are listed once the book is opened, when the list is first dropped down
+book_names = ttk.Combobox(book_frame, textvariable=book_name, width=24, postcommand=_list_book_names)
+book_names.pack(side='left', padx=2)
+
+ttk.Button(book_frame, text="Save", command=save_to_book).pack(side='left', padx=2)
+ttk.Button(book_frame, text="Load", command=load_from_book).pack(side='left', padx=2)
+
+book_status = ttk.Label(book_frame)
+book_status.pack(side='left', padx=5)
+
 paned.add(right_container, weight=5)
 
-button_labels = spell_maker.df["Effect Name"].dropna().unique().tolist()
-sorted_labels = sort_effects_grouped(button_labels, sort_mode.get())
-create_main_buttons(scrollable_frame, right_frame, sorted_labels, canvas)
+button_labels = []
+refresh_buttons()
 update_saved_display(right_frame)
+threading.Thread(target=_load_catalog, name="catalog-loader", daemon=True).start()
+root.after(load_poll_ms, _poll_catalog)
+
+if obsm_profile.enabled:
+    # Report on demand, the full report is also printed on exit
+    root.bind("<F12>", lambda e: print(obsm_profile.report(), file=sys.stderr))
 
 root.mainloop()
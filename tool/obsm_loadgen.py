@@ -0,0 +1,140 @@
+"""
+Load generator for obsm_server, measures throughput on one machine.
+
+    python -m tool.obsm_loadgen --spawn --clients 64 --seconds 10
+    python -m tool.obsm_loadgen --port 8765 --route batch --batch-size 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+from tool.obsm_calculator import sources
+from tool.obsm_catalog import shared_catalog
+
+schools = ["Alteration", "Conjuration", "Destruction", "Illusion", "Mysticism", "Restoration"]
+
+
+def random_spell(rng, names):
+    effects = []
+    for name in rng.sample(names, rng.randint(1, 4)):
+        effects.append({"name": name,
+                        "details": "Luck" if "Attribute" in name else "Blade",
+                        "mag": rng.randint(3, 100),
+                        "dur": rng.randint(1, 100),
+                        "area": rng.randrange(0, 101, 5),
+                        "range": rng.choice(["Self", "Touch", "Target"])})
+    return {"effects": effects, "skills": {s: rng.randint(5, 100) for s in schools}}
+
+
+def make_body(route, rng, names, batch_size):
+    if route == "price":
+        return random_spell(rng, names)
+    if route == "batch":
+        return {"spells": [random_spell(rng, names) for _ in range(batch_size)]}
+    return {"effects": [{"name": n, "range": "Target"} for n in rng.sample(names, rng.randint(1, 2))],
+            "objective": "mag", "max_cost": rng.randint(50, 400)}
+
+
+async def request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        if key.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, route, seconds, seed, names, batch_size, latencies, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    end = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < end:
+            body = make_body(route, rng, names, batch_size)
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, "POST", f"/{route}", body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(host, port, route, clients, seconds, batch_size):
+    names = shared_catalog(sources).names
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, route, seconds, i, names, batch_size, latencies, errors)
+                           for i in range(clients)])
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    _, stats = await request(reader, writer, "GET", "/stats")
+    writer.close()
+    lat = np.array(latencies) * 1000
+    per_request = batch_size if route == "batch" else 1
+    return {"route": route,
+            "clients": clients,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "requests_per_s": round(len(latencies) / elapsed, 1),
+            "spells_per_s": round(len(latencies) * per_request / elapsed, 1),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3) if len(lat) else None,
+            "p99_ms": round(float(np.percentile(lat, 99)), 3) if len(lat) else None,
+            "server": stats["result"]}
+
+
+async def wait_for_port(host, port, timeout=30):
+    end = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > end:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure obsm_server throughput")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--spawn", action="store_true", help="start a server for the run")
+    parser.add_argument("--route", choices=["price", "batch", "fit"], default="price")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=100, help="spells per /batch request")
+    args = parser.parse_args(argv)
+
+    proc = None
+    if args.spawn:
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        proc = subprocess.Popen([sys.executable, "-m", "tool.obsm_server",
+                                 "--host", args.host, "--port", str(args.port)], cwd=root)
+    try:
+        asyncio.run(wait_for_port(args.host, args.port))
+        result = asyncio.run(run(args.host, args.port, args.route, args.clients, args.seconds, args.batch_size))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
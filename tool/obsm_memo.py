@@ -0,0 +1,127 @@
+from collections import OrderedDict, namedtuple
+from functools import update_wrapper
+from logging import getLogger
+import os
+import threading
+logger = getLogger(__name__)
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+# OBSM_MEMO=0 turns every memo off, e.g. for benchmarking the raw calculations
+enabled = os.environ.get("OBSM_MEMO", "1") not in ("0", "false", "off")
+memos = []
+_missing = object()
+
+
+class Memo:
+    """
+    Bounded memo table for a pure function of hashable arguments.
+
+    When full the least recently used result is dropped. Hits, misses and
+    evictions are counted so it can be checked whether the memo pays off.
+    """
+    # __dict__ holds the wrapped function's __doc__, __name__ and so on
+    __slots__ = ("func", "name", "maxsize", "enabled", "hits", "misses", "evictions",
+                 "_data", "_lock", "__dict__")
+
+    def __init__(self, func, maxsize=4096, name=None):
+        """
+        :param func: function to memoize, its positional arguments are the key
+        :param maxsize: most results kept, must be at least 1
+        :param name: label used in reports, defaults to the function's name
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.func = func
+        update_wrapper(self, func)
+        self.name = name or func.__name__
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        memos.append(self)
+
+    def __call__(self, *args, **kwargs):
+        # Only positional calls are keyed, anything else goes straight through
+        if kwargs or not self.enabled:
+            return self.func(*args, **kwargs)
+        data = self._data
+        with self._lock:
+            value = data.get(args, _missing)
+            if value is not _missing:
+                data.move_to_end(args)
+                self.hits += 1
+                return value
+        value = self.func(*args)
+        with self._lock:
+            self.misses += 1
+            data[args] = value
+            if len(data) > self.maxsize:
+                data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
+
+    def clear(self):
+        """
+        Drop every stored result and reset the counters
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def resize(self, maxsize):
+        """
+        Change the size limit, evicting the oldest results if it shrinks
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+
+def memoize(maxsize=4096):
+    """
+    Decorator form of Memo
+    """
+    def wrap(func):
+        return Memo(func, maxsize)
+    return wrap
+
+
+def set_enabled(flag):
+    """
+    Turn every memo on or off, stored results are kept while off
+    """
+    global enabled
+    enabled = bool(flag)
+    for memo in memos:
+        memo.enabled = enabled
+
+
+def stats():
+    """
+    Name: CacheInfo for every memo
+    """
+    return {memo.name: memo.info() for memo in memos}
+
+
+def report():
+    """
+    The stats as a text table, for the profile report
+    """
+    lines = [f"{'memo':44} {'hits':>8} {'misses':>8} {'hit rate':>9} {'evictions':>10} {'stored':>13}"]
+    for name, info in stats().items():
+        total = info.hits + info.misses
+        rate = info.hits / total if total else 0.0
+        lines.append(f"{name:44} {info.hits:>8} {info.misses:>8} {rate:>9.1%} {info.evictions:>10} "
+                     f"{f'{info.currsize}/{info.maxsize}':>13}")
+    return "\n".join(lines)
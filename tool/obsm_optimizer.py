@@ -0,0 +1,451 @@
+from bisect import bisect_right
+from collections import namedtuple
+from logging import getLogger
+import numpy as np
+from tool.obsm_batch import mag_factor, round2
+from tool.obsm_calculator import (Effect, Spell, calc_casting_cost, casting_multiplier, def_int,
+                                  def_string, no_mag_default, skill_reqs)
+logger = getLogger(__name__)
+
+# Same ranges as the GUI sliders: (min, max, step)
+slider_ranges = {"mag": (3, 100, 1),
+                 "dur": (1, 100, 1),
+                 "area": (0, 100, 5)}
+
+objectives = {"mag": {"mag": 1},
+              "dur": {"dur": 1},
+              "area": {"area": 1}}
+
+# Cheapest settings for each reachable score of one effect, sorted by cost in cents
+Frontier = namedtuple("Frontier", ["cents", "score", "mag", "dur", "area"])
+
+
+def param_values(rec, spec, param, ranges=None, weights=None):
+    """
+    Values a parameter can take for an effect: fixed if given in spec, else
+    the slider range. Effects without magnitude/area only get one value.
+
+    Cost never goes down as a parameter goes up, so a parameter that doesn't
+    count towards the objective is pinned to its minimum.
+    """
+    # Effect ignores the magnitude of effects without one, so a given value would misprice them
+    if param == "mag" and not rec.has_mag:
+        return np.array([no_mag_default])
+    if param in spec:
+        return np.array([spec[param]])
+    if param == "area" and rec.dur_only:
+        return np.array([0])
+    lo, hi, step = (ranges or slider_ranges)[param]
+    if weights is not None and not weights.get(param, 0) > 0:
+        return np.array([lo])
+    return np.arange(lo, hi + 1, step)
+
+
+def effect_frontier(rec, spec, weights, ranges=None):
+    """
+    Pareto frontier of cost vs score for one effect over the whole
+    mag × dur × area grid. Cost is monotonic in every parameter, so only the
+    cheapest way of reaching each score is worth keeping.
+    """
+    mags = param_values(rec, spec, "mag", ranges, weights)
+    durs = param_values(rec, spec, "dur", ranges, weights)
+    areas = param_values(rec, spec, "area", ranges, weights)
+    target = 1.5 if spec.get("range", "Self") == "Target" else 1
+    base = rec.get("Base Cost", 0)
+    # Same operations in the same order as calc_eff_cost
+    cost = round2(base / 10.0 *
+                  mag_factor(mags)[:, None, None] *
+                  np.maximum(durs, 1)[None, :, None] *
+                  np.maximum(areas * 0.15, 1)[None, None, :] *
+                  target).ravel()
+    score = (weights.get("mag", 0) * mags[:, None, None] +
+             weights.get("dur", 0) * durs[None, :, None] +
+             weights.get("area", 0) * areas[None, None, :]).ravel().astype(np.float64)
+    # Cheapest first, highest score first among equal costs
+    order = np.lexsort((-score, cost))
+    cost, score = cost[order], score[order]
+    best_before = np.concatenate(([-np.inf], np.maximum.accumulate(score)[:-1]))
+    keep = score > best_before
+    mi, di, ai = np.unravel_index(order[keep], (len(mags), len(durs), len(areas)))
+    return Frontier(cents=np.rint(cost[keep] * 100).astype(np.int64).tolist(),
+                    score=score[keep].tolist(),
+                    mag=mags[mi].tolist(),
+                    dur=durs[di].tolist(),
+                    area=areas[ai].tolist())
+
+
+class _Limits:
+    """
+    The budget checks, evaluated on running totals in cents the same way
+    Spell and SpellMaker keep them so they agree exactly
+    """
+    def __init__(self, max_cost, max_gold, skill, max_casting_cost, skills):
+        self.max_cost = max_cost
+        self.max_gold = max_gold
+        self.skill_cap = skill_reqs[skill] if skill is not None else None
+        self.max_casting_cost = max_casting_cost
+        self.skills = skills
+
+    def ok_total(self, total_cents):
+        """
+        The checks on the spell's total cost alone
+        """
+        total = total_cents / 100
+        if self.max_cost is not None and total > self.max_cost:
+            return False
+        if self.max_gold is not None and int(total * 3) > self.max_gold:
+            return False
+        if self.skill_cap is not None and not total < self.skill_cap:
+            return False
+        return True
+
+    def total_cap(self):
+        """
+        Most cents the spell may cost in total, None if only casting cost is limited
+        """
+        if self.max_cost is None and self.max_gold is None and self.skill_cap is None:
+            return None
+        # The checks are monotonic in the total, so bisect on it
+        lo, hi = 0, 1 << 53
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ok_total(mid):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def ok(self, total_cents, school_cents):
+        if not self.ok_total(total_cents):
+            return False
+        if (self.max_casting_cost is not None and
+                calc_casting_cost(school_cents, self.skills) > self.max_casting_cost):
+            return False
+        return True
+
+    def add(self, school_cents, school, cents):
+        """
+        Per-school costs with an effect added, only tracked for casting cost
+        """
+        if self.max_casting_cost is None:
+            return None
+        return dict(school_cents, **{school: school_cents.get(school, 0) + cents})
+
+    def last_ok(self, front, school, total_cents, school_cents):
+        """
+        Index of the most expensive frontier point that still fits, -1 if none.
+        Every check is monotonic in the added cost, so bisect on it.
+        """
+        lo, hi = 0, len(front.cents)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            c = front.cents[mid]
+            if self.ok(total_cents + c, self.add(school_cents, school, c)):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+
+def _normalize(eff):
+    return {"name": eff} if isinstance(eff, str) else dict(eff)
+
+
+def optimize_spell(catalog, effects, objective="mag", max_cost=None, max_gold=None,
+                   skill=None, skills=None, max_casting_cost=None, ranges=None):
+    """
+    Find the strongest settings for a set of effects that stay under a budget.
+
+    :param catalog: EffectCatalog to look effects up in
+    :param effects: effect names, or dicts with "name" and optionally "details",
+                    "range" (default "Self") and fixed "mag"/"dur"/"area" values
+    :param objective: "mag", "dur", "area" or a dict of weights such as {"mag": 1, "dur": 0.5},
+                      summed over all effects
+    :param max_cost: maximum unmodified magicka cost
+    :param max_gold: maximum gold cost
+    :param skill: skill tier from skill_reqs the spell must not exceed
+    :param skills: dict of school: skill level, needed for max_casting_cost
+    :param max_casting_cost: maximum skill-modified casting cost
+    :param ranges: override for slider_ranges
+    :return: the best Spell, or None if nothing fits
+    """
+    weights = objectives[objective] if isinstance(objective, str) else objective
+    limits = _Limits(max_cost, max_gold, skill, max_casting_cost, skills)
+    specs = [_normalize(eff) for eff in effects]
+    recs = []
+    for spec in specs:
+        rec = catalog.get(spec["name"])
+        if rec is None:
+            logger.warning(f"Effect [{spec['name']}] not found")
+            return None
+        recs.append(rec)
+    schools = [rec.get("School", def_string) for rec in recs]
+    if max_casting_cost is not None:
+        missing = set(schools) - (skills or {}).keys()
+        if missing:
+            logger.warning(f"Cannot limit casting cost, missing skills: {sorted(missing)}")
+            return None
+    fronts = [effect_frontier(rec, spec, weights, ranges) for rec, spec in zip(recs, specs)]
+
+    picks = _search(fronts, schools, limits)
+    if picks is None:
+        return None
+    spell = Spell(*[Effect(data=rec,
+                           details=spec.get("details", def_string),
+                           mag=front.mag[j], dur=front.dur[j], area=front.area[j],
+                           range=spec.get("range", "Self"))
+                    for rec, spec, front, j in zip(recs, specs, fronts, picks)])
+    return spell
+
+
+def _hull_segments(front, weight):
+    """
+    Steps along the upper concave hull of a frontier, from its cheapest point:
+    (added weighted cost, added score), best score per cost first. Taking
+    steps in that order, the last one possibly in part, gives the most score
+    any mix of the frontier's points can reach for a cost.
+    """
+    hull = [0]
+    for j in range(1, len(front.cents)):
+        while len(hull) > 1:
+            a, b = hull[-2], hull[-1]
+            # b is under the line from a to j
+            if ((front.score[b] - front.score[a]) * (front.cents[j] - front.cents[a]) <=
+                    (front.score[j] - front.score[a]) * (front.cents[b] - front.cents[a])):
+                hull.pop()
+            else:
+                break
+        hull.append(j)
+    return [((front.cents[b] - front.cents[a]) * weight, front.score[b] - front.score[a])
+            for a, b in zip(hull, hull[1:])]
+
+
+class _Relaxation:
+    """
+    Fractional (LP) relaxation of the remaining choice under one linear budget:
+    every remaining effect starts at its cheapest point, then hull steps of
+    all of them are taken best score per cost first until the budget runs out.
+    This is the LP bound of the multiple-choice knapsack, so it never
+    underestimates the score the remaining effects can reach.
+    """
+    def __init__(self, fronts, weights, cap):
+        """
+        :param weights: cost weight of each effect, its cents count this many times
+        :param cap: the budget, in weighted cents
+        """
+        n = len(fronts)
+        self.cap = cap
+        # Per suffix of the effects: cost and score of their cheapest points, and
+        # the running sums of their hull steps in the order they are taken
+        self.base_cost, self.base_score, self.step_cost, self.step_score = [], [], [], []
+        for k in range(n):
+            steps = sorted((step for i in range(k, n) for step in _hull_segments(fronts[i], weights[i])),
+                           key=lambda step: -step[1] / step[0])
+            cost = score = 0.0
+            costs, scores = [], []
+            for dc, ds in steps:
+                cost += dc
+                score += ds
+                costs.append(cost)
+                scores.append(score)
+            self.base_cost.append(sum(fronts[i].cents[0] * weights[i] for i in range(k, n)))
+            self.base_score.append(sum(fronts[i].score[0] for i in range(k, n)))
+            self.step_cost.append(costs)
+            self.step_score.append(scores)
+
+    def bound(self, k, spent):
+        """
+        Most score effects k.. can add with spent already used, None if even
+        their cheapest points don't fit
+        """
+        room = self.cap - spent - self.base_cost[k]
+        if room < 0:
+            return None
+        costs, scores = self.step_cost[k], self.step_score[k]
+        i = bisect_right(costs, room)
+        score = self.base_score[k] + (scores[i - 1] if i else 0.0)
+        if i < len(costs):
+            # Part of the next step
+            prev_cost, prev_score = (costs[i - 1], scores[i - 1]) if i else (0.0, 0.0)
+            score += (scores[i] - prev_score) * (room - prev_cost) / (costs[i] - prev_cost)
+        return score
+
+
+def _search(fronts, schools, limits):
+    """
+    Branch and bound over the effects' frontiers, in spell order.
+
+    The last effect is picked by bisection; earlier effects are cut off as
+    soon as the LP bound of the rest (see _Relaxation) can't beat the best
+    spell found. The total cost and the casting cost each give a relaxation,
+    the tighter of the two is used.
+    """
+    n = len(fronts)
+    best = {"key": (-np.inf, 0), "picks": None}
+    picks = [0] * n
+    relaxations = []
+    total_cap = limits.total_cap()
+    if total_cap is not None:
+        relaxations.append((_Relaxation(fronts, [1] * n, total_cap), [1] * n))
+    if limits.max_casting_cost is not None:
+        # Casting cost is each effect's cents times its school's multiplier, rounded
+        # to a cent at the end: anything within half a cent of the limit may pass
+        mults = [casting_multiplier(limits.skills[school]) for school in schools]
+        relaxations.append((_Relaxation(fronts, mults, limits.max_casting_cost * 100 + 0.5 + 1e-6), mults))
+    # Float slack when comparing bounds to scores, so ties are never cut off
+    slack = 1e-9
+
+    def bound(k, spent):
+        if not relaxations:
+            return sum(fronts[i].score[-1] for i in range(k, n))
+        ub = np.inf
+        for (relaxation, _), used in zip(relaxations, spent):
+            b = relaxation.bound(k, used)
+            if b is None:
+                return None
+            ub = min(ub, b)
+        return ub
+
+    def visit(k, total, school_cents, spent, score):
+        front, school = fronts[k], schools[k]
+        top = limits.last_ok(front, school, total, school_cents)
+        if top < 0:
+            return
+        if k == n - 1:
+            c = front.cents[top]
+            key = (score + front.score[top], -(total + c))
+            if key > best["key"]:
+                picks[k] = top
+                best["key"] = key
+                best["picks"] = list(picks)
+            return
+        # The rest can never do better than with this effect's cost left out
+        rest_ub = bound(k + 1, spent)
+        if rest_ub is None:
+            return
+        # Try the strongest settings first so good incumbents show up early
+        for j in range(top, -1, -1):
+            if score + front.score[j] + rest_ub < best["key"][0] - slack:
+                # Scores only drop further down the frontier
+                break
+            c = front.cents[j]
+            new_spent = [used + c * weights[k] for used, (_, weights) in zip(spent, relaxations)]
+            ub = bound(k + 1, new_spent)
+            if ub is None or score + front.score[j] + ub < best["key"][0] - slack:
+                continue
+            picks[k] = j
+            visit(k + 1, total + c, limits.add(school_cents, school, c), new_spent, score + front.score[j])
+
+    if n:
+        visit(0, 0, {}, [0] * len(relaxations), 0.0)
+    return best["picks"]
+
+
+# Inverse of each parameter's factor in calc_eff_cost, above its floor of 1
+_inverse = {"mag": lambda f: f ** (1 / 1.28),
+            "dur": lambda f: f,
+            "area": lambda f: f / 0.15}
+_max_value = 2147483647
+
+
+def _max_free(rec, free, params, limit, strict, spent, step, hi):
+    """
+    Largest multiple of step for the free parameter that keeps the effect
+    within the limit, -1 where even 0 doesn't fit.
+
+    The cost formula is solved for the free parameter directly, then the
+    estimate is nudged by a step or two against the exact rounded cost.
+    """
+    if free not in _inverse:
+        raise ValueError(f"Can only solve for mag, dur or area, not {free}")
+    if free == "mag" and not rec.has_mag:
+        raise ValueError(f"{rec.name} has no magnitude")
+    p = {"mag": params.get("mag", def_int),
+         "dur": params.get("dur", def_int),
+         "area": params.get("area", def_int)}
+    if not rec.has_mag:
+        p["mag"] = no_mag_default
+    target = 1.5 if params.get("range", def_string) == "Target" else 1
+    base = rec.get("Base Cost", 0)
+    cap = _max_value if hi is None else hi
+    shape = np.broadcast(*(np.asarray(v) for k, v in p.items() if k != free)).shape or (1,)
+
+    def cost(x):
+        q = dict(p, **{free: x})
+        return round2(base / 10.0 *
+                      mag_factor(np.broadcast_to(q["mag"], shape)) *
+                      np.maximum(q["dur"], 1) *
+                      np.maximum(np.asarray(q["area"]) * 0.15, 1) *
+                      target)
+
+    def fits(x):
+        # Summed in cents like Spell does
+        total = (round(spent * 100) + np.rint(cost(x) * 100)) / 100
+        return total < limit if strict else total <= limit
+
+    # Everything but the free parameter, then the most that factor may be
+    # while the rounded cost still stays under the limit
+    factors = {"mag": mag_factor(np.broadcast_to(p["mag"], shape)),
+               "dur": np.maximum(p["dur"], 1),
+               "area": np.maximum(np.asarray(p["area"]) * 0.15, 1)}
+    factors[free] = 1.0
+    others = base / 10.0 * factors["mag"] * factors["dur"] * factors["area"] * target
+    with np.errstate(divide="ignore", invalid="ignore"):
+        room = (limit - spent + 0.005) / others
+        est = np.where(room >= 1, _inverse[free](np.maximum(room, 1)), 0)
+    x = (np.floor(np.minimum(est, cap) / step) * step).astype(np.int64)
+    x = np.broadcast_to(x, shape).copy()
+    # Correct the float estimate against the exact cost
+    while True:
+        up = (x + step <= cap) & fits(x + step)
+        if not up.any():
+            break
+        x[up] += step
+    while True:
+        down = (x >= 0) & ~fits(np.maximum(x, 0))
+        if not down.any():
+            break
+        x[down] -= step
+    return np.where(x < 0, -1, x)
+
+
+def _limit(max_cost, skill):
+    if (max_cost is None) == (skill is None):
+        raise ValueError("Give exactly one of max_cost and skill")
+    # A skill tier is a strict upper bound, see Spell._determine_skill_req
+    return (max_cost, False) if skill is None else (skill_reqs[skill], True)
+
+
+def max_param(rec, free, max_cost=None, skill=None, spent=0, step=1, hi=None, **params):
+    """
+    Largest value of one parameter an effect can have within a budget,
+    e.g. how long can Fortify Health 20 last for 62 magicka.
+
+    :param rec: EffectRecord of the effect
+    :param free: the parameter to solve for, "mag", "dur" or "area"
+    :param max_cost: magicka the effect may cost
+    :param skill: skill tier from skill_reqs the effect must stay within, instead of max_cost
+    :param spent: cost of the rest of the spell, counted against the budget
+    :param step: only return multiples of step, e.g. 5 for area
+    :param hi: upper bound for the answer, e.g. the slider maximum
+    :param params: mag, dur, area and range for everything but the free parameter
+    :return: int, or None if even 0 doesn't fit
+    """
+    limit, strict = _limit(max_cost, skill)
+    x = int(_max_free(rec, free, params, limit, strict, spent, step, hi)[0])
+    return None if x < 0 else x
+
+
+def param_frontier(rec, free, over, values, max_cost=None, skill=None, spent=0, step=1, hi=None,
+                   **params):
+    """
+    max_param for every value of a second parameter at once, e.g. the
+    longest duration for each magnitude from 3 to 100.
+
+    :param over: the parameter being swept, "mag", "dur" or "area"
+    :param values: values of the swept parameter
+    :return: np.ndarray of the free parameter's maximum per value, -1 where nothing fits
+    """
+    limit, strict = _limit(max_cost, skill)
+    params = dict(params, **{over: np.asarray(values)})
+    return _max_free(rec, free, params, limit, strict, spent, step, hi)
@@ -0,0 +1,166 @@
+"""
+Opt-in instrumentation of the hot paths.
+
+Set OBSM_PROFILE=1 (or pass --profile to the GUI/CLI) to record call counts,
+timings and allocations of every instrumented function, and print a report
+when the process exits, followed by the hit rates of the obsm_memo tables.
+OBSM_PROFILE_FILE=path.json writes the function stats as JSON instead. When off, instrument() hands back the function untouched, so there
+is no cost at all.
+
+Profiling has to be turned on before the instrumented modules are imported.
+"""
+from collections import deque
+from functools import wraps
+import atexit
+import json
+import os
+import sys
+import time
+from tool import obsm_memo
+
+enabled = os.environ.get("OBSM_PROFILE", "") not in ("", "0", "false", "off")
+# Percentiles are taken over each function's most recent calls
+window = 100_000
+# name: [calls, total seconds, recent durations, net allocated blocks]
+_stats = {}
+_exit_hook = False
+
+
+def _new_stat():
+    return [0, 0.0, deque(maxlen=window), 0]
+
+
+def enable(path=None):
+    """
+    Turn profiling on for functions instrumented from now on and report at exit
+
+    :param path: file for the exit report, JSON if it ends in .json, default stderr
+    """
+    global enabled, _exit_hook
+    enabled = True
+    if path:
+        os.environ["OBSM_PROFILE_FILE"] = path
+    if not _exit_hook:
+        atexit.register(_report_at_exit)
+        _exit_hook = True
+
+
+def enable_from_argv(argv=None):
+    """
+    Turn profiling on if --profile or --profile=path is in argv
+    """
+    for arg in (sys.argv if argv is None else argv)[1:]:
+        if arg == "--profile" or arg.startswith("--profile="):
+            enable(arg.partition("=")[2] or None)
+            return True
+    return False
+
+
+def instrument(name=None):
+    """
+    Decorator recording calls of a function under name (default: its qualified name)
+    """
+    def wrap(func):
+        if not enabled:
+            return func
+        key = name or f"{func.__module__.rpartition('.')[2]}.{func.__qualname__}"
+        stat = _stats.setdefault(key, _new_stat())
+        clock = time.perf_counter
+        blocks = sys.getallocatedblocks
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            b0 = blocks()
+            t0 = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                dt = clock() - t0
+                stat[0] += 1
+                stat[1] += dt
+                stat[2].append(dt)
+                stat[3] += blocks() - b0
+        return timed
+    return wrap
+
+
+def record(name, seconds):
+    """
+    Add a measurement taken by hand, e.g. a time to first paint
+    """
+    if enabled:
+        stat = _stats.setdefault(name, _new_stat())
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2].append(seconds)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def stats():
+    """
+    name: {"calls", "total_s", "mean_s", "p50_s", "p95_s", "p99_s", "max_s", "alloc_blocks"}
+    alloc_blocks is the net number of memory blocks left allocated per call, on average
+    """
+    out = {}
+    for key, (calls, total, durations, net_blocks) in _stats.items():
+        if not calls:
+            continue
+        ordered = sorted(durations)
+        out[key] = {"calls": calls,
+                    "total_s": total,
+                    "mean_s": total / calls,
+                    "p50_s": _percentile(ordered, 50),
+                    "p95_s": _percentile(ordered, 95),
+                    "p99_s": _percentile(ordered, 99),
+                    "max_s": ordered[-1],
+                    "alloc_blocks": net_blocks / calls}
+    return out
+
+
+def reset():
+    for stat in _stats.values():
+        stat[:] = _new_stat()
+
+
+def report():
+    """
+    The stats as a text table, slowest total first
+    """
+    rows = sorted(stats().items(), key=lambda kv: kv[1]["total_s"], reverse=True)
+    lines = [f"{'function':44} {'calls':>8} {'total ms':>10} {'mean µs':>9} {'p50 µs':>9} "
+             f"{'p99 µs':>9} {'max µs':>10} {'blocks':>7}"]
+    for key, s in rows:
+        lines.append(f"{key:44} {s['calls']:>8} {s['total_s'] * 1e3:>10.2f} {s['mean_s'] * 1e6:>9.1f} "
+                     f"{s['p50_s'] * 1e6:>9.1f} {s['p99_s'] * 1e6:>9.1f} {s['max_s'] * 1e6:>10.1f} "
+                     f"{s['alloc_blocks']:>7.1f}")
+    if obsm_memo.memos:
+        lines += ["", obsm_memo.report()]
+    return "\n".join(lines)
+
+
+def dump(path=None):
+    """
+    Write the report to path (JSON if it ends in .json) or to stderr
+    """
+    if path and path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(stats(), f, indent=2)
+    elif path:
+        with open(path, "w") as f:
+            f.write(report() + "\n")
+    else:
+        print(report(), file=sys.stderr)
+
+
+def _report_at_exit():
+    dump(os.environ.get("OBSM_PROFILE_FILE"))
+
+
+if enabled:
+    enable()
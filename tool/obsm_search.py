@@ -0,0 +1,267 @@
+"""
+Search over the effect catalog's names, schools and functions.
+
+The index is built once per catalog. A query is normalized like catalog
+keys (sslc) and matched as, best first:
+
+    0  the whole name
+    1  a prefix of the name
+    2  a prefix of a word in the name
+    3  a substring of the name
+    4  a substring of the effect's school or function
+    5  fuzzy: names sharing enough trigrams with the query (typos)
+
+Ties go to the shorter name, then alphabetical order.
+"""
+from bisect import bisect_left
+from heapq import nsmallest
+from logging import getLogger
+from tool.obsm_catalog import sslc
+from tool.obsm_profile import instrument
+logger = getLogger(__name__)
+
+# Longest n-gram in the substring index, queries this long or shorter are one posting lookup
+gram_size = 3
+# Fuzzy matches need at least this trigram similarity (Dice coefficient) to the query
+fuzzy_threshold = 0.4
+# Fuzzy matching only runs when there are fewer exact matches than this
+fuzzy_below = 10
+
+tiers = ("name", "name prefix", "word prefix", "substring", "school/function", "fuzzy")
+
+
+def _grams(key, n):
+    return {key[i:i + n] for i in range(len(key) - n + 1)}
+
+
+def _word_trigrams(key):
+    # Each word padded like pg_trgm, so matching word starts and ends count for more
+    grams = set()
+    for word in key.split():
+        grams |= _grams(f"  {word} ", 3)
+    return grams
+
+
+class SearchIndex:
+    """
+    Read-only search index over an EffectCatalog, safe to share between threads
+    """
+    def __init__(self, catalog):
+        self.names = catalog.names
+        keys = self._keys = [sslc(name) for name in self.names]
+        # Equal matches go to the shorter name, then alphabetically: each effect's
+        # place in that order, and the effect at each place
+        by_place = sorted(range(len(keys)), key=lambda i: (len(keys[i]), keys[i]))
+        self._place = [0] * len(keys)
+        for place, i in enumerate(by_place):
+            self._place[i] = place
+        self._by_place = by_place
+        # Prefix index: every name from each of its words on, sorted
+        words = []
+        for i, key in enumerate(keys):
+            start = 0
+            while start != -1:
+                words.append((key[start:], i))
+                start = key.find(" ", start)
+                start = start + 1 if start != -1 else -1
+        words.sort()
+        self._words = words
+        self._word_keys = [w for w, _ in words]
+        # Substring index: every 1..gram_size-gram of every name
+        postings = {}
+        for i, key in enumerate(keys):
+            for n in range(1, gram_size + 1):
+                for gram in _grams(key, n):
+                    postings.setdefault(gram, []).append(i)
+        self._postings = postings
+        # Fuzzy index: padded word trigrams of every name
+        trigrams = {}
+        counts = []
+        for i, key in enumerate(keys):
+            grams = _word_trigrams(key)
+            counts.append(len(grams))
+            for gram in grams:
+                trigrams.setdefault(gram, []).append(i)
+        self._trigrams = trigrams
+        self._trigram_counts = counts
+        # Normalized school/function: effects with it
+        fields = {}
+        for i, rec in enumerate(catalog):
+            for value in (rec.school, rec.function):
+                if value:
+                    fields.setdefault(sslc(value), set()).add(i)
+        self._fields = fields
+
+    def __len__(self):
+        return len(self.names)
+
+    @instrument()
+    def prefix(self, query):
+        """
+        Effects with a word (or the whole name) starting with query
+
+        :return: effect id: tier (0, 1 or 2)
+        """
+        q = sslc(query)
+        found = {}
+        lo = bisect_left(self._word_keys, q)
+        hi = bisect_left(self._word_keys, q + "\U0010ffff", lo)
+        keys = self._keys
+        for word, i in self._words[lo:hi]:
+            tier = 2 if len(word) != len(keys[i]) else (0 if word == q else 1)
+            if tier < found.get(i, 3):
+                found[i] = tier
+        return found
+
+    def _candidates(self, q):
+        """
+        Effects whose name could contain q, from the n-gram postings
+
+        :return: (effect ids, whether they all contain q)
+        """
+        if len(q) <= gram_size:
+            return self._postings.get(q, ()), True
+        # Intersect the postings of q's trigrams, rarest first
+        lists = sorted((self._postings.get(g, ()) for g in _grams(q, gram_size)), key=len)
+        if not lists[0]:
+            return (), True
+        ids = set(lists[0])
+        for posting in lists[1:]:
+            ids.intersection_update(posting)
+            if not ids:
+                break
+        return ids, False
+
+    @instrument()
+    def matches(self, query, within=None):
+        """
+        Effects matching query exactly as a name prefix, substring or school/function
+
+        :param within: effect ids to check instead of the whole index, e.g. the
+            matches of a shorter query this one extends
+        :return: effect id: tier (0 to 4)
+        """
+        q = sslc(query)
+        if not q:
+            return {}
+        found = self.prefix(q)
+        if within is None:
+            candidates, certain = self._candidates(q)
+        else:
+            found = {i: tier for i, tier in found.items() if i in within}
+            candidates, certain = within, False
+        keys = self._keys
+        for i in candidates:
+            if i not in found and (certain or q in keys[i]):
+                found[i] = 3
+        for value, ids in self._fields.items():
+            if q in value:
+                for i in ids:
+                    if i not in found and (within is None or i in within):
+                        found[i] = 4
+        return found
+
+    @instrument()
+    def fuzzy(self, query, exclude=()):
+        """
+        Effects sharing enough trigrams with query, for queries with typos
+
+        :return: effect id: similarity, from fuzzy_threshold to 1
+        """
+        q = sslc(query)
+        grams = _word_trigrams(q)
+        if not grams:
+            return {}
+        shared = {}
+        postings = self._trigrams
+        for gram in grams:
+            for i in postings.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        counts = self._trigram_counts
+        found = {}
+        for i, n in shared.items():
+            if i in exclude:
+                continue
+            score = 2 * n / (len(grams) + counts[i])
+            if score >= fuzzy_threshold:
+                found[i] = score
+        return found
+
+    def rank(self, exact, fuzzy=None, limit=None):
+        """
+        Order matches best first
+
+        :param exact: effect id: tier, from prefix or matches
+        :param fuzzy: effect id: similarity, from fuzzy
+        :return: effect names
+        """
+        # Sort plain ints: tier, then place in the tie-break order
+        size, place = len(self._keys), self._place
+        codes = [tier * size + place[i] for i, tier in exact.items()]
+        codes = sorted(codes) if limit is None or limit >= len(codes) else nsmallest(limit, codes)
+        by_place, names = self._by_place, self.names
+        found = [names[by_place[code % size]] for code in codes]
+        if fuzzy and (limit is None or len(found) < limit):
+            ordered = sorted(fuzzy, key=lambda i: (-fuzzy[i], place[i]))
+            found += [names[i] for i in ordered[:None if limit is None else limit - len(found)]]
+        return found
+
+    @instrument()
+    def search(self, query, limit=None):
+        """
+        Effect names matching query, best first
+
+        :param query: text typed by the user
+        :param limit: most names to return, default all of them
+        """
+        if not sslc(query):
+            # Every name is a prefix match of nothing, but an empty query matches none
+            return []
+        if limit is not None:
+            # Enough prefix matches make the substring and fuzzy passes unnecessary
+            found = self.prefix(query)
+            if len(found) >= limit:
+                return self.rank(found, limit=limit)
+        exact = self.matches(query)
+        fuzzy = self.fuzzy(query, exact) if len(exact) < fuzzy_below else None
+        return self.rank(exact, fuzzy, limit)
+
+
+class SearchSession:
+    """
+    Search as the user types: when the query extends the previous one, only
+    the previous exact matches are checked again instead of the whole index
+    """
+    def __init__(self, index):
+        self.index = index
+        self.query = ""
+        self._exact = {}
+
+    @instrument()
+    def update(self, query, limit=None):
+        """
+        :return: effect names matching query, best first, see SearchIndex.search
+        """
+        q = sslc(query)
+        if self.query and q.startswith(self.query):
+            exact = self.index.matches(q, within=self._exact)
+        else:
+            exact = self.index.matches(q)
+        self.query, self._exact = q, exact
+        fuzzy = self.index.fuzzy(q, exact) if q and len(exact) < fuzzy_below else None
+        return self.index.rank(exact, fuzzy, limit)
+
+
+if __name__ == "__main__":
+    # Query timings: python -m tool.obsm_search [query ...]
+    import sys
+    import time
+    from tool.obsm_calculator import sources
+    from tool.obsm_catalog import shared_catalog
+    start = time.perf_counter()
+    index = SearchIndex(shared_catalog(sources))
+    print(f"Indexed {len(index)} effects in {(time.perf_counter() - start) * 1e3:.1f} ms")
+    for query in sys.argv[1:] or ["fort", "fortify sk", "restoration", "shld", "paralize"]:
+        start = time.perf_counter()
+        found = index.search(query)
+        print(f"{query!r}: {len(found)} in {(time.perf_counter() - start) * 1e6:.0f} µs, {found[:5]}")
@@ -0,0 +1,427 @@
+"""
+Local HTTP/JSON spell pricing service, standard library asyncio only.
+
+    python -m tool.obsm_server --port 8765
+
+GET  /effects                  effect names, ?school=... or ?function=... to filter
+GET  /effects/<name>           one effect's catalog entry
+POST /price                    {"effects": [...], "skills": {...}}
+POST /batch                    {"spells": [{"effects": [...], "skills": {...}}, ...]}
+POST /fit                      {"effects": [...], "objective": "mag", "max_cost": 100, ...}
+GET  /stats                    request counts, p50/p99 latency and throughput
+
+Effects are {"name", "details", "mag", "dur", "area", "range"}. Concurrent
+/price requests are priced together in one vectorized batch.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from logging import getLogger
+from urllib.parse import parse_qs, unquote, urlsplit
+import asyncio
+import json
+import logging
+import time
+import numpy as np
+from tool.obsm_batch import price_batch
+from tool.obsm_calculator import calc_casting_cost, def_int, def_string, sources
+from tool.obsm_catalog import shared_catalog
+from tool.obsm_optimizer import optimize_spell
+logger = getLogger(__name__)
+
+skill_schools = ["Alteration", "Conjuration", "Destruction", "Illusion", "Mysticism", "Restoration"]
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+max_body = 16 * 1024 * 1024
+# /fit runs an exact search that grows with every effect, so cap both its size and its time
+max_fit_effects = 8
+fit_timeout = 10.0
+
+
+class RequestError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Metrics:
+    """
+    Request counters and recent latencies per route
+    """
+
+    def __init__(self, window=10000):
+        self.started = time.perf_counter()
+        self.window = window
+        self.requests = {}
+        self.errors = {}
+        self.latencies = {}
+        self.batches = 0
+        self.batched_spells = 0
+
+    def record(self, route, seconds, ok):
+        self.requests[route] = self.requests.get(route, 0) + 1
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        if route not in self.latencies:
+            self.latencies[route] = deque(maxlen=self.window)
+        self.latencies[route].append(seconds)
+
+    def snapshot(self):
+        uptime = time.perf_counter() - self.started
+        routes = {}
+        for route, count in self.requests.items():
+            lat = np.array(self.latencies[route]) * 1000
+            routes[route] = {"requests": count,
+                             "errors": self.errors.get(route, 0),
+                             "p50_ms": round(float(np.percentile(lat, 50)), 3),
+                             "p99_ms": round(float(np.percentile(lat, 99)), 3)}
+        total = sum(self.requests.values())
+        return {"uptime_s": round(uptime, 3),
+                "requests": total,
+                "requests_per_s": round(total / uptime, 1) if uptime else 0.0,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_spells / self.batches, 2) if self.batches else 0.0,
+                "routes": routes}
+
+
+def _parse_effects(catalog, effects):
+    """
+    Check effect dicts against the catalog and fill in defaults
+    """
+    if not isinstance(effects, list) or not effects:
+        raise RequestError("effects must be a non-empty list")
+    out = []
+    for eff in effects:
+        if isinstance(eff, str):
+            eff = {"name": eff}
+        if not isinstance(eff, dict):
+            raise RequestError("each effect must be an object or a name")
+        name = eff.get("name", eff.get("effect"))
+        rec = catalog.get(name) if isinstance(name, str) else None
+        if rec is None:
+            raise RequestError(f"unknown effect {name!r}")
+        try:
+            out.append({"name": rec.name,
+                        "details": eff.get("details", def_string),
+                        "mag": int(eff.get("mag", def_int)),
+                        "dur": int(eff.get("dur", def_int)),
+                        "area": int(eff.get("area", def_int)),
+                        "range": eff.get("range", def_string),
+                        "school": rec.get("School", def_string)})
+        except (TypeError, ValueError) as e:
+            raise RequestError(f"bad setting for {rec.name}: {e}")
+    return out
+
+
+def _content_length(headers):
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise RequestError(f"bad Content-Length {headers['content-length']!r}")
+    if length < 0:
+        raise RequestError(f"bad Content-Length {length}")
+    if length > max_body:
+        raise RequestError("request body too large", 413)
+    return length
+
+
+def _parse_skills(skills):
+    if skills is None:
+        return {}
+    if not isinstance(skills, dict):
+        raise RequestError("skills must be an object of school: level")
+    try:
+        return {k: float(v) for k, v in skills.items() if k in skill_schools}
+    except (TypeError, ValueError) as e:
+        raise RequestError(f"bad skill level: {e}")
+
+
+def price_many(catalog, spells):
+    """
+    Price parsed (effects, skills) spells in one price_batch call
+
+    :return: a result dict per spell, casting_cost is None unless its skills cover every school used
+    """
+    effs = [eff for effects, _ in spells for eff in effects]
+    offsets = np.cumsum([0] + [len(effects) for effects, _ in spells[:-1]])
+    # One skill level per spell for each school, covered says which spells have them all
+    skills = {school: np.array([sk.get(school, 0.0) for _, sk in spells]) for school in skill_schools}
+    covered = [all(eff["school"] in sk for eff in effects) for effects, sk in spells]
+    prices = price_batch(catalog,
+                         [eff["name"] for eff in effs],
+                         [eff["mag"] for eff in effs],
+                         [eff["dur"] for eff in effs],
+                         [eff["area"] for eff in effs],
+                         [eff["range"] for eff in effs],
+                         offsets=offsets, skills=skills)
+    eff_cost = prices.eff_cost.tolist()
+    results = []
+    for i, (effects, _) in enumerate(spells):
+        start = int(offsets[i])
+        skill = int(prices.skill_required[i])
+        results.append({"total_cost": float(prices.total_cost[i]),
+                        "gold_cost": int(prices.gold_cost[i]),
+                        "school": prices.school[i],
+                        "skill_required": skill if skill >= 0 else None,
+                        "casting_cost": float(prices.casting_cost[i]) if covered[i] else None,
+                        "effect_costs": eff_cost[start:start + len(effects)]})
+    return results
+
+
+def spell_result(spell, skills):
+    """
+    JSON-ready description of a Spell
+    """
+    school_cents = spell.school_cents
+    casting_cost = None
+    if all(school in skills for school in school_cents):
+        casting_cost = calc_casting_cost(school_cents, skills)
+    return {"total_cost": spell.total_cost,
+            "gold_cost": spell.gold_cost,
+            "school": spell.dominant_school,
+            "skill_required": spell.skill_required,
+            "casting_cost": casting_cost,
+            "effects": [{"name": eff.name, "details": eff.details, "mag": eff.mag, "dur": eff.dur,
+                         "area": eff.area, "range": eff.range, "cost": eff.eff_cost}
+                        for eff in spell.effects]}
+
+
+class Coalescer:
+    """
+    Collects the spells of concurrent requests and prices them in one batch.
+
+    The first spell to arrive opens a batch, which then waits window seconds
+    for more (unless max_batch spells are already queued) before pricing.
+    """
+
+    def __init__(self, catalog, metrics, window=0.002, max_batch=512):
+        self.catalog = catalog
+        self.metrics = metrics
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def price(self, effects, skills):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((effects, skills, fut))
+        return await fut
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch - 1:
+                # Let the requests already in flight join this batch
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.metrics.batches += 1
+            self.metrics.batched_spells += len(batch)
+            try:
+                results = price_many(self.catalog, [(effects, skills) for effects, skills, _ in batch])
+            except Exception as e:
+                logger.exception("Batch pricing failed")
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (*_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+
+class PricingServer:
+    """
+    Routes requests to the calculator over one shared catalog
+    """
+
+    def __init__(self, catalog=None, window=0.002, max_batch=512):
+        self.catalog = catalog if catalog is not None else shared_catalog(sources)
+        self.metrics = Metrics()
+        self.coalescer = Coalescer(self.catalog, self.metrics, window, max_batch)
+        # Searches run off the event loop so /price and /effects keep answering meanwhile
+        self.fit_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="obsm-fit")
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.coalescer.start()
+        self._server = await asyncio.start_server(self._handle_conn, host, port)
+        return self._server
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.coalescer.stop()
+        self.fit_pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def route(self, method, path, query, body):
+        if path == "/effects" or path.startswith("/effects/"):
+            if method != "GET":
+                raise RequestError("use GET", 405)
+            return self.effects(unquote(path[len("/effects/"):]) if path != "/effects" else None, query)
+        if path == "/stats":
+            return self.metrics.snapshot()
+        handlers = {"/price": self.price, "/batch": self.batch, "/fit": self.fit}
+        if path not in handlers:
+            raise RequestError(f"no route {path}", 404)
+        if method != "POST":
+            raise RequestError("use POST", 405)
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError as e:
+            raise RequestError(f"invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise RequestError("body must be a JSON object")
+        return await handlers[path](data)
+
+    def effects(self, name, query):
+        if name:
+            rec = self.catalog.get(name)
+            if rec is None:
+                raise RequestError(f"unknown effect {name!r}", 404)
+            return rec._asdict()
+        if "school" in query:
+            return list(self.catalog.by_school.get(query["school"][0], ()))
+        if "function" in query:
+            return list(self.catalog.by_function.get(query["function"][0], ()))
+        return self.catalog.names
+
+    async def price(self, data):
+        effects = _parse_effects(self.catalog, data.get("effects"))
+        return await self.coalescer.price(effects, _parse_skills(data.get("skills")))
+
+    async def batch(self, data):
+        spells = data.get("spells")
+        if not isinstance(spells, list):
+            raise RequestError("spells must be a list")
+        parsed = []
+        for sp in spells:
+            if not isinstance(sp, dict):
+                raise RequestError("each spell must be an object")
+            parsed.append((_parse_effects(self.catalog, sp.get("effects")), _parse_skills(sp.get("skills"))))
+        if not parsed:
+            return []
+        self.metrics.batches += 1
+        self.metrics.batched_spells += len(parsed)
+        return price_many(self.catalog, parsed)
+
+    async def fit(self, data):
+        effects = data.get("effects")
+        if not isinstance(effects, list) or not effects:
+            raise RequestError("effects must be a non-empty list")
+        if len(effects) > max_fit_effects:
+            raise RequestError(f"at most {max_fit_effects} effects can be fitted at once")
+        for eff in effects:
+            name = eff if isinstance(eff, str) else eff.get("name") if isinstance(eff, dict) else None
+            if not isinstance(name, str) or name not in self.catalog:
+                raise RequestError(f"unknown effect {name!r}")
+        skills = _parse_skills(data.get("skills"))
+        kwargs = {k: data[k] for k in ("objective", "max_cost", "max_gold", "skill", "max_casting_cost")
+                  if data.get(k) is not None}
+        loop = asyncio.get_running_loop()
+        search = loop.run_in_executor(self.fit_pool, partial(optimize_spell, self.catalog, effects,
+                                                             skills=skills, **kwargs))
+        try:
+            spell = await asyncio.wait_for(search, fit_timeout)
+        except asyncio.TimeoutError:
+            raise RequestError(f"fit query took longer than {fit_timeout:g}s", 503)
+        except (KeyError, TypeError, ValueError) as e:
+            raise RequestError(f"bad fit query: {e}")
+        return spell_result(spell, skills) if spell else None
+
+    async def _handle_conn(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = h.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close" and
+                              version.upper() == "HTTP/1.1")
+                url = urlsplit(target)
+                path = url.path.rstrip("/") or "/"
+                # Latencies are kept per endpoint, /effects/<name> counts as /effects
+                route = path.split("/")[1] or "/"
+                try:
+                    length = _content_length(headers)
+                except RequestError as e:
+                    # The body is left unread, so it can't be told apart from a next request
+                    status, payload = e.status, {"error": str(e)}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        result = await self.route(method.upper(), path, parse_qs(url.query), body)
+                        status, payload = 200, {"result": result}
+                    except RequestError as e:
+                        status, payload = e.status, {"error": str(e)}
+                    except Exception as e:
+                        logger.exception(f"Error handling {method} {target}")
+                        status, payload = 500, {"error": str(e)}
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                self.metrics.record(route, time.perf_counter() - start, status == 200)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=8765, window=0.002, max_batch=512):
+    server = PricingServer(window=window, max_batch=max_batch)
+    srv = await server.start(host, port)
+    logger.info(f"Serving on http://{host}:{server.port}")
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Spell pricing HTTP/JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--window", type=float, default=0.002,
+                        help="seconds a /price batch waits for more requests")
+    parser.add_argument("--max-batch", type=int, default=512)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.window, args.max_batch))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,433 @@
+"""
+Spellbook: designed spells saved in an SQLite database.
+
+Each spell is stored by name with its effects in order and the figures
+worked out when it was saved: school, total cost (in cents, like Spell keeps
+it), gold cost, skill requirement and its cost per school. Those columns are
+indexed, as are effect names, so queries don't have to rebuild any Spell.
+A spell is only rebuilt, from the catalog, when it is loaded.
+
+    python -m tool.obsm_spellbook book.db import spells.jsonl
+    python -m tool.obsm_spellbook book.db query --school Destruction --max-casting 80 --skill 45
+    python -m tool.obsm_spellbook book.db export > spells.jsonl
+
+Import and export use the spell rows of obsm_cli, so an exported book can be
+priced by it and anything it prices can be imported.
+"""
+from itertools import islice
+from logging import getLogger
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from tool.obsm_calculator import Effect, Spell, calc_casting_cost, casting_multiplier, sources
+from tool.obsm_catalog import shared_catalog
+from tool.obsm_profile import instrument
+logger = getLogger(__name__)
+
+# Where the GUI keeps its spellbook unless OBSM_SPELLBOOK says otherwise
+default_path = os.environ.get("OBSM_SPELLBOOK") or os.path.join(os.path.expanduser("~"), "obsm_spellbook.db")
+# Spells written per executemany during an import
+import_batch = 1000
+
+schema = """
+CREATE TABLE IF NOT EXISTS spells (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    school TEXT NOT NULL,
+    total_cents INTEGER NOT NULL,
+    gold_cost INTEGER NOT NULL,
+    skill_required INTEGER,
+    effect_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spell_schools (
+    spell_id INTEGER NOT NULL REFERENCES spells (id) ON DELETE CASCADE,
+    school TEXT NOT NULL,
+    cents INTEGER NOT NULL,
+    PRIMARY KEY (spell_id, school)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS effects (
+    spell_id INTEGER NOT NULL REFERENCES spells (id) ON DELETE CASCADE,
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    details TEXT NOT NULL,
+    mag INTEGER NOT NULL,
+    dur INTEGER NOT NULL,
+    area INTEGER NOT NULL,
+    range TEXT NOT NULL,
+    cents INTEGER NOT NULL,
+    PRIMARY KEY (spell_id, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS spells_school ON spells (school, total_cents);
+CREATE INDEX IF NOT EXISTS spells_total ON spells (total_cents);
+CREATE INDEX IF NOT EXISTS spells_gold ON spells (gold_cost);
+CREATE INDEX IF NOT EXISTS spells_skill ON spells (skill_required, total_cents);
+CREATE INDEX IF NOT EXISTS effects_name ON effects (name COLLATE NOCASE, spell_id);
+"""
+
+_summary_columns = "s.id, s.name, s.school, s.total_cents, s.gold_cost, s.skill_required, s.effect_count"
+order_columns = {"total_cost": "s.total_cents", "gold_cost": "s.gold_cost",
+                 "skill_required": "s.skill_required", "name": "s.name"}
+
+
+def _summary(row):
+    spell_id, name, school, cents, gold, skill, count = row
+    return {"name": name, "school": school, "total_cost": cents / 100, "gold_cost": gold,
+            "skill_required": skill, "effects": count}
+
+
+def _spell_rows(spell):
+    """
+    The spells, spell_schools and effects values of a spell, without its id
+    """
+    effects = [(i, eff.name, eff.details, eff.mag, eff.dur, eff.area, eff.range, round(eff.eff_cost * 100))
+               for i, eff in enumerate(spell.effects)]
+    head = (spell.dominant_school, spell.total_cents, spell.gold_cost, spell.skill_required, len(effects))
+    return head, list(spell.school_cents.items()), effects
+
+
+def _check_line(item):
+    # An import is all or nothing, so a bad input line fails the whole of it
+    from tool.obsm_cli import BadLine
+    if isinstance(item, BadLine):
+        raise ValueError(f"line {item.line}: {item.error}")
+    return item
+
+
+class Spellbook:
+    """
+    Named spells in an SQLite database, opened for the lifetime of the object.
+    Like an sqlite3 connection, a Spellbook belongs to the thread that opened it.
+    """
+    def __init__(self, path=":memory:"):
+        """
+        :param path: database file, created if missing, default an in-memory book
+        """
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = NORMAL")
+        with self._db:
+            self._db.executescript(schema)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT count(*) FROM spells").fetchone()[0]
+
+    def __contains__(self, name):
+        return self._db.execute("SELECT 1 FROM spells WHERE name = ?", (name,)).fetchone() is not None
+
+    def names(self):
+        """
+        Names of the saved spells, alphabetically
+        """
+        return [name for name, in self._db.execute("SELECT name FROM spells ORDER BY name")]
+
+    def _write(self, items, replace):
+        """
+        Insert (name, Spell) pairs, in the caller's transaction
+
+        :return: number of spells written
+        """
+        db = self._db
+        count = 0
+        items = iter(items)
+        while batch := list(islice(items, import_batch)):
+            names = [name for name, _ in batch]
+            if replace and len(set(names)) != len(names):
+                # Later copies of a name win, as if saved one after the other
+                batch = list({name: spell for name, spell in batch}.items())
+                names = [name for name, _ in batch]
+            if replace:
+                db.executemany("DELETE FROM spells WHERE name = ?", [(name,) for name in names])
+            rows = [(name, *_spell_rows(spell)) for name, spell in batch]
+            # Ids are handed out here so the effect rows can refer to them
+            first = db.execute("SELECT coalesce(max(id), 0) + 1 FROM spells").fetchone()[0]
+            ids = range(first, first + len(rows))
+            db.executemany("INSERT INTO spells VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [(spell_id, name, *head) for spell_id, (name, head, _, _) in zip(ids, rows)])
+            db.executemany("INSERT INTO spell_schools VALUES (?, ?, ?)",
+                           [(spell_id, school, cents)
+                            for spell_id, (_, _, schools, _) in zip(ids, rows) for school, cents in schools])
+            db.executemany("INSERT INTO effects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(spell_id, *eff) for spell_id, (_, _, _, effects) in zip(ids, rows) for eff in effects])
+            count += len(batch)
+        return count
+
+    @instrument()
+    def save(self, name, spell):
+        """
+        Save a spell under name, replacing any spell saved with that name
+        """
+        if not name:
+            raise ValueError("spell name is empty")
+        with self._db:
+            self._write([(name, spell)], replace=True)
+
+    @instrument()
+    def import_spells(self, items, replace=True):
+        """
+        Save many spells in one transaction: either all of them are saved or,
+        if anything fails, none are
+
+        :param items: iterable of (name, Spell)
+        :param replace: overwrite spells with the same name, else a name clash
+            raises sqlite3.IntegrityError
+        :return: number of spells saved
+        """
+        with self._db:
+            return self._write(items, replace)
+
+    @instrument()
+    def import_rows(self, rows, catalog=None, replace=True):
+        """
+        Save spells given as obsm_cli input rows, in one transaction.
+        Spells without a name are named after their place in the input.
+
+        :param rows: dicts as read by obsm_cli.read_rows
+        :param catalog: EffectCatalog the effects are looked up in, default the shared one
+        :return: number of spells saved
+        """
+        from tool.obsm_cli import group_spells, spell_from_rows
+        catalog = catalog if catalog is not None else shared_catalog(sources)
+        return self.import_spells(((str(spell_id), spell_from_rows(catalog, effect_rows))
+                                   for spell_id, effect_rows, _ in map(_check_line, group_spells(rows))),
+                                  replace)
+
+    @instrument()
+    def load(self, name, catalog=None):
+        """
+        Rebuild a saved spell from the catalog, in one indexed fetch. Effects
+        the catalog no longer has are left out with a warning.
+
+        :param catalog: EffectCatalog, default the shared one
+        :return: Spell, or None if no spell has that name
+        """
+        rows = self._db.execute("SELECT e.name, e.details, e.mag, e.dur, e.area, e.range "
+                                "FROM spells s JOIN effects e ON e.spell_id = s.id "
+                                "WHERE s.name = ? ORDER BY e.pos", (name,)).fetchall()
+        if not rows:
+            return None if name not in self else Spell()
+        catalog = catalog if catalog is not None else shared_catalog(sources)
+        effs = []
+        for eff_name, details, mag, dur, area, rng in rows:
+            rec = catalog.get(eff_name)
+            if rec is None:
+                logger.warning("Effect [%s] of saved spell [%s] is not in the catalog", eff_name, name)
+                continue
+            effs.append(Effect(data=rec, details=details, mag=mag, dur=dur, area=area, range=rng))
+        return Spell(*effs)
+
+    def delete(self, name):
+        """
+        :return: whether a spell was deleted
+        """
+        with self._db:
+            return self._db.execute("DELETE FROM spells WHERE name = ?", (name,)).rowcount > 0
+
+    @instrument()
+    def export_rows(self, names=None):
+        """
+        Yield saved spells as whole-spell obsm_cli rows,
+        {"spell": name, "effects": [{"effect", "details", "mag", "dur", "area", "range"}]},
+        streamed in the order they were saved
+
+        :param names: only these spells, default all of them
+        """
+        query = ("SELECT s.id, s.name, e.name, e.details, e.mag, e.dur, e.area, e.range "
+                 "FROM spells s JOIN effects e ON e.spell_id = s.id")
+        if names is None:
+            cur = self._db.execute(query + " ORDER BY s.id, e.pos")
+        else:
+            names = list(names)
+            cur = self._db.execute(query + f" WHERE s.name IN ({', '.join('?' * len(names))})"
+                                   " ORDER BY s.id, e.pos", names)
+        current, spell = None, None
+        for spell_id, name, eff_name, details, mag, dur, area, rng in cur:
+            if spell_id != current:
+                if spell is not None:
+                    yield spell
+                current, spell = spell_id, {"spell": name, "effects": []}
+            spell["effects"].append({"effect": eff_name, "details": details, "mag": mag,
+                                     "dur": dur, "area": area, "range": rng})
+        if spell is not None:
+            yield spell
+
+    @instrument()
+    def query(self, school=None, min_cost=None, max_cost=None, max_gold=None, max_skill=None,
+              effect=None, order_by="total_cost", limit=None):
+        """
+        Saved spells matching every filter given
+
+        :param school: the spell's school
+        :param min_cost: least total (unmodified) magicka cost
+        :param max_cost: greatest total magicka cost
+        :param max_gold: greatest gold cost
+        :param max_skill: greatest skill requirement
+        :param effect: name of an effect the spell has, ignoring case
+        :param order_by: one of order_columns
+        :param limit: most spells to return
+        :return: list of {"name", "school", "total_cost", "gold_cost", "skill_required", "effects"}
+        """
+        if order_by not in order_columns:
+            raise ValueError(f"cannot order by {order_by!r}, expected one of {', '.join(order_columns)}")
+        where, params = [], []
+        if school is not None:
+            where.append("s.school = ?")
+            params.append(school)
+        if min_cost is not None:
+            where.append("s.total_cents >= ?")
+            params.append(round(min_cost * 100))
+        if max_cost is not None:
+            where.append("s.total_cents <= ?")
+            params.append(round(max_cost * 100))
+        if max_gold is not None:
+            where.append("s.gold_cost <= ?")
+            params.append(max_gold)
+        if max_skill is not None:
+            where.append("s.skill_required <= ?")
+            params.append(max_skill)
+        if effect is not None:
+            where.append("s.id IN (SELECT spell_id FROM effects WHERE name = ? COLLATE NOCASE)")
+            params.append(effect.strip())
+        sql = f"SELECT {_summary_columns} FROM spells s"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_columns[order_by]}, s.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [_summary(row) for row in self._db.execute(sql, params)]
+
+    @instrument()
+    def castable(self, skills, max_casting=None, school=None, limit=None):
+        """
+        Saved spells a caster can make (their school's skill meets the spell's
+        requirement) and, with max_casting, cast for at most that much magicka.
+        Cheapest to cast first.
+
+        :param skills: dict of school: skill level, or one level for every school;
+            spells using a school missing from the dict are left out
+        :param max_casting: greatest skill-modified casting cost
+        :param school: only spells of this school
+        :param limit: most spells to return
+        :return: list of query summaries with "casting_cost" added
+        """
+        if isinstance(skills, dict):
+            levels = skills
+            best = max(skills.values(), default=None)
+        else:
+            levels = None
+            best = skills
+        candidates = [school] if school is not None else (list(levels) if levels is not None else None)
+        if best is None or candidates == []:
+            return []
+        where, params = ["s.skill_required <= ?"], []
+        if max_casting is not None:
+            # No school is cheaper to cast than at the highest skill, so this
+            # bound is safe; the exact cost is checked below. One cent of slack
+            # covers float rounding.
+            where.append("s.total_cents <= ?")
+            params.append(int(max_casting * 100 / casting_multiplier(best)) + 1)
+        sql = (f"SELECT {_summary_columns}, ss.school, ss.cents FROM spells s "
+               f"JOIN spell_schools ss ON ss.spell_id = s.id WHERE s.school = ? AND " + " AND ".join(where))
+        found = []
+        for spell_school in candidates if candidates is not None else self._schools():
+            level = levels.get(spell_school) if levels is not None else skills
+            if level is None:
+                continue
+            # A spell's school rows come out together, one spell after another
+            current, head, school_cents = None, None, {}
+            for row in self._db.execute(sql, (spell_school, level, *params)):
+                if row[0] != current:
+                    if head is not None:
+                        self._check_castable(head, school_cents, levels, skills, max_casting, found)
+                    current, head, school_cents = row[0], row[:7], {}
+                school_cents[row[7]] = row[8]
+            if head is not None:
+                self._check_castable(head, school_cents, levels, skills, max_casting, found)
+        found.sort(key=lambda s: (s["casting_cost"], s["name"]))
+        return found[:limit]
+
+    @staticmethod
+    def _check_castable(head, school_cents, levels, skills, max_casting, found):
+        if levels is None:
+            levels = dict.fromkeys(school_cents, skills)
+        elif any(school not in levels for school in school_cents):
+            return
+        casting = calc_casting_cost(school_cents, levels) if school_cents else 0
+        if max_casting is None or casting <= max_casting:
+            summary = _summary(head)
+            summary["casting_cost"] = casting
+            found.append(summary)
+
+    def _schools(self):
+        return [school for school, in self._db.execute("SELECT DISTINCT school FROM spells")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tool.obsm_spellbook", description="Saved spell library")
+    parser.add_argument("book", help="spellbook database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    imp = commands.add_parser("import", help="save spells from obsm_cli input rows")
+    imp.add_argument("input", nargs="?", help="CSV or JSONL file, default stdin")
+    imp.add_argument("--format", choices=["csv", "jsonl"], help="default from the file extension, else jsonl")
+    imp.add_argument("--keep", action="store_true", help="fail on a name clash instead of replacing")
+    exp = commands.add_parser("export", help="write spells as JSONL obsm_cli rows to stdout")
+    exp.add_argument("names", nargs="*", help="default all of them")
+    qry = commands.add_parser("query", help="list saved spells as JSONL")
+    qry.add_argument("--school")
+    qry.add_argument("--min-cost", type=float)
+    qry.add_argument("--max-cost", type=float)
+    qry.add_argument("--max-gold", type=int)
+    qry.add_argument("--max-skill", type=int, help="greatest skill requirement")
+    qry.add_argument("--effect")
+    qry.add_argument("--skill", type=float, help="spells castable at this skill level in every school, "
+                                                 "cheapest to cast first")
+    qry.add_argument("--max-casting", type=float, help="with --skill, greatest skill-modified casting cost")
+    qry.add_argument("--order-by", choices=list(order_columns), default="total_cost")
+    qry.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    with Spellbook(args.book) as book:
+        if args.command == "import":
+            from tool.obsm_cli import read_rows
+            fmt = args.format or ("csv" if (args.input or "").lower().endswith(".csv") else "jsonl")
+            f = open(args.input, newline="") if args.input else sys.stdin
+            try:
+                count = book.import_rows(read_rows(f, fmt), replace=not args.keep)
+            finally:
+                if f is not sys.stdin:
+                    f.close()
+            print(f"Saved {count} spells to {args.book}", file=sys.stderr)
+        elif args.command == "export":
+            for row in book.export_rows(args.names or None):
+                sys.stdout.write(json.dumps(row) + "\n")
+        elif args.skill is not None:
+            if any(value is not None for value in (args.min_cost, args.max_cost, args.max_gold,
+                                                   args.max_skill, args.effect)):
+                parser.error("--skill only combines with --school, --max-casting and --limit")
+            for spell in book.castable(args.skill, args.max_casting, args.school, args.limit):
+                sys.stdout.write(json.dumps(spell) + "\n")
+        else:
+            if args.max_casting is not None:
+                parser.error("--max-casting needs --skill")
+            for spell in book.query(args.school, args.min_cost, args.max_cost, args.max_gold, args.max_skill,
+                                    args.effect, args.order_by, args.limit):
+                sys.stdout.write(json.dumps(spell) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
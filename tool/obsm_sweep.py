@@ -0,0 +1,327 @@
+from collections import deque, namedtuple
+from logging import getLogger
+import numpy as np
+from tool.obsm_batch import mag_factor, round2
+from tool.obsm_calculator import Effect, Spell, casting_multiplier, def_string, skill_reqs
+from tool.obsm_optimizer import objectives, param_values, slider_ranges
+logger = getLogger(__name__)
+
+# One spell picked out by a sweep, settings is (mag, dur, area) per effect
+SweepHit = namedtuple("SweepHit", ["total_cost", "score", "index", "settings"])
+
+# Largest space whose spell indexes still fit in an int64
+max_space = 2 ** 62
+
+_skill_levels = np.array(list(skill_reqs.keys()), dtype=np.int64)
+_skill_thresholds = np.array(list(skill_reqs.values()), dtype=np.float64)
+_space = None
+
+
+class SweepSpace:
+    """
+    Every combination of settings for a list of effects, each over its own
+    mag × dur × area grid.
+
+    Spells are numbered 0..size-1 in row-major order over the effects' grids.
+    Each effect's cost is computed once per grid point up front, so pricing a
+    spell is a few table lookups and the space is all a worker needs.
+    """
+
+    def __init__(self, catalog, effects, objective="mag", skills=None, ranges=None):
+        """
+        :param catalog: EffectCatalog to look effects up in
+        :param effects: effect names, or dicts with "name" and optionally "details",
+                        "range" (default "Self") and "mag"/"dur"/"area" set to a
+                        fixed value or a list of values to sweep instead of the slider range
+        :param objective: "mag", "dur", "area" or a dict of weights, used to score spells
+        :param skills: dict of school: skill level, casting cost is only swept when
+                       it covers every school used
+        :param ranges: override for slider_ranges
+        """
+        if not effects:
+            raise ValueError("a sweep needs at least one effect")
+        self.weights = objectives[objective] if isinstance(objective, str) else dict(objective)
+        self.specs = [{"name": eff} if isinstance(eff, str) else dict(eff) for eff in effects]
+        self.recs = []
+        for spec in self.specs:
+            rec = catalog.get(spec["name"])
+            if rec is None:
+                raise ValueError(f"Effect [{spec['name']}] not found")
+            self.recs.append(rec)
+        ranges = ranges or slider_ranges
+        self.grids = []
+        self.cents = []
+        self.scores = []
+        for rec, spec in zip(self.recs, self.specs):
+            mags, durs, areas = (self._values(rec, spec, p, ranges) for p in ("mag", "dur", "area"))
+            self.grids.append((mags, durs, areas))
+            target = 1.5 if spec.get("range", "Self") == "Target" else 1
+            # Same operations in the same order as calc_eff_cost
+            cost = round2(rec.get("Base Cost", 0) / 10.0 *
+                          mag_factor(mags)[:, None, None] *
+                          np.maximum(durs, 1)[None, :, None] *
+                          np.maximum(areas * 0.15, 1)[None, None, :] *
+                          target).ravel()
+            self.cents.append(np.rint(cost * 100).astype(np.int64))
+            self.scores.append((self.weights.get("mag", 0) * mags[:, None, None] +
+                                self.weights.get("dur", 0) * durs[None, :, None] +
+                                self.weights.get("area", 0) * areas[None, None, :]).ravel()
+                               .astype(np.float64))
+        self.shape = tuple(len(c) for c in self.cents)
+        size = 1
+        for n in self.shape:
+            size *= n
+        if size > max_space:
+            raise ValueError(f"Sweep of {size} spells is too large, narrow the ranges")
+        self.size = size
+
+        # Schools the effects belong to, coded in name order as calc_casting_cost sums them
+        eff_schools = [rec.get("School", def_string) for rec in self.recs]
+        self.schools = tuple(sorted(set(eff_schools)))
+        self.school_codes = np.array([self.schools.index(s) for s in eff_schools], dtype=np.int64)
+        self.skills = dict(skills or {})
+        if all(s in self.skills for s in self.schools):
+            self.multipliers = tuple(casting_multiplier(self.skills[s]) for s in self.schools)
+        else:
+            self.multipliers = None
+
+    @staticmethod
+    def _values(rec, spec, param, ranges):
+        value = spec.get(param)
+        if isinstance(value, (list, tuple, np.ndarray)) and (param != "mag" or rec.has_mag):
+            return np.asarray(value)
+        return param_values(rec, spec, param, ranges)
+
+    def settings(self, index):
+        """
+        (mag, dur, area) of each effect for a spell index
+        """
+        out = []
+        for grid, g in zip(self.grids, np.unravel_index(index, self.shape)):
+            mi, di, ai = np.unravel_index(int(g), tuple(len(v) for v in grid))
+            out.append((grid[0][mi].item(), grid[1][di].item(), grid[2][ai].item()))
+        return tuple(out)
+
+    def spell(self, index):
+        """
+        Build the Spell for a spell index
+        """
+        return Spell(*[Effect(data=rec,
+                              details=spec.get("details", def_string),
+                              mag=mag, dur=dur, area=area,
+                              range=spec.get("range", "Self"))
+                       for rec, spec, (mag, dur, area) in zip(self.recs, self.specs,
+                                                                self.settings(index))])
+
+
+class SweepStats:
+    """
+    Running aggregates over the spells swept so far. Stats of separate chunks
+    merge into the same result whatever the chunking.
+    """
+
+    def __init__(self, k=10, bin_width=10):
+        self.k = k
+        self.bin_width = bin_width
+        self.count = 0
+        self.total_cents = 0
+        self.min_cost = None
+        self.max_cost = None
+        # Lower edge of a bin of total cost: spells in it
+        self.histogram = {}
+        # Skill level required: spells, None for spells beyond every tier
+        self.tiers = {}
+        # Dominant school: spells
+        self.schools = {}
+        self.casting_sum = 0.0
+        self.min_casting = None
+        self.max_casting = None
+        # (cents, index) and (-score, cents, index), best first
+        self._cheapest = []
+        self._strongest = []
+
+    @property
+    def mean_cost(self):
+        return self.total_cents / 100 / self.count if self.count else None
+
+    @property
+    def mean_casting(self):
+        return self.casting_sum / self.count if self.count and self.min_casting is not None else None
+
+    def cheapest(self, space):
+        return [SweepHit(c / 100, None, i, space.settings(i)) for c, i in self._cheapest]
+
+    def strongest(self, space):
+        return [SweepHit(c / 100, -s, i, space.settings(i)) for s, c, i in self._strongest]
+
+    def merge(self, other):
+        """
+        Add the stats of another chunk into these
+        """
+        self.count += other.count
+        self.total_cents += other.total_cents
+        self.min_cost = _opt(min, self.min_cost, other.min_cost)
+        self.max_cost = _opt(max, self.max_cost, other.max_cost)
+        for mine, theirs in ((self.histogram, other.histogram),
+                             (self.tiers, other.tiers),
+                             (self.schools, other.schools)):
+            for key, n in theirs.items():
+                mine[key] = mine.get(key, 0) + n
+        self.casting_sum += other.casting_sum
+        self.min_casting = _opt(min, self.min_casting, other.min_casting)
+        self.max_casting = _opt(max, self.max_casting, other.max_casting)
+        self._cheapest = sorted(self._cheapest + other._cheapest)[:self.k]
+        self._strongest = sorted(self._strongest + other._strongest)[:self.k]
+        return self
+
+
+def _opt(func, a, b):
+    return b if a is None else a if b is None else func(a, b)
+
+
+def _top(keys, k):
+    """
+    Positions of the k smallest rows of keys (last key is the primary one), ties in order
+    """
+    primary = keys[-1]
+    if len(primary) > k:
+        cut = np.partition(primary, k - 1)[k - 1]
+        cand = np.flatnonzero(primary <= cut)
+    else:
+        cand = np.arange(len(primary))
+    order = np.lexsort([key[cand] for key in keys])
+    return cand[order[:k]]
+
+
+def eval_chunk(space, start, stop, k=10, bin_width=10):
+    """
+    Price spells start..stop-1 of a space, matching Spell/SpellMaker exactly
+    """
+    stats = SweepStats(k, bin_width)
+    if stop <= start:
+        return stats
+    idx = np.arange(start, stop, dtype=np.int64)
+    grid_idx = np.unravel_index(idx, space.shape)
+    cents = np.stack([table[g] for table, g in zip(space.cents, grid_idx)])
+    score = sum(table[g] for table, g in zip(space.scores, grid_idx))
+    total_cents = cents.sum(axis=0)
+    total = total_cents / 100
+
+    stats.count = len(idx)
+    stats.total_cents = int(total_cents.sum())
+    stats.min_cost = float(total.min())
+    stats.max_cost = float(total.max())
+    bins, counts = np.unique(np.floor(total / bin_width).astype(np.int64), return_counts=True)
+    stats.histogram = {b * bin_width: n for b, n in zip(bins.tolist(), counts.tolist())}
+
+    tier = np.searchsorted(_skill_thresholds, total, side="right")
+    tiers, counts = np.unique(tier, return_counts=True)
+    stats.tiers = {(_skill_levels[t].item() if t < len(_skill_levels) else None): n
+                   for t, n in zip(tiers.tolist(), counts.tolist())}
+
+    # The first effect with the greatest cost sets the school, none if it's free
+    top = cents.argmax(axis=0)
+    school = np.where(cents.max(axis=0) > 0, space.school_codes[top], -1)
+    codes, counts = np.unique(school, return_counts=True)
+    stats.schools = {(space.schools[c] if c >= 0 else def_string): n
+                     for c, n in zip(codes.tolist(), counts.tolist())}
+
+    if space.multipliers is not None:
+        casting = np.zeros(len(idx))
+        for code, mult in enumerate(space.multipliers):
+            school_cents = cents[space.school_codes == code].sum(axis=0)
+            casting = casting + school_cents / 100 * mult
+        casting = round2(casting)
+        stats.casting_sum = float(casting.sum())
+        stats.min_casting = float(casting.min())
+        stats.max_casting = float(casting.max())
+
+    cheap = _top([idx, total_cents], k)
+    stats._cheapest = list(zip(total_cents[cheap].tolist(), idx[cheap].tolist()))
+    strong = _top([idx, total_cents, -score], k)
+    stats._strongest = list(zip((-score[strong]).tolist(), total_cents[strong].tolist(),
+                                idx[strong].tolist()))
+    return stats
+
+
+def _init_worker(space):
+    global _space
+    _space = space
+
+
+def _eval_in_worker(start, stop, k, bin_width):
+    return eval_chunk(_space, start, stop, k, bin_width)
+
+
+def iter_sweep(space, k=10, bin_width=10, workers=0, chunk_size=250_000):
+    """
+    Sweep a space chunk by chunk, yielding the running SweepStats after each
+    chunk. Only aggregates are kept, never the spells themselves.
+
+    :param space: SweepSpace to sweep
+    :param k: how many cheapest/strongest spells to keep
+    :param bin_width: width of the total cost histogram bins, in magicka
+    :param workers: worker processes, 0 sweeps in this process
+    :param chunk_size: spells priced per chunk
+    """
+    if chunk_size < 1 or k < 1 or bin_width <= 0:
+        raise ValueError("chunk_size and k must be at least 1 and bin_width positive")
+    bounds = ((start, min(start + chunk_size, space.size)) for start in range(0, space.size, chunk_size))
+    stats = SweepStats(k, bin_width)
+    if workers <= 0:
+        for start, stop in bounds:
+            yield stats.merge(eval_chunk(space, start, stop, k, bin_width))
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    # The space goes to each worker once, chunks are just index ranges
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(space,)) as pool:
+        pending = deque()
+        for start, stop in bounds:
+            pending.append(pool.submit(_eval_in_worker, start, stop, k, bin_width))
+            if len(pending) >= workers * 2:
+                # Merged in submission order so float sums come out the same every run
+                yield stats.merge(pending.popleft().result())
+        while pending:
+            yield stats.merge(pending.popleft().result())
+
+
+def run_sweep(space, k=10, bin_width=10, workers=0, chunk_size=250_000):
+    """
+    Sweep a whole space, see iter_sweep
+    """
+    stats = SweepStats(k, bin_width)
+    for stats in iter_sweep(space, k, bin_width, workers, chunk_size):
+        pass
+    return stats
+
+
+if __name__ == "__main__":
+    # Example: python -m tool.obsm_sweep "Fire Damage" "Frost Damage" --workers 4
+    import argparse
+    import time
+    from tool.obsm_calculator import sources
+    from tool.obsm_catalog import shared_catalog
+    parser = argparse.ArgumentParser(description="Sweep every setting of a few effects")
+    parser.add_argument("effects", nargs="+")
+    parser.add_argument("--range", default="Self", choices=["Self", "Touch", "Target"])
+    parser.add_argument("--step", type=int, nargs=3, default=None, metavar=("MAG", "DUR", "AREA"),
+                        help="slider steps, coarser steps shrink the space")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=250_000)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+    ranges = None
+    if args.step:
+        ranges = {p: (lo, hi, step) for (p, (lo, hi, _)), step in zip(slider_ranges.items(), args.step)}
+    space = SweepSpace(shared_catalog(sources), [{"name": e, "range": args.range} for e in args.effects],
+                       ranges=ranges)
+    print(f"{space.size} spells")
+    start = time.perf_counter()
+    result = run_sweep(space, k=args.k, workers=args.workers, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.2f} s, {space.size / elapsed:,.0f} spells/s")
+    print(f"cost {result.min_cost} .. {result.max_cost}, mean {result.mean_cost:.2f}")
+    print("skill tiers:", dict(sorted(result.tiers.items(), key=lambda kv: (kv[0] is None, kv[0]))))
+    print("schools:", result.schools)
+    print("cheapest:", *result.cheapest(space), sep="\n  ")
+    print("strongest:", *result.strongest(space), sep="\n  ")